@@ -0,0 +1,238 @@
+"""Latency percentiles and throughput of ADB operations against fake servers
+
+    python -m benchmarks.adb_ops [--runs 200] [--devices 4] [--adb-latency 0.002]
+        [--burp-latency 0.02] [--output results.json]
+        [--baseline baseline.json [--tolerance 0.25]] [--save-baseline baseline.json]
+        [--profile profiles/]
+
+Everything runs in-process against benchmarks.fake_adb (adb server) and
+benchmarks.fake_burp (Burp's /cert), both with injectable per-request
+latency. A stub adb binary on PATH counts fallbacks to the real binary,
+which should stay at zero. --profile writes one cProfile dump per
+operation (open with `python -m pstats profiles/list_devices.prof`).
+
+With --baseline, every operation's p50 and p90 are compared with the saved
+results and the run exits 1 if any is slower by more than --tolerance
+(a fraction, 0.25 = 25%) and by at least --min-delta-ms, so sub-millisecond
+jitter on cached operations doesn't count. Only compare results taken with
+the same options.
+"""
+import argparse
+import contextlib
+import cProfile
+import io
+import json
+import os
+import platform
+import shutil
+import socket
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.fake_adb import FakeADBServer, FakeDevice
+from benchmarks.fake_burp import FakeBurpServer
+
+STUB_ADB = """#!/bin/sh
+echo "$@" >> "{log}"
+exit 1
+"""
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(timings: list[float], wall: float) -> dict:
+    ordered = sorted(timings)
+    return {
+        "runs": len(timings),
+        "p50_ms": percentile(ordered, 0.50) * 1000,
+        "p90_ms": percentile(ordered, 0.90) * 1000,
+        "p99_ms": percentile(ordered, 0.99) * 1000,
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "max_ms": ordered[-1] * 1000,
+        "ops_per_s": len(timings) / wall if wall else 0.0,
+    }
+
+
+def measure(func, runs: int, warmup: int = 3) -> dict:
+    for _ in range(warmup):
+        func()
+    timings = []
+    start = time.perf_counter()
+    for _ in range(runs):
+        op_start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - op_start)
+    return summarize(timings, time.perf_counter() - start)
+
+
+def make_devices(count: int) -> dict[str, FakeDevice]:
+    devices = {}
+    for i in range(count):
+        device = FakeDevice(
+            props={
+                "ro.product.model": "Pixel 7",
+                "ro.product.manufacturer": "Google",
+                "ro.build.version.release": "14",
+                "ro.build.version.sdk": "34",
+                "ro.product.cpu.abi": "arm64-v8a",
+                "ro.serialno": f"emulator-{5554 + 2 * i}",
+                "ro.build.fingerprint": "google/panther/panther:14/UQ1A.240205.004/11269751:user/release-keys",
+            }
+        )
+        # Let the full install-cert flow succeed: no md5 match, then the Android 14 APEX strategy as root
+        device.on_shell(r"md5sum .*", lambda dev, m: (1, b"", b""))
+        device.on_shell(r"set -e; d=\S+; .*", lambda dev, m: (0, b"", b""))
+        devices[f"emulator-{5554 + 2 * i}"] = device
+    return devices
+
+
+def run(args) -> dict:
+    tmp = tempfile.mkdtemp(prefix="adb-ops-")
+    adb_log = os.path.join(tmp, "adb.log")
+    stub = os.path.join(tmp, "adb")
+    with open(stub, "w") as f:
+        f.write(STUB_ADB.format(log=adb_log))
+    os.chmod(stub, 0o755)
+    open(adb_log, "w").close()
+    os.environ["PATH"] = tmp + os.pathsep + os.environ.get("PATH", "")
+
+    # The client reads the server port at import time, so start the fake first
+    port = free_port()
+    os.environ["ANDROID_ADB_SERVER_PORT"] = str(port)
+    devices = make_devices(args.devices)
+    adb_server = FakeADBServer(devices, port=port, latency=args.adb_latency).start()
+    burp = FakeBurpServer(latency=args.burp_latency).start()
+
+    from system.adb import ADB
+
+    adb = ADB(tmp)
+    parser = argparse.ArgumentParser()
+    ADB.add_parser(adb, parser.add_subparsers(dest="command"))
+    serial = next(iter(devices))
+    local_file = os.path.join(tmp, "payload.bin")
+    with open(local_file, "wb") as f:
+        f.write(os.urandom(256 * 1024))
+
+    run_one = parser.parse_args(["adb", "run", "-d", serial, "-c", "getprop ro.product.model"])
+    run_all = parser.parse_args(["adb", "run", "--all", "-c", "id"])
+    cert_args = ["adb", "install-cert", "--all", "-u", "127.0.0.1", "-p", str(burp.port)]
+    install = parser.parse_args(cert_args)
+    install_refresh = parser.parse_args(cert_args + ["--refresh"])
+
+    operations = {
+        "list_devices": lambda: adb.list_devices(),
+        "get_device_info_dict": lambda: (
+            adb.invalidate_device_props(serial),
+            adb.get_device_info_dict(serial),
+        ),
+        "get_device_info_dict (cached)": lambda: adb.get_device_info_dict(serial),
+        "run_adb_command": lambda: adb.run_adb_command(run_one),
+        "run_adb_command --all": lambda: list(adb.run_adb_command(run_all)),
+        "push_file 256KiB": lambda: adb.push_file(serial, local_file, "/data/local/tmp/payload.bin"),
+        "install_ca_cert --all": lambda: adb.install_ca_cert(install),
+        "install_ca_cert --all --refresh": lambda: adb.install_ca_cert(install_refresh),
+    }
+    results = {}
+    for name, func in operations.items():
+        if args.only and not any(only in name for only in args.only):
+            continue
+        # install_ca_cert prints per-device progress, keep the report readable
+        profiler = cProfile.Profile() if args.profile else None
+        with contextlib.redirect_stdout(io.StringIO()):
+            if profiler is not None:
+                profiler.enable()
+            results[name] = measure(func, args.runs)
+            if profiler is not None:
+                profiler.disable()
+        if profiler is not None:
+            os.makedirs(args.profile, exist_ok=True)
+            slug = "".join(c if c.isalnum() else "_" for c in name).strip("_")
+            profiler.dump_stats(os.path.join(args.profile, f"{slug}.prof"))
+        print(
+            f"{name:<34} {results[name]['p50_ms']:>8.2f} {results[name]['p90_ms']:>8.2f} "
+            f"{results[name]['p99_ms']:>8.2f} {results[name]['ops_per_s']:>10.1f}"
+        )
+
+    with open(adb_log) as f:
+        fallbacks = len(f.readlines())
+    adb_server.stop()
+    burp.stop()
+    shutil.rmtree(tmp, ignore_errors=True)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "runs": args.runs,
+            "devices": args.devices,
+            "adb_latency": args.adb_latency,
+            "burp_latency": args.burp_latency,
+            "adb_binary_fallbacks": fallbacks,
+            "burp_requests": len(burp.requests),
+        },
+        "results": results,
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float, min_delta_ms: float) -> list[str]:
+    regressions = []
+    for name, current in report["results"].items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None:
+            continue
+        for key in ("p50_ms", "p90_ms"):
+            if current[key] > previous[key] * (1 + tolerance) and current[key] - previous[key] > min_delta_ms:
+                regressions.append(
+                    f"{name}: {key} {current[key]:.2f} ms vs baseline {previous[key]:.2f} ms "
+                    f"(+{current[key] - previous[key]:.2f} ms)"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ADB operation benchmark")
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--devices", type=int, default=4)
+    parser.add_argument("--adb-latency", type=float, default=0.002, help="Seconds per fake adb request")
+    parser.add_argument("--burp-latency", type=float, default=0.02, help="Seconds per fake Burp request")
+    parser.add_argument("--only", action="append", help="Only operations whose name contains this")
+    parser.add_argument("--output", help="Write the results as JSON")
+    parser.add_argument("--baseline", help="Fail on regressions against these saved results")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--min-delta-ms", type=float, default=0.1)
+    parser.add_argument("--save-baseline", help="Also write the results here as the new baseline")
+    parser.add_argument("--profile", help="Write a cProfile dump per operation to this directory")
+    args = parser.parse_args()
+
+    print(f"{'operation':<34} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'ops/s':>10}")
+    report = run(args)
+    meta = report["meta"]
+    print(f"adb binary fallbacks: {meta['adb_binary_fallbacks']}, Burp requests: {meta['burp_requests']}")
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance, args.min_delta_ms)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
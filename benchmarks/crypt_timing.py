@@ -0,0 +1,72 @@
+"""Compare how long CryptHelper's in-memory DER->PEM and old subject hash
+take against running openssl for the same certificates
+
+    python -m benchmarks.crypt_timing [--openssl path] [--der cert.der ...] [--runs 20]
+
+Without --der the certificates of tests/fixtures/certs are used. That both
+give the same bytes is checked by tests/test_crypt.py, not here. Without an
+openssl binary only the in-memory side is timed.
+"""
+import argparse
+import glob
+import os
+import shutil
+import subprocess
+import time
+
+from system.crypt import CryptHelper
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests", "fixtures", "certs")
+
+
+def time_in_memory(certificates: list[bytes], runs: int) -> float:
+    start = time.perf_counter()
+    for _ in range(runs):
+        for der in certificates:
+            CryptHelper.der_to_pem(der)
+            CryptHelper.subject_hash_old(der)
+    return (time.perf_counter() - start) / (runs * len(certificates))
+
+
+def time_openssl(openssl: str, paths: list[str], runs: int) -> float:
+    start = time.perf_counter()
+    for _ in range(runs):
+        for der_path in paths:
+            subprocess.run(
+                [openssl, "x509", "-inform", "DER", "-outform", "PEM", "-in", der_path],
+                check=True,
+                capture_output=True,
+            )
+            subprocess.run(
+                [openssl, "x509", "-inform", "DER", "-noout", "-subject_hash_old", "-in", der_path],
+                check=True,
+                capture_output=True,
+            )
+    return (time.perf_counter() - start) / (runs * len(paths))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CryptHelper/openssl timing comparison")
+    parser.add_argument("--openssl", default=shutil.which("openssl"))
+    parser.add_argument("--der", nargs="*", default=[])
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    paths = args.der or sorted(glob.glob(os.path.join(FIXTURES, "*.der")))
+    certificates = []
+    for der_path in paths:
+        with open(der_path, "rb") as f:
+            certificates.append(f.read())
+
+    print(f"{len(paths)} certificates, {args.runs} runs")
+    print(f"in-memory {time_in_memory(certificates, args.runs) * 1000:.3f} ms/cert")
+    if args.openssl:
+        # Each openssl run is a process start, a handful of runs says enough
+        runs = max(1, args.runs // 10)
+        print(f"openssl   {time_openssl(args.openssl, paths, runs) * 1000:.1f} ms/cert")
+    else:
+        print("openssl not found, skipped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+"""A scriptable fake adb server speaking the host protocol on a local port
+
+Used to exercise ``system.adb_client.ADBClient`` and the ``ADB`` class
+without real devices:
+
+    server = FakeADBServer({"emulator-5554": FakeDevice(props={"ro.product.model": "Pixel"})})
+    server.start()
+    client = ADBClient(port=server.port)
+"""
+import re
+import shlex
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+# One command as written by system.shellpool.ShellSession
+SESSION_LINE = re.compile(
+    r"sh -c (?P<command>.*) </dev/null; printf '\\n%s %d\\n' (?P<token>\S+) \$\?; printf '%s\\n' \S+ >&2"
+)
+
+class FakeDevice:
+    def __init__(
+        self, state: str = "device", props: dict | None = None, files: dict | None = None, root: bool = True
+    ):
+        self.state = state
+        # Whether `su` works
+        self.root = root
+        # Interactive shell sessions opened so far
+        self.sessions = 0
+        self.props = dict(props or {})
+        # remote path -> (mode, mtime, bytes)
+        self.files = dict(files or {})
+        # (compiled regex, handler(device, match) -> (exit_code, stdout, stderr))
+        self.shell_handlers = []
+
+    def on_shell(self, pattern: str, handler) -> None:
+        """Register a handler for shell commands matching a regex
+        :param pattern: str -- The regex matched against the whole command
+        :param handler: callable -- handler(device, match) -> (exit_code, stdout, stderr),
+            stdout may also be an iterable of byte chunks sent as they are produced;
+            raising ConnectionAbortedError (even from that iterable) drops the
+            connection of a command that has already started
+        :return: None
+        """
+        self.shell_handlers.insert(0, (re.compile(pattern, re.S), handler))
+
+    def run_shell(self, command: str) -> tuple[int, bytes, bytes]:
+        for pattern, handler in self.shell_handlers:
+            match = pattern.fullmatch(command)
+            if match:
+                return handler(self, match)
+        if command == "getprop":
+            out = "".join(f"[{k}]: [{v}]\n" for k, v in self.props.items())
+            return 0, out.encode(), b""
+        if command.startswith("getprop "):
+            return 0, (self.props.get(command[8:].strip(), "") + "\n").encode(), b""
+        if command.startswith("echo "):
+            return 0, command[5:].encode() + b"\n", b""
+        name = command.split(" ", 1)[0]
+        return 127, b"", f"/system/bin/sh: {name}: not found\n".encode()
+
+
+class FakeADBServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, devices: dict[str, FakeDevice] | None = None, port: int = 0, latency: float = 0.0):
+        """
+        :param devices: dict -- serial -> FakeDevice
+        :param port: int -- The port to listen on (0 picks a free port)
+        :param latency: float -- Seconds to sleep before answering each request
+        """
+        super().__init__(("127.0.0.1", port), _FakeADBHandler)
+        self.devices = devices if devices is not None else {}
+        self.latency = latency
+        self.requests = []
+        self.changed = threading.Condition()
+        self.generation = 0
+        # Sockets of the sync: connections currently open
+        self.sync_sockets = set()
+        self.__thread = None
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def set_device(self, serial: str, device: FakeDevice | None) -> None:
+        """Add, replace or (with None) remove a device and notify trackers"""
+        with self.changed:
+            if device is None:
+                self.devices.pop(serial, None)
+            else:
+                self.devices[serial] = device
+            self.generation += 1
+            self.changed.notify_all()
+
+    def set_state(self, serial: str, state: str) -> None:
+        with self.changed:
+            self.devices[serial].state = state
+            self.generation += 1
+            self.changed.notify_all()
+
+    def drop_sync_connections(self) -> None:
+        """Close every open sync: connection, like a restarted adb server"""
+        for sock in list(self.sync_sockets):
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def device_listing(self) -> bytes:
+        return "".join(f"{s}\t{d.state}\n" for s, d in self.devices.items()).encode()
+
+    def start(self) -> "FakeADBServer":
+        self.__thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+class _FakeADBHandler(socketserver.BaseRequestHandler):
+    server: FakeADBServer
+
+    def read_exactly(self, size: int) -> bytes:
+        buf = bytearray()
+        while len(buf) < size:
+            chunk = self.request.recv(size - len(buf))
+            if not chunk:
+                raise ConnectionError("client closed")
+            buf += chunk
+        return bytes(buf)
+
+    def okay(self, payload: bytes | None = None) -> None:
+        if payload is None:
+            self.request.sendall(b"OKAY")
+        else:
+            self.request.sendall(b"OKAY" + b"%04x" % len(payload) + payload)
+
+    def fail(self, message: str) -> None:
+        data = message.encode()
+        self.request.sendall(b"FAIL" + b"%04x" % len(data) + data)
+
+    def handle(self) -> None:
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        serial = None
+        try:
+            while True:
+                request = self.read_exactly(int(self.read_exactly(4), 16)).decode()
+                self.server.requests.append(request)
+                if self.server.latency:
+                    time.sleep(self.server.latency)
+                if serial is None:
+                    serial = self.handle_host(request)
+                    if serial is None:
+                        return
+                else:
+                    self.handle_local(serial, request)
+                    return
+        except ConnectionError:
+            pass
+
+    def handle_host(self, request: str) -> str | None:
+        """Answer a host request, returning the serial if a transport was selected"""
+        devices = self.server.devices
+        if request == "host:version":
+            self.okay(b"0029")
+        elif request == "host:devices":
+            self.okay(self.server.device_listing())
+        elif request == "host:track-devices":
+            self.okay()
+            self.track_devices()
+        elif request == "host:transport-any":
+            if not devices:
+                self.fail("no devices/emulators found")
+                return None
+            self.okay()
+            return next(iter(devices))
+        elif request.startswith("host:transport:"):
+            serial = request[len("host:transport:"):]
+            if serial not in devices:
+                self.fail(f"device '{serial}' not found")
+                return None
+            self.okay()
+            return serial
+        elif request.startswith("host-serial:"):
+            serial, query = request[len("host-serial:"):].rsplit(":", 1)
+            if serial not in devices:
+                self.fail(f"device '{serial}' not found")
+            elif query == "get-state":
+                self.okay(devices[serial].state.encode())
+            elif query == "get-serialno":
+                self.okay(serial.encode())
+            else:
+                self.fail(f"unknown host service: {query}")
+        else:
+            self.fail(f"unknown host service: {request}")
+        return None
+
+    def track_devices(self) -> None:
+        server = self.server
+        while True:
+            with server.changed:
+                generation = server.generation
+                listing = server.device_listing()
+            try:
+                self.request.sendall(b"%04x" % len(listing) + listing)
+            except OSError:
+                return
+            with server.changed:
+                while server.generation == generation:
+                    server.changed.wait()
+
+    def handle_local(self, serial: str, request: str) -> None:
+        device = self.server.devices[serial]
+        if request in ("shell,v2,raw:", "shell,v2,raw:su"):
+            self.okay()
+            self.handle_session(device, root=request.endswith("su"))
+        elif request.startswith("shell,v2,raw:"):
+            self.okay()
+            code, out, err = device.run_shell(request[len("shell,v2,raw:"):])
+            for chunk in [out] if isinstance(out, bytes) else out:
+                if chunk:
+                    self.request.sendall(struct.pack("<BI", 1, len(chunk)) + chunk)
+            if err:
+                self.request.sendall(struct.pack("<BI", 2, len(err)) + err)
+            self.request.sendall(struct.pack("<BIB", 3, 1, code & 0xFF))
+        elif request.startswith("shell:"):
+            self.okay()
+            code, out, err = device.run_shell(request[len("shell:"):])
+            for chunk in [out] if isinstance(out, bytes) else out:
+                self.request.sendall(chunk)
+            self.request.sendall(err)
+        elif request == "sync:":
+            self.okay()
+            self.server.sync_sockets.add(self.request)
+            try:
+                self.handle_sync(device)
+            finally:
+                self.server.sync_sockets.discard(self.request)
+        else:
+            self.fail(f"unknown local service: {request}")
+
+    def send_packet(self, packet_id: int, payload: bytes) -> None:
+        self.request.sendall(struct.pack("<BI", packet_id, len(payload)) + payload)
+
+    def handle_session(self, device: FakeDevice, root: bool) -> None:
+        """An interactive sh/su reading commands framed by ShellSession"""
+        if root and not device.root:
+            self.send_packet(2, b"/system/bin/sh: su: not found\n")
+            self.send_packet(3, b"\x7f")
+            return
+        device.sessions += 1
+        pending = b""
+        while True:
+            packet_id, length = struct.unpack("<BI", self.read_exactly(5))
+            pending += self.read_exactly(length)
+            *lines, pending = pending.split(b"\n")
+            for line in lines:
+                match = SESSION_LINE.fullmatch(line.decode())
+                if match is None:
+                    self.send_packet(2, b"sh: unexpected input\n")
+                    continue
+                command = shlex.split(match["command"])[0]
+                self.server.requests.append(f"session{'-root' if root else ''}:{command}")
+                if self.server.latency:
+                    time.sleep(self.server.latency)
+                if command == "id -u":
+                    code, out, err = 0, b"0\n" if root else b"2000\n", b""
+                else:
+                    code, out, err = device.run_shell(command)
+                for chunk in [out] if isinstance(out, bytes) else out:
+                    if chunk:
+                        self.send_packet(1, chunk)
+                token = match["token"].encode()
+                self.send_packet(1, b"\n" + token + b" %d\n" % code)
+                self.send_packet(2, err + token + b"\n")
+
+    def handle_sync(self, device: FakeDevice) -> None:
+        while True:
+            command = self.read_exactly(4)
+            length = struct.unpack("<I", self.read_exactly(4))[0]
+            if command == b"QUIT":
+                return
+            data = self.read_exactly(length)
+            if command == b"STAT":
+                path = data.decode()
+                entry = device.files.get(path)
+                if entry is None:
+                    is_dir = any(p.startswith(path.rstrip("/") + "/") for p in device.files)
+                    mode = 0o40755 if is_dir else 0
+                    self.request.sendall(b"STAT" + struct.pack("<III", mode, 0, 0))
+                else:
+                    mode, mtime, content = entry
+                    self.request.sendall(b"STAT" + struct.pack("<III", mode, len(content), mtime))
+            elif command == b"LIST":
+                prefix = data.decode().rstrip("/") + "/"
+                names = {}
+                for path, (mode, mtime, content) in device.files.items():
+                    if path.startswith(prefix):
+                        name, _, rest = path[len(prefix):].partition("/")
+                        if rest:
+                            names.setdefault(name, (0o40755, 0, mtime))
+                        else:
+                            names[name] = (mode, len(content), mtime)
+                for name, (mode, size, mtime) in names.items():
+                    encoded = name.encode()
+                    self.request.sendall(
+                        b"DENT" + struct.pack("<IIII", mode, size, mtime, len(encoded)) + encoded
+                    )
+                self.request.sendall(b"DONE" + struct.pack("<IIII", 0, 0, 0, 0))
+            elif command == b"RECV":
+                entry = device.files.get(data.decode())
+                if entry is None:
+                    message = b"No such file or directory"
+                    self.request.sendall(b"FAIL" + struct.pack("<I", len(message)) + message)
+                    continue
+                content = entry[2]
+                for offset in range(0, len(content), 65536):
+                    chunk = content[offset : offset + 65536]
+                    self.request.sendall(b"DATA" + struct.pack("<I", len(chunk)) + chunk)
+                self.request.sendall(b"DONE" + struct.pack("<I", 0))
+            elif command == b"SEND":
+                path, mode = data.decode().rsplit(",", 1)
+                content = bytearray()
+                while True:
+                    chunk_id = self.read_exactly(4)
+                    value = struct.unpack("<I", self.read_exactly(4))[0]
+                    if chunk_id == b"DATA":
+                        content += self.read_exactly(value)
+                    elif chunk_id == b"DONE":
+                        device.files[path] = (int(mode), value, bytes(content))
+                        self.request.sendall(b"OKAY" + struct.pack("<I", 0))
+                        break
+                    else:
+                        message = b"unexpected sync chunk"
+                        self.request.sendall(b"FAIL" + struct.pack("<I", len(message)) + message)
+                        return
+            else:
+                message = b"unknown sync command"
+                self.request.sendall(b"FAIL" + struct.pack("<I", len(message)) + message)
+                return
@@ -0,0 +1,95 @@
+"""A local stand-in for Burp Suite's http://burp/cert endpoint
+
+    server = FakeBurpServer(latency=0.02).start()
+    BurpHelper.fetch_certificate("127.0.0.1", server.port)
+
+Serves a fixed CA certificate (DER) with an ETag and honours
+If-None-Match, so CertCache revalidation can be measured as well.
+"""
+import base64
+import hashlib
+import http.server
+import threading
+import time
+
+CERT_DER = base64.b64decode(
+    """
+    MIIDizCCAnOgAwIBAgIUA8RYTUqhHl1Q1qpKh0idc/mttU8wDQYJKoZIhvcNAQELBQAwVTELMAkG
+    A1UEBhMCVVMxFDASBgNVBAoMC1BvcnRTd2lnZ2VyMRcwFQYDVQQLDA5Qb3J0U3dpZ2dlciBDQTEX
+    MBUGA1UEAwwOUG9ydFN3aWdnZXIgQ0EwHhcNMjYxMDE3MDExNzQ0WhcNMzYxMDE0MDExNzQ0WjBV
+    MQswCQYDVQQGEwJVUzEUMBIGA1UECgwLUG9ydFN3aWdnZXIxFzAVBgNVBAsMDlBvcnRTd2lnZ2Vy
+    IENBMRcwFQYDVQQDDA5Qb3J0U3dpZ2dlciBDQTCCASIwDQYJKoZIhvcNAQEBBQADggEPADCCAQoC
+    ggEBALae2c1w2ToQ4A5c/0JNYx0HV1efPthahy6Cz3zrUn77kcZxu2xwpl6sFBw+Wz3XjzGFiLBY
+    PkzeRl+umBd+zjFq38ws6WxSopBJIVYDw4uNvFF6ISQwVHhFInCWMq2yMYd077ajz2wwz4g66OTh
+    M53e6tfD2RpzXgB0E5g2hRAHJbODNWeJ/zp0UUdKV/AvScnr+rdwMd4sSuiZEoTDQqnDk8VEyh6A
+    2lOklnEZ7YV+xDFWJsD2G8fWKVyyT/GLCizo9XXxk7VelINlOPfWdVyUaI8N2LbF713DZ5PaxDUW
+    4TcFUUm4fvj02Jb3PfYoXnE+fsXytvotbDq2fVgYy2cCAwEAAaNTMFEwHQYDVR0OBBYEFGqWszNQ
+    b8I3cTGEGrJ5zp722+F1MB8GA1UdIwQYMBaAFGqWszNQb8I3cTGEGrJ5zp722+F1MA8GA1UdEwEB
+    /wQFMAMBAf8wDQYJKoZIhvcNAQELBQADggEBAKgP1VMIAvIyY6yB5qFJFNeNLoTfLKA1G9xv5ENo
+    yUuShUcSGs8C1vYJ/vsIYQpOHpQrwio0mZqOJgH4xhSOzD0SgqSVVAI+uTU76INbXORNd0PJikcC
+    rQvU3Pv/79VPIJn6v1s37Yku61lcyMA9F3ExuwM8KsdcZEuLQTcKRC/xsUeOO6m8zU9058TOMGJB
+    5Jrb/es56fGBLEl57JbY3DBDKgKLITLCDFe0pF233cgiO3IAc4oIcYvqVJGvqa24Ya5uZ9Xvbt/U
+    almHdjvhAGpfpRDeM2DXgF9shy29ZpsiPSk5CjiATmy9iR4ol/eqNXpuXyuZFzimZsmtkdh1biQ=
+    """
+)
+
+
+class FakeBurpServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, latency: float = 0.0, der: bytes = CERT_DER):
+        """
+        :param port: int -- The port to listen on (0 picks a free port)
+        :param latency: float -- Seconds to sleep before answering each request
+        :param der: bytes -- The certificate to serve
+        """
+        super().__init__(("127.0.0.1", port), _FakeBurpHandler)
+        self.latency = latency
+        self.der = der
+        self.requests = []
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    @property
+    def etag(self) -> str:
+        return '"%s"' % hashlib.sha256(self.der).hexdigest()[:16]
+
+    def start(self) -> "FakeBurpServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+class _FakeBurpHandler(http.server.BaseHTTPRequestHandler):
+    server: FakeBurpServer
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        self.server.requests.append((self.path, self.headers.get("If-None-Match")))
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if self.path != "/cert":
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.headers.get("If-None-Match") == self.server.etag:
+            self.send_response(304)
+            self.send_header("ETag", self.server.etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-x509-ca-cert")
+        self.send_header("ETag", self.server.etag)
+        self.send_header("Content-Length", str(len(self.server.der)))
+        self.end_headers()
+        self.wfile.write(self.server.der)
+
+    def log_message(self, *args) -> None:
+        pass
@@ -0,0 +1,128 @@
+"""Measure binary logcat decode/filter/format throughput
+
+    python -m benchmarks.logcat_decode [--fixture logcat.bin] [--entries 200000] [--runs 5]
+
+--fixture replays a recorded capture (adb exec-out logcat -B -d > logcat.bin).
+Without it a deterministic synthetic capture of v4 entries is generated;
+--save writes that capture out so later runs can replay the same bytes.
+The text rows parse the same entries from `logcat -v threadtime` output
+with a regex into the same records, which is what piping plain
+`adb logcat` through Python costs.
+"""
+import argparse
+import random
+import re
+import statistics
+import struct
+import time
+
+from system.logcat import (
+    LogcatParser,
+    LogEntry,
+    LogFilter,
+    PRIORITIES,
+    ThreadtimeFormatter,
+    ERROR,
+    INFO,
+    VERBOSE,
+    WARN,
+)
+
+V4_HEADER = struct.Struct("<HHiIiIII")
+TAGS = ["ActivityManager", "chromium", "OkHttp", "PackageManager", "SSLPinning", "art", "Zygote", "libc"]
+THREADTIME = re.compile(r"^(\S+ \S+)\s+(\d+)\s+(\d+) ([VDIWEF]) (.*?): (.*)$")
+CHUNK = 64 * 1024
+
+
+def synthetic_capture(count: int, seed: int = 1) -> bytes:
+    rng = random.Random(seed)
+    out = bytearray()
+    sec = 1_700_000_000
+    for i in range(count):
+        sec += rng.random() < 0.01
+        tag = rng.choice(TAGS).encode()
+        message = f"request {i} status={rng.randint(100, 599)} " + "x" * rng.randint(10, 160)
+        payload = bytes([rng.choice((VERBOSE, INFO, INFO, WARN, ERROR))]) + tag + b"\0" + message.encode() + b"\0"
+        out += V4_HEADER.pack(
+            len(payload), V4_HEADER.size, rng.randint(1000, 1100), rng.randint(1000, 5000),
+            sec, rng.randint(0, 999_999_999), 0, 10000 + rng.randint(0, 50),
+        )
+        out += payload
+    return bytes(out)
+
+
+def decode(capture: bytes, log_filter: LogFilter | None, fmt: bool) -> int:
+    parser = LogcatParser(log_filter)
+    formatter = ThreadtimeFormatter()
+    for i in range(0, len(capture), CHUNK):
+        entries = parser.feed(capture[i : i + CHUNK])
+        if fmt and entries:
+            formatter.format_all(entries)
+    return parser.kept
+
+
+def parse_text(text: bytes, log_filter: LogFilter | None) -> int:
+    kept = 0
+    match = THREADTIME.match
+    min_priority = log_filter.min_priority if log_filter else VERBOSE
+    tags = log_filter.tags if log_filter else None
+    for line in text.decode(errors="replace").splitlines():
+        m = match(line)
+        if m is None:
+            continue
+        stamp, pid, tid, letter, tag, message = m.groups()
+        priority = PRIORITIES[letter]
+        if priority < min_priority or (tags is not None and tag.encode() not in tags):
+            continue
+        LogEntry(int(pid), int(tid), stamp, 0, 0, 0, priority, tag, message)
+        kept += 1
+    return kept
+
+
+def bench(func, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Binary logcat decode benchmark")
+    parser.add_argument("--fixture", help="A recorded `logcat -B` capture")
+    parser.add_argument("--save", help="Write the synthetic capture here")
+    parser.add_argument("--entries", type=int, default=200000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.fixture:
+        with open(args.fixture, "rb") as f:
+            capture = f.read()
+    else:
+        capture = synthetic_capture(args.entries)
+        if args.save:
+            with open(args.save, "wb") as f:
+                f.write(capture)
+
+    total = decode(capture, None, False)
+    text = ThreadtimeFormatter().format_all(LogcatParser().feed(capture)).encode()
+    megabytes = len(capture) / (1024 * 1024)
+    cases = [
+        ("decode only", lambda: decode(capture, None, False)),
+        ("decode + format", lambda: decode(capture, None, True)),
+        ("priority >= W + format", lambda: decode(capture, LogFilter(min_priority=WARN), True)),
+        ("tag filter + format", lambda: decode(capture, LogFilter(tags=["SSLPinning"]), True)),
+        ("text: parse", lambda: parse_text(text, None)),
+        ("text: priority >= W", lambda: parse_text(text, LogFilter(min_priority=WARN))),
+        ("text: tag filter", lambda: parse_text(text, LogFilter(tags=["SSLPinning"]))),
+    ]
+    print(f"{total} entries, {megabytes:.1f} MB")
+    print(f"{'case':<26} {'median ms':>10} {'entries/s':>12} {'MB/s':>8}")
+    for name, func in cases:
+        elapsed = bench(func, args.runs)
+        print(f"{name:<26} {elapsed * 1000:>10.1f} {total / elapsed:>12.0f} {megabytes / elapsed:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Measure the cold start cost of main.py against a stubbed adb binary
+
+    python -m benchmarks.startup [--runs 10] [--adb-delay 0.05]
+
+The stub adb sleeps for --adb-delay seconds per call (roughly what forking
+the real binary costs) and logs every invocation, so the report shows both
+the wall time of each command line and how many adb calls it made.
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STUB_ADB = """#!/bin/sh
+echo "$@" >> "{log}"
+sleep {delay}
+case "$1 $2 $3" in
+    devices*) printf 'List of devices attached\\nstub-1\\tdevice\\n' ;;
+    "-s "*" shell") echo stub ;;
+esac
+"""
+
+COMMANDS = [
+    ["--help"],
+    ["adb", "--help"],
+    ["adb", "devices"],
+    ["adb", "run", "-d", "stub-1", "-c", "id"],
+    ["adb", "install-cert", "--help"],
+]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure(argv: list, env: dict, log: str, runs: int) -> tuple[list, int]:
+    timings = []
+    calls = 0
+    for _ in range(runs):
+        open(log, "w").close()
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, os.path.join(BASE_DIR, "main.py"), *argv],
+            env=env,
+            capture_output=True,
+        )
+        timings.append(time.perf_counter() - start)
+        with open(log) as f:
+            calls = len(f.readlines())
+    return timings, calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description="main.py startup benchmark")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--adb-delay", type=float, default=0.05)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log = os.path.join(tmp, "adb.log")
+        stub = os.path.join(tmp, "adb")
+        with open(stub, "w") as f:
+            f.write(STUB_ADB.format(log=log, delay=args.adb_delay))
+        os.chmod(stub, 0o755)
+
+        env = dict(os.environ)
+        env["PATH"] = tmp + os.pathsep + env.get("PATH", "")
+        # Point the protocol client at a closed port so every call hits the stub
+        env["ANDROID_ADB_SERVER_PORT"] = str(free_port())
+
+        print(f"{'command':<40} {'median ms':>10} {'min ms':>8} {'adb calls':>10}")
+        for argv in COMMANDS:
+            timings, calls = measure(argv, env, log, args.runs)
+            print(
+                f"{' '.join(argv):<40} {statistics.median(timings) * 1000:>10.1f} "
+                f"{min(timings) * 1000:>8.1f} {calls:>10}"
+            )
+
+
+if __name__ == "__main__":
+    main()
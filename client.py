@@ -0,0 +1,79 @@
+"""Thin client for `python main.py serve`
+
+    python client.py adb devices
+
+Forwards the command line, working directory, environment and stdin/stdout/
+stderr to the daemon and exits with the command's exit code. Only the
+standard library is imported, so starting the client costs next to nothing.
+Without a running daemon the command runs in-process through main.py.
+"""
+import os
+import sys
+import json
+import getpass
+import signal
+import socket
+import struct
+import tempfile
+
+
+# Passing stdin/stdout/stderr to the daemon needs Unix sockets with SCM_RIGHTS
+SUPPORTED = hasattr(socket, "AF_UNIX") and hasattr(socket, "send_fds")
+
+
+def default_socket_path() -> str:
+    # os.getuid is POSIX only, the user name keeps the socket per-user elsewhere
+    user = os.getuid() if hasattr(os, "getuid") else getpass.getuser()
+    return os.environ.get("FSP_SOCKET") or os.path.join(
+        tempfile.gettempdir(), f"frida-sp-{user}.sock"
+    )
+
+
+def forward(argv: list[str], socket_path: str) -> int | None:
+    """Run a command line in the daemon
+
+    Arguments:
+        argv {list[str]} -- The arguments main.py would get
+        socket_path {str} -- The daemon's socket
+
+    Returns:
+        int | None -- The exit code, None when no daemon is listening
+    """
+    if not SUPPORTED:
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        sock.close()
+        return None
+    request = json.dumps({"argv": argv, "cwd": os.getcwd(), "env": dict(os.environ)}).encode()
+    socket.send_fds(sock, [struct.pack("<I", len(request)) + request], [0, 1, 2])
+    replies = sock.makefile("rb")
+    pid = None
+    while True:
+        try:
+            line = replies.readline()
+        except KeyboardInterrupt:
+            if pid is not None:
+                os.kill(pid, signal.SIGINT)
+            continue
+        if not line:
+            # The command died without reporting
+            return 1
+        reply = json.loads(line)
+        if "exit" in reply:
+            return reply["exit"]
+        pid = reply["pid"]
+
+
+def main():
+    code = forward(sys.argv[1:], default_socket_path()) if SUPPORTED else None
+    if code is None:
+        main_py = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+        os.execv(sys.executable, [sys.executable, main_py, *sys.argv[1:]])
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,19 @@
+import sys
 import argparse
 
 from system import ADB
+from system import FridaHelper
+from system import Provisioner
 from system import Style
+from system import TRACER, TraceView
+from system import OUTPUT, OUTPUT_FORMATS
+from system import daemon
+from client import default_socket_path
 from os import path
 
 adb = None
+frida = None
+provisioner = None
 parser = None
 
 BASE_DIR = path.dirname(path.abspath(__file__))
@@ -26,27 +35,116 @@ def banner():
 
 def init():
     global adb
+    global frida
+    global provisioner
     try:
         adb = ADB(BASE_DIR)
+        frida = FridaHelper(adb, BASE_DIR)
+        provisioner = Provisioner(adb, frida, BASE_DIR)
     except Exception as e:
         print(Style.RED + "Error: " + str(e) + Style.RESET)
         exit(1)
 
 
-def arg_parse():
+def arg_parse(argv=None):
     global adb
     global parser
+    if parser is not None:
+        # Commands forked from `serve` reuse the daemon's parser
+        return parser.parse_args(argv)
     parser = argparse.ArgumentParser(description="Frida/ADB automation tool")
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print how long adb, openssl and Burp calls took when done",
+    )
+    parser.add_argument(
+        "--trace",
+        type=str,
+        metavar="FILE",
+        help="Write every adb, openssl and Burp call as Chrome trace JSON",
+    )
+    parser.add_argument(
+        "--output",
+        # Subcommands have their own -o/--output file options
+        dest="output_format",
+        choices=OUTPUT_FORMATS,
+        default="table",
+        help="table for people, json or ndjson (one record per line, as results arrive) for tools",
+    )
+    parser.add_argument(
+        "--no-color",
+        action="store_true",
+        help="Never use ANSI colors (they are already off when stdout is not a terminal)",
+    )
     subparsers = parser.add_subparsers(dest="command", help="Commands")
     ADB.add_parser(adb, subparsers)
-    return parser.parse_args()
+    FridaHelper.add_parser(frida, subparsers)
+    Provisioner.add_parser(provisioner, subparsers)
+    if daemon.SUPPORTED:
+        serve_parser = subparsers.add_parser(
+            "serve", help="Keep ADB state warm for commands run through client.py"
+        )
+        serve_parser.add_argument(
+            "--socket",
+            type=str,
+            help="The Unix socket to listen on (default: $FSP_SOCKET or a per-user socket in the temp directory)",
+        )
+        serve_parser.set_defaults(func=serve)
+    return parser.parse_args(argv)
 
 
-def main():
+def serve(cli_args):
     global adb
+
+    socket_path = cli_args.socket or default_socket_path()
+    adb.keep_warm()
+    server = daemon.Daemon(socket_path, run_forwarded, adb.warm_snapshot)
+    print(f"{Style.GREEN}[SUCCESS] Listening on {socket_path}, Ctrl+C to stop{Style.RESET}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.close()
+
+
+def run_forwarded(argv, snapshot):
+    """Run one client.py command line in a fork of the daemon"""
+    adb.after_fork(snapshot)
+    Style.enable()
+    TRACER.disable()
+    TRACER.clear()
+    code = main(argv)
+    if not OUTPUT.structured:
+        print()
+    return code
+
+
+def main(argv=None) -> int:
+    """Run one command line, the exit code is non-zero when a device or the command failed"""
+    global adb
+    global parser
+
+    cli_args = arg_parse(argv)
+    OUTPUT.configure(cli_args.output_format, False if cli_args.no_color else None)
+    if not OUTPUT.structured and sys.stdout.isatty():
+        banner()
+    if cli_args.profile or cli_args.trace:
+        TRACER.enable()
+    try:
+        dispatch(cli_args)
+    finally:
+        OUTPUT.finish()
+        if cli_args.trace:
+            TRACER.write_chrome_trace(cli_args.trace)
+            print(f"{Style.GREEN}[SUCCESS] Trace written to {cli_args.trace}{Style.RESET}")
+        if cli_args.profile:
+            TraceView.print_summary(TRACER)
+    return OUTPUT.exit_code
+
+
+def dispatch(cli_args):
     global parser
 
-    cli_args = arg_parse()
     if hasattr(cli_args, "func"):
         if hasattr(cli_args, "child_func"):
             cli_args.func(cli_args.child_func(cli_args))
@@ -59,7 +157,8 @@ def main():
 
 
 if __name__ == "__main__":
-    banner()
     init()
-    main()
-    print()
+    code = main()
+    if not OUTPUT.structured:
+        print()
+    sys.exit(code)
@@ -13,3 +13,21 @@ class Style:
     UNDERLINE = "\033[4m"
     BLINK = "\033[5m"
     INVERTED = "\033[7m"
+
+    @classmethod
+    def disable(cls):
+        """Turn every code into an empty string, e.g. when stdout is not a terminal"""
+        for name in _CODES:
+            setattr(cls, name, "")
+
+    @classmethod
+    def enable(cls):
+        for name, value in _CODES.items():
+            setattr(cls, name, value)
+
+
+_CODES = {
+    name: value
+    for name, value in vars(Style).items()
+    if isinstance(value, str) and value.startswith(("\033", "\x1b"))
+}
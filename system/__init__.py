@@ -1,3 +1,6 @@
 from .adb import ADB
 from style import Style
-from .frida import FridaHelper
\ No newline at end of file
+from .frida import FridaHelper
+from .provision import Provisioner
+from .trace import TRACER, TraceView
+from .output import OUTPUT, FORMATS as OUTPUT_FORMATS
\ No newline at end of file
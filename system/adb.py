@@ -1,22 +1,85 @@
+import io
 import os
+import base64
+import re
+import sys
+import time
+import shlex
+import hashlib
+import tempfile
 import argparse
+import threading
 import subprocess
+from typing import Iterator
 from os import environ
 from style import Style
+from requests import RequestException
+from .crypt import CryptHelper, CertificateError
 from .burp import BurpHelper
-from .crypt import CryptHelper
+from .certcache import CertCache
+from .adb_client import ADBClient, ADBClientError, ADBConnectError, SHELL_STDOUT, SHELL_EXIT
+from .fanout import DeviceResult, fan_out, DEFAULT_JOBS
+from .tracker import DeviceTracker, DeviceEvent
+from .stream import CommandStream, popen_packets
+from .sync import FileSync
+from .shellpool import ShellPool
+from .remount import RemountCache, candidate_strategies, installed_path, strategy_script
+from .trace import span
+from .output import OUTPUT
+from .proctable import ProcessTable, PS_COLUMNS, SNAPSHOT_COMMAND, poll_command, parse_ps, parse_poll
+from .apkstore import ApkStore, resolve_command, parse_pm_path, hash_command, parse_hashes
+from .inventory import (
+    PackageInventory,
+    parse_pm_list,
+    parse_dumpsys_packages,
+    merge_package,
+    PM_LIST_COMMAND,
+    DUMP_MARKER,
+)
+from .logcat import LogcatParser, LogFilter, ThreadtimeFormatter, RotatingLogWriter, PRIORITIES
+
+
+CACERTS_DIR = "/system/etc/security/cacerts"
+
+# install-cert outcomes per device
+INSTALLED = "installed"
+ALREADY_INSTALLED = "already-installed"
+FAILED = "failed"
+
+GETPROP_LINE = re.compile(r"^\[([^\]]+)\]: \[(.*?)\]$", re.M | re.S)
 
 
 class ADB:
     __adb_path = None
+    # Seconds a getprop snapshot stays valid
+    PROP_CACHE_TTL = 300
 
-    def __init__(self, base_dir: str):
+    def __init__(self, base_dir: str, use_client: bool = True, lazy: bool = True):
         self.__crypt = CryptHelper(base_dir)
         self.__base_dir = base_dir
         self.__cert_dir = os.path.join(base_dir, "certs")
+        self.__cert_cache = CertCache(self.__cert_dir)
+        # ro.build.fingerprint -> the cacerts install strategy that works there
+        self.__remount_cache = RemountCache(os.path.join(self.__cert_dir, "remount.json"))
+        self.__inventory = PackageInventory(os.path.join(base_dir, "inventory"))
+        self.__apk_store = ApkStore(os.path.join(base_dir, "apks"))
         self.__adb_path = self.__find_adb()
-        # Start the ADB server
-        self.start_server()
+        # Talk to the adb server directly, the adb binary is only a fallback
+        self.__client = ADBClient() if use_client else None
+        # Long-lived sh/su sessions, so small commands skip session setup
+        self.__shell_pool = ShellPool(self.__client) if self.__client is not None else None
+        # device_id -> (fetched_at, props)
+        self.__prop_cache: dict[str, tuple[float, dict]] = {}
+        self.__prop_lock = threading.Lock()
+        # device_id -> ProcessTable, polled incrementally
+        self.__process_tables: dict[str, ProcessTable] = {}
+        self.__process_lock = threading.Lock()
+        self.__tracker: DeviceTracker | None = None
+        self.__server_started = False
+        self.__server_lock = threading.Lock()
+        # Start the ADB server now, or on the first command that needs it
+        if not lazy:
+            self.ensure_server()
 
     def get_adb_path(self):
         return self.__adb_path
@@ -48,20 +111,303 @@ class ADB:
                 return adb_path_win
         raise FileNotFoundError("adb not found in PATH")
 
+    def get_client(self) -> ADBClient | None:
+        return self.__client
+
+    def shell(
+        self, device_id: str, command: str, root: bool = False, pooled: bool = True
+    ) -> subprocess.CompletedProcess:
+        """Run a shell command on a device (protocol client or adb binary)
+        :param device_id: str -- The device ID
+        :param command: str -- The command line to run in the device shell
+        :param root: bool -- Run the command as root
+        :param pooled: bool -- Run it in a pooled session, False for a shell of its own (stdin, no time limit)
+        :return: subprocess.CompletedProcess -- The result with text stdout/stderr
+        """
+        return self.__shell(device_id, command, root, pooled)
+
+    def push_file(self, device_id: str, local_file: str, remote_file: str) -> str:
+        """Push a file to a device
+        :param device_id: str -- The device ID
+        :param local_file: str -- The path to the local file
+        :param remote_file: str -- The path to the remote file
+        :return: str -- The output of the command
+        :raises RuntimeError: If the push failed
+        """
+        return self.__push_file(device_id, local_file, remote_file)
+
+    def forward(self, device_id: str, remote_port: int) -> int:
+        """Forward a free local TCP port to a TCP port on a device
+        :param device_id: str -- The device ID
+        :param remote_port: int -- The port on the device
+        :return: int -- The local port
+        :raises RuntimeError: If adb couldn't set up the forward
+        """
+        self.ensure_server()
+        selector = ["-s", device_id] if device_id else []
+        result = self.__run_adb([*selector, "forward", "tcp:0", f"tcp:{remote_port}"])
+        local_port = result.stdout.strip()
+        if result.returncode != 0 or not local_port.isdigit():
+            raise RuntimeError(f"adb forward failed: {result.stderr.strip() or local_port}")
+        return int(local_port)
+
+    def get_ca_cert(self, host: str, port: int, refresh: bool = False) -> tuple[bytes, str]:
+        """The Burp CA certificate as PEM, from the local cache when it is fresh
+        :param host: str -- The host where Burp Suite is running
+        :param port: int -- The port where Burp Suite is running
+        :param refresh: bool -- Revalidate the cached certificate with Burp
+        :return: tuple[bytes, str] -- The PEM certificate and its old subject hash
+        """
+        return self.__cert_cache.get(host, port, self.__crypt, refresh=refresh)
+
+    def get_ca_certs(
+        self, listeners: list[tuple[str, int]], refresh: bool = False
+    ) -> dict[tuple[str, int], tuple[bytes, str] | Exception]:
+        """The CA certificates of several Burp listeners, the stale ones fetched concurrently
+        :param listeners: list[tuple[str, int]] -- (host, port) of every listener
+        :param refresh: bool -- Revalidate the cached certificates with Burp
+        :return: dict -- (host, port) -> (PEM certificate, old subject hash), or the error for that listener
+        """
+        return self.__cert_cache.get_many(listeners, self.__crypt, refresh=refresh)
+
+    def install_ca_certs_on(self, device_id: str, certs: list[tuple[bytes, str]]) -> tuple[int, str, str]:
+        """Install several PEM certificates on a single device
+        :param device_id: str -- The device ID
+        :param certs: list[tuple[bytes, str]] -- (PEM certificate, old subject hash) pairs
+        :return: tuple[int, str, str] -- The first failing exit code, the logs and the overall outcome
+        """
+        returncode = 0
+        logs = []
+        outcomes = set()
+        for pem_cert, old_subject_hash in certs:
+            code, log, outcome = self.__install_ca_cert_on(device_id, pem_cert, old_subject_hash)
+            returncode = returncode or code
+            logs.append(log)
+            outcomes.add(outcome)
+        outcome = FAILED if FAILED in outcomes else INSTALLED if INSTALLED in outcomes else ALREADY_INSTALLED
+        return returncode, "\n".join(logs), outcome
+
+    def install_ca_cert_on(self, device_id: str, pem_cert: bytes, old_subject_hash: str) -> tuple[int, str, str]:
+        """Install a PEM certificate on a single device
+        :param device_id: str -- The device ID
+        :param pem_cert: bytes -- The PEM certificate
+        :param old_subject_hash: str -- The OpenSSL old subject hash of the certificate
+        :return: tuple[int, str, str] -- The exit code, the log and the outcome
+        """
+        return self.__install_ca_cert_on(device_id, pem_cert, old_subject_hash)
+
+    def install_apk(self, device_id: str, apk_path: str) -> tuple[int, str, str]:
+        """Install (or update) an APK on a device
+        :param device_id: str -- The device ID
+        :param apk_path: str -- The path to the local APK
+        :return: tuple[int, str, str] -- The exit code, the log and the outcome
+        """
+        remote_path = f"/data/local/tmp/{os.path.basename(apk_path)}"
+        log = [f"{Style.GREEN}[SUCCESS] {self.__push_file(device_id, apk_path, remote_path)}{Style.RESET}"]
+        result = self.__shell(device_id, f"pm install -r -t {shlex.quote(remote_path)}")
+        self.__shell(device_id, f"rm -f {shlex.quote(remote_path)}")
+        output = (result.stdout + result.stderr).strip()
+        if result.returncode != 0 or "Success" not in output:
+            log.append(f"{Style.RED}[Error] {output}{Style.RESET}")
+            return result.returncode or 1, "\n".join(log), FAILED
+        log.append(f"{Style.GREEN}[SUCCESS] Installed {os.path.basename(apk_path)}{Style.RESET}")
+        return 0, "\n".join(log), INSTALLED
+
+    def __shell(
+        self, device_id: str, command: str, root: bool = False, pooled: bool = True
+    ) -> subprocess.CompletedProcess:
+        """Run a shell command on a device
+        :param device_id: str -- The device ID
+        :param command: str -- The command line to run in the device shell
+        :param root: bool -- Run the command as root (in a pooled `su` session or with `su -c`)
+        :param pooled: bool -- Run it in a pooled session: stdin is /dev/null and it gets
+            ShellPool.COMMAND_TIMEOUT seconds. False runs it in a shell v2 service of its own
+        :return: subprocess.CompletedProcess -- The result with text stdout/stderr
+        """
+        self.ensure_server()
+        if pooled and self.__shell_pool is not None:
+            try:
+                session = self.__shell_pool.acquire(device_id, root)
+            except ADBClientError:
+                session = None
+            if session is not None:
+                try:
+                    returncode, stdout, stderr = session.run(command, ShellPool.COMMAND_TIMEOUT)
+                except ADBClientError as e:
+                    # The command may already have run, don't run it a second time
+                    return subprocess.CompletedProcess(command, 255, "", str(e))
+                finally:
+                    self.__shell_pool.release(session)
+                return subprocess.CompletedProcess(
+                    command,
+                    returncode,
+                    stdout.decode(errors="replace"),
+                    stderr.decode(errors="replace"),
+                )
+        if root:
+            command = f"su -c {shlex.quote(command)}"
+        if self.__client is not None:
+            try:
+                returncode, stdout, stderr = self.__client.shell(device_id, command)
+                return subprocess.CompletedProcess(
+                    command,
+                    returncode,
+                    stdout.decode(errors="replace"),
+                    stderr.decode(errors="replace"),
+                )
+            except ADBConnectError:
+                # Nothing ran yet, the adb binary may still get through
+                pass
+            except ADBClientError as e:
+                # The command may already have run, don't run it a second time
+                return subprocess.CompletedProcess(command, 255, "", str(e))
+        return self.__run_adb(["-s", device_id, "shell", command])
+
+    def __run_adb(self, args: list, text: bool = True) -> subprocess.CompletedProcess:
+        """Run the adb binary, traced as an adb.exec span
+        :param args: list -- The arguments after the adb path
+        :param text: bool -- Decode stdout/stderr
+        :return: subprocess.CompletedProcess -- The result
+        """
+        device = args[1] if len(args) > 1 and args[0] == "-s" else None
+        command = args[2:] if device else args
+        with span("adb.exec", device=device, command=" ".join(command)) as timing:
+            result = subprocess.run([self.__adb_path, *args], capture_output=True, text=text)
+            timing.tag(returncode=result.returncode)
+        return result
+
     def start_server(self) -> None:
         """Start the ADB server
         :return: None
         """
+        if self.__client is not None:
+            try:
+                # Nothing to do if the server is already answering
+                self.__client.version()
+                return
+            except ADBClientError:
+                pass
         # Run without printing the output
-        subprocess.run([self.__adb_path, "start-server"], capture_output=True)
+        self.__run_adb(["start-server"], text=False)
+
+    def ensure_server(self) -> None:
+        """Start the ADB server once, the first time a command needs it
+        :return: None
+        """
+        if self.__server_started:
+            return
+        with self.__server_lock:
+            if not self.__server_started:
+                self.start_server()
+                self.__server_started = True
+
+    def start_tracking(self, timeout: float = 2.0) -> DeviceTracker | None:
+        """Keep a live device registry fed by the adb server's track-devices stream
+
+        Once running, list_devices, device states and property snapshots are
+        answered from the registry instead of querying the server again.
+        :param timeout: float -- How long to wait for the first device list
+        :return: DeviceTracker -- The tracker, None without the protocol client
+        """
+        if self.__client is None:
+            return None
+        if self.__tracker is None:
+            self.ensure_server()
+            self.__tracker = DeviceTracker(self.__client)
+            self.__tracker.on_change(
+                lambda event: self.invalidate_device_props(event.serial)
+            )
+            if self.__shell_pool is not None:
+                self.__tracker.on_change(
+                    lambda event: self.__shell_pool.discard(event.serial)
+                )
+            self.__tracker.start()
+        self.__tracker.wait_ready(timeout)
+        return self.__tracker
+
+    def get_tracker(self) -> DeviceTracker | None:
+        return self.__tracker
+
+    def keep_warm(self) -> None:
+        """Keep the server up and every online device's props fetched, for `serve`
+
+        The tracker refetches the props of a device as soon as it (re)connects,
+        so commands forked from the daemon never have to.
+        :return: None
+        """
+        tracker = self.start_tracking()
+        if tracker is None:
+            return
+
+        def prefetch(event: DeviceEvent):
+            if event.new_state == "device":
+                threading.Thread(
+                    target=self.get_device_props, args=(event.serial, True), daemon=True
+                ).start()
+
+        tracker.on_change(prefetch)
+        for record in tracker.devices():
+            if record.state == "device":
+                self.get_device_props(record.serial)
+
+    def warm_snapshot(self) -> dict:
+        """The props known right now, to hand over to a forked command
+        :return: dict -- device_id -> props
+        """
+        props = {}
+        if self.__tracker is not None:
+            props.update((r.serial, r.props) for r in self.__tracker.devices() if r.props)
+        with self.__prop_lock:
+            props.update((device_id, cached[1]) for device_id, cached in self.__prop_cache.items())
+        return props
+
+    def after_fork(self, snapshot: dict) -> None:
+        """Start over in a forked child with the parent's knowledge but none of its connections
+
+        The tracker and prefetch threads and any lock they held didn't survive
+        the fork, and the parent's pooled sockets must not be shared, so the
+        child gets fresh locks, a fresh client and pool and the certificate
+        cache reloaded from disk, and keeps only the props snapshot.
+        BurpHelper resets its session in its own os.register_at_fork() hook.
+        :param snapshot: dict -- warm_snapshot() taken right before the fork
+        :return: None
+        """
+        self.__prop_lock = threading.Lock()
+        self.__server_lock = threading.Lock()
+        self.__process_lock = threading.Lock()
+        self.__process_tables = {}
+        self.__tracker = None
+        self.__cert_cache.after_fork()
+        if self.__client is not None:
+            self.__client = ADBClient()
+            self.__shell_pool = ShellPool(self.__client)
+        now = time.monotonic()
+        self.__prop_cache = {device_id: (now, props) for device_id, props in snapshot.items()}
+
+    def __tracking(self) -> bool:
+        return self.__tracker is not None and self.__tracker.is_ready()
 
     def list_devices(self, *args) -> tuple[int, list]:
         """List all connected devices
         :return: Tuple[int, str] -- The return device count and the device list
         """
-        result = subprocess.run(
-            [self.__adb_path, "devices"], capture_output=True, text=True
-        )
+        if self.__tracking():
+            devices = [
+                record.serial if record.state == "device" else f"{record.serial}\t{record.state}"
+                for record in self.__tracker.devices()
+            ]
+            return len(devices), devices
+        self.ensure_server()
+        if self.__client is not None:
+            try:
+                devices = [
+                    serial if state == "device" else f"{serial}\t{state}"
+                    for serial, state in self.__client.devices()
+                ]
+                return len(devices), devices
+            except ADBClientError:
+                pass
+        result = self.__run_adb(["devices"])
         output = result.stdout.strip()
         count = len(output.split("\n")) - 1
         devices = output.split("\n")[1:]
@@ -74,35 +420,91 @@ class ADB:
         :param device_id: str -- The device ID
         :return: str -- The state of the device
         """
-        result = subprocess.run(
-            [self.__adb_path, "-s", device_id, "get-state"],
-            capture_output=True,
-            text=True,
-        )
+        if self.__tracking():
+            record = self.__tracker.get(device_id)
+            return record.state if record is not None else ""
+        self.ensure_server()
+        if self.__client is not None:
+            try:
+                return self.__client.get_state(device_id).strip()
+            except ADBClientError:
+                pass
+        result = self.__run_adb(["-s", device_id, "get-state"])
         return result.stdout.strip()
 
+    @staticmethod
+    def parse_getprop(output: str) -> dict:
+        """Parse the output of a bare getprop call
+        :param output: str -- Lines like [ro.product.model]: [Pixel 7]
+        :return: dict -- The properties
+        """
+        return dict(GETPROP_LINE.findall(output))
+
+    def get_device_props(self, device_id: str, refresh: bool = False) -> dict:
+        """Get a snapshot of all system properties of a device with one getprop call
+        :param device_id: str -- The device ID
+        :param refresh: bool -- Ignore the cached snapshot
+        :return: dict -- The properties of the device
+        """
+        now = time.monotonic()
+        tracking = self.__tracking()
+        if not refresh:
+            if tracking:
+                # The tracker drops cached props whenever the device reconnects
+                record = self.__tracker.get(device_id)
+                if record is not None and record.props is not None:
+                    return record.props
+            with self.__prop_lock:
+                cached = self.__prop_cache.get(device_id)
+            if cached is not None and now - cached[0] < self.PROP_CACHE_TTL:
+                return cached[1]
+        result = self.__shell(device_id, "getprop")
+        props = self.parse_getprop(result.stdout)
+        if result.returncode == 0 and props:
+            with self.__prop_lock:
+                self.__prop_cache[device_id] = (now, props)
+            if tracking:
+                self.__tracker.set_props(device_id, props)
+        return props
+
+    def get_device_prop(self, device_id: str, key: str, default: str = "") -> str:
+        """Get a single system property from the cached snapshot
+        :param device_id: str -- The device ID
+        :param key: str -- The property name
+        :return: str -- The property value
+        """
+        return self.get_device_props(device_id).get(key, default)
+
+    def invalidate_device_props(self, device_id: str | None = None) -> None:
+        """Drop the cached properties of a device (or of all devices)
+        :param device_id: str -- The device ID, None for all devices
+        :return: None
+        """
+        with self.__prop_lock:
+            if device_id is None:
+                self.__prop_cache.clear()
+            else:
+                self.__prop_cache.pop(device_id, None)
+
     def __get_device_model(self, device_id: str) -> str:
         """Get the model of a device
         :param device_id: str -- The device ID
         :return: str -- The model of the device
         """
-        result = subprocess.run(
-            [self.__adb_path, "-s", device_id, "shell", "getprop", "ro.product.model"],
-            capture_output=True,
-            text=True,
-        )
-        return result.stdout.strip()
+        return self.get_device_prop(device_id, "ro.product.model")
 
     def __get_device_serial(self, device_id: str) -> str:
         """Get the serial number of a device
         :param device_id: str -- The device ID
         :return: str -- The serial number of the device
         """
-        result = subprocess.run(
-            [self.__adb_path, "-s", device_id, "get-serialno"],
-            capture_output=True,
-            text=True,
-        )
+        self.ensure_server()
+        if self.__client is not None:
+            try:
+                return self.__client.get_serialno(device_id).strip()
+            except ADBClientError:
+                pass
+        result = self.__run_adb(["-s", device_id, "get-serialno"])
         return result.stdout.strip()
 
     def __get_device_android_version(self, device_id: str) -> str:
@@ -110,57 +512,21 @@ class ADB:
         :param device_id: str -- The device ID
         :return: str -- The android version of the device
         """
-        result = subprocess.run(
-            [
-                self.__adb_path,
-                "-s",
-                device_id,
-                "shell",
-                "getprop",
-                "ro.build.version.release",
-            ],
-            capture_output=True,
-            text=True,
-        )
-        return result.stdout.strip()
+        return self.get_device_prop(device_id, "ro.build.version.release")
 
     def __get_device_android_sdk_version(self, device_id: str) -> str:
         """Get the android sdk version of a device
         :param device_id: str -- The device ID
         :return: str -- The android sdk version of the device
         """
-        result = subprocess.run(
-            [
-                self.__adb_path,
-                "-s",
-                device_id,
-                "shell",
-                "getprop",
-                "ro.build.version.sdk",
-            ],
-            capture_output=True,
-            text=True,
-        )
-        return result.stdout.strip()
+        return self.get_device_prop(device_id, "ro.build.version.sdk")
 
     def __get_device_manufacturer(self, device_id: str) -> str:
         """Get the manufacturer of a device
         :param device_id: str -- The device ID
         :return: str -- The manufacturer of the device
         """
-        result = subprocess.run(
-            [
-                self.__adb_path,
-                "-s",
-                device_id,
-                "shell",
-                "getprop",
-                "ro.product.manufacturer",
-            ],
-            capture_output=True,
-            text=True,
-        )
-        return result.stdout.strip()
+        return self.get_device_prop(device_id, "ro.product.manufacturer")
 
     def get_device_info_dict(self, device_id: str, *args) -> dict:
         """Get all information of a device
@@ -169,7 +535,8 @@ class ADB:
         """
         return {
             "model": self.__get_device_model(device_id),
-            "serial": self.__get_device_serial(device_id),
+            # adb -s <id> get-serialno always answers <id>, skip the round trip
+            "serial": device_id or self.__get_device_serial(device_id),
             "android_version": self.__get_device_android_version(device_id),
             "android_sdk_version": self.__get_device_android_sdk_version(device_id),
             "manufacturer": self.__get_device_manufacturer(device_id),
@@ -183,24 +550,565 @@ class ADB:
         device_info = self.get_device_info_dict(device_id)
         return f"{Style.BOLD}Name:{Style.RESET} {device_info['manufacturer']} {device_info['model']} SDK-{device_info['android_sdk_version']}\n{Style.BOLD}Serial:{Style.RESET} {device_info['serial']}\n{Style.BOLD}Android Version:{Style.RESET} {device_info['android_version']}"
 
-    def run_adb_command(self, *args) -> str:
+    # Past this many changed packages one bulk dumpsys beats one per package
+    BULK_DUMP_AFTER = 50
+
+    def get_packages(self, device_id: str, refresh: bool = True, full: bool = False) -> tuple[dict, str]:
+        """The installed-package index of a device, refreshed incrementally
+        :param device_id: str -- The device ID
+        :param refresh: bool -- Diff against a fresh `pm list packages`, else trust the stored index
+        :param full: bool -- Rebuild from a bulk dump even if an index is stored
+        :return: tuple[dict, str] -- package -> record, and what was done to get it
+        """
+        if not refresh and not full:
+            # Not even getprop: whatever build the index was made on
+            index = self.__inventory.load(device_id)
+            if index is not None:
+                return index["packages"], "cached"
+        fingerprint = self.get_device_prop(device_id, "ro.build.fingerprint")
+        index = None if full else self.__inventory.load(device_id, fingerprint)
+
+        if index is None:
+            # Everything in one round trip: the package list, then every package's details
+            result = self.__shell(
+                device_id, f"{PM_LIST_COMMAND}; echo {DUMP_MARKER}; dumpsys package packages"
+            )
+            listed_output, _, dump = result.stdout.partition(DUMP_MARKER)
+            listed = parse_pm_list(listed_output)
+            if not listed:
+                raise RuntimeError(f"pm list packages failed: {result.stderr.strip() or listed_output.strip()}")
+            details = parse_dumpsys_packages(dump)
+            packages = {name: merge_package(entry, details.get(name)) for name, entry in listed.items()}
+            self.__inventory.save(device_id, fingerprint, packages)
+            return packages, f"built ({len(packages)} packages)"
+
+        result = self.__shell(device_id, PM_LIST_COMMAND)
+        listed = parse_pm_list(result.stdout)
+        if not listed:
+            raise RuntimeError(f"pm list packages failed: {result.stderr.strip() or result.stdout.strip()}")
+        known = index["packages"]
+        changed, removed = PackageInventory.diff(known, listed)
+        if not changed and not removed:
+            return known, "up-to-date"
+        packages = {name: record for name, record in known.items() if name in listed}
+        if changed:
+            if len(changed) > self.BULK_DUMP_AFTER:
+                command = "dumpsys package packages"
+            else:
+                command = "; ".join(f"dumpsys package {shlex.quote(name)}" for name in changed)
+            details = parse_dumpsys_packages(self.__shell(device_id, command).stdout)
+            for name in changed:
+                packages[name] = merge_package(listed[name], details.get(name))
+        self.__inventory.save(device_id, fingerprint, packages)
+        return packages, f"refreshed (+{len(changed)} -{len(removed)})"
+
+    def __query_packages(self, device_id: str, cli_args) -> tuple[int, list, str]:
+        packages, how = self.get_packages(device_id, refresh=not cli_args.cached, full=cli_args.full)
+        matches = PackageInventory.query(
+            packages,
+            name=cli_args.name,
+            version=cli_args.version,
+            uid=cli_args.uid,
+            debuggable=True if cli_args.debuggable else None,
+        )
+        return 0, matches, how
+
+    def list_packages(self, *args) -> None:
+        """Query the package inventory of the selected devices
+        :return: None
+        """
+        cli_args = args[0]
+        for result in fan_out(
+            self.select_devices(cli_args),
+            lambda device_id: self.__query_packages(device_id, cli_args),
+            cli_args.jobs,
+        ):
+            ADBView.print_packages(result)
+
+    def __resolve_apks(self, device_id: str, names: list[str], pattern: str | None) -> tuple[int, dict, str]:
+        """The APKs of the selected packages on one device, with their on-device hashes
+        :return: tuple[int, dict, str] -- The exit code, package -> [{"path", "sha256", "size"}] and a summary
+        """
+        names = list(names)
+        if pattern:
+            packages, _ = self.get_packages(device_id)
+            names += [record["package"] for record in PackageInventory.query(packages, name=pattern)]
+        names = list(dict.fromkeys(names))
+        if not names:
+            return 0, {}, "no matching packages"
+        paths = parse_pm_path(self.__shell(device_id, resolve_command(names)).stdout)
+        if not paths:
+            return 1, {}, "none of the packages is installed"
+        remote_files = [path for package_paths in paths.values() for path in package_paths]
+        # Hash before transferring anything, so nothing already pulled crosses the wire again
+        hashes = parse_hashes(self.__shell(device_id, hash_command(remote_files)).stdout)
+        apks = {
+            package: [
+                {"path": path, "sha256": hashes.get(path, (None, None))[0], "size": hashes.get(path, (None, None))[1]}
+                for path in package_paths
+            ]
+            for package, package_paths in paths.items()
+        }
+        missing = len(names) - len(apks)
+        return 0, apks, f"{len(apks)} package(s), {len(remote_files)} APK(s)" + (
+            f", {missing} not installed" if missing else ""
+        )
+
+    def __pull_apk(self, device_id: str, apk: dict) -> tuple[int, bool]:
+        """Pull one APK into the store, resuming a partial transfer
+        :return: tuple[int, bool] -- Bytes transferred and whether it was resumed
+        """
+        store = self.__apk_store
+        sha256 = apk["sha256"]
+        if self.__client is None or sha256 is None:
+            # Unknown hash: pull to a scratch file and store it under the hash it turns out to have
+            part = store.part_path(sha256) if sha256 else store.scratch_path(device_id, apk["path"])
+            if self.__client is None:
+                result = self.__run_adb(["-s", device_id, "pull", apk["path"], part])
+                if result.returncode != 0:
+                    raise ADBClientError(result.stderr.strip() or result.stdout.strip())
+            else:
+                with open(part, "wb") as f, self.__client.sync(device_id) as session:
+                    session.recv(apk["path"], f)
+            size = os.path.getsize(part)
+            apk["sha256"] = store.commit(sha256, part)
+            return size, False
+
+        offset = store.part_size(sha256)
+        if offset and apk["size"] is not None and offset <= apk["size"]:
+            # The sync protocol can't start mid-file, tail can
+            transferred = 0
+            with store.open_part(sha256) as f:
+                for packet_id, payload in self.__client.shell_stream(
+                    device_id, f"tail -c +{offset + 1} {shlex.quote(apk['path'])}"
+                ):
+                    if packet_id == SHELL_STDOUT:
+                        f.write(payload)
+                        transferred += len(payload)
+                    elif packet_id == SHELL_EXIT and payload and payload[0] != 0:
+                        raise ADBClientError(f"{apk['path']}: tail exited with {payload[0]}")
+            try:
+                store.commit(sha256)
+                return transferred, True
+            except ValueError:
+                # The part didn't belong to this content after all, start over
+                pass
+        with store.open_part(sha256, resume=False) as f, self.__client.sync(device_id) as session:
+            transferred = session.recv(apk["path"], f)
+        store.commit(sha256)
+        return transferred, False
+
+    def __pull_apks_from(self, device_id: str, apks: list[dict]) -> tuple[int, str]:
+        """Pull the APKs one device was picked as the source for
+        :return: tuple[int, str] -- The exit code and a transfer summary
+        """
+        self.ensure_server()
+        start = time.perf_counter()
+        transferred = resumed = 0
+        errors = []
+        for apk in apks:
+            try:
+                size, was_resumed = self.__pull_apk(device_id, apk)
+            except (ADBClientError, OSError, ValueError) as e:
+                errors.append(f"{apk['path']}: {e}")
+                continue
+            transferred += size
+            resumed += was_resumed
+        elapsed = time.perf_counter() - start
+        summary = f"{len(apks) - len(errors)}/{len(apks)} APK(s) pulled, {transferred} bytes in {elapsed:.2f}s"
+        if resumed:
+            summary += f", {resumed} resumed"
+        return (1 if errors else 0), "\n".join([summary, *errors])
+
+    def pull_apks(self, *args) -> None:
+        """Pull the APKs (base and splits) of packages from the selected devices
+
+        Every APK is identified by its on-device sha256 first. Each distinct
+        APK is then pulled once, from whichever device holding it has the
+        least to transfer, and stored content-addressed in apks/objects.
+        :return: None
+        """
+        cli_args = args[0]
+        if not cli_args.packages and not cli_args.name:
+            print(f"{Style.RED}[Error] Name packages or pass -n/--name{Style.RESET}")
+            OUTPUT.fail()
+            return
+        start = time.perf_counter()
+        resolved: dict[str, dict] = {}
+        summaries: dict[str, str] = {}
+        for result in fan_out(
+            self.select_devices(cli_args),
+            lambda device_id: self.__resolve_apks(device_id, cli_args.packages, cli_args.name),
+            cli_args.jobs,
+        ):
+            if result.ok:
+                resolved[result.device] = result.output
+                summaries[result.device] = result.status
+            else:
+                ADBView.print_device_result(result)
+
+        # sha256 -> the APK entries of every device holding it
+        holders: dict[str, list[tuple[str, dict]]] = {}
+        assigned: dict[str, list[dict]] = {device_id: [] for device_id in resolved}
+        assigned_bytes = dict.fromkeys(resolved, 0)
+        for device_id, packages in resolved.items():
+            for apks in packages.values():
+                for apk in apks:
+                    if apk["sha256"] is None:
+                        assigned[device_id].append(apk)
+                    else:
+                        holders.setdefault(apk["sha256"], []).append((device_id, apk))
+        stored = 0
+        for sha256, holding in holders.items():
+            if self.__apk_store.has(sha256):
+                stored += 1
+                continue
+            # Spread the transfers over the devices holding the APK
+            device_id, apk = min(holding, key=lambda holder: assigned_bytes[holder[0]])
+            assigned[device_id].append(apk)
+            assigned_bytes[device_id] += apk["size"] or 0
+        if holders:
+            print(
+                f"{Style.GREEN}[INFO] {len(holders)} distinct APK(s), {stored} already stored, "
+                f"{len(holders) - stored} to pull{Style.RESET}"
+            )
+
+        pulled = {}
+        for result in fan_out(
+            [device_id for device_id, apks in assigned.items() if apks],
+            lambda device_id: self.__pull_apks_from(device_id, assigned[device_id]),
+            cli_args.jobs,
+        ):
+            pulled[result.device] = result
+
+        for device_id, packages in resolved.items():
+            complete = {
+                package: [dict(apk, object=self.__apk_store.object_path(apk["sha256"])) for apk in apks]
+                for package, apks in packages.items()
+                if all(apk["sha256"] and self.__apk_store.has(apk["sha256"]) for apk in apks)
+            }
+            self.__apk_store.record(device_id, complete)
+            transfer = pulled.get(device_id)
+            status = f"{summaries[device_id]}; " + (transfer.output if transfer else "nothing to transfer")
+            if len(complete) < len(packages):
+                status += f"\n{len(packages) - len(complete)} package(s) not fully stored"
+            returncode = 1 if len(complete) < len(packages) or (transfer and not transfer.ok) else 0
+            ADBView.print_apks(
+                DeviceResult(
+                    device_id,
+                    returncode,
+                    complete,
+                    transfer.elapsed if transfer else 0.0,
+                    transfer.error if transfer else None,
+                    status,
+                )
+            )
+        print(f"{Style.GREEN}[INFO] Done in {time.perf_counter() - start:.2f}s{Style.RESET}")
+
+    # Seconds a process table is trusted before the next lookup polls /proc
+    PROCESS_TABLE_TTL = 0.5
+
+    def get_process_table(self, device_id: str, max_age: float | None = None) -> ProcessTable:
+        """The process table of a device, from one ps snapshot kept current by polling /proc
+        :param device_id: str -- The device ID
+        :param max_age: float -- Seconds the table may be old before it is polled (default: PROCESS_TABLE_TTL)
+        :return: ProcessTable -- The table
+        """
+        max_age = self.PROCESS_TABLE_TTL if max_age is None else max_age
+        with self.__process_lock:
+            table = self.__process_tables.get(device_id)
+        if table is not None:
+            if time.monotonic() - table.updated_at < max_age:
+                return table
+            result = self.__shell(device_id, poll_command(table.provisional()))
+            boot_id, live, processes = parse_poll(result.stdout)
+            if result.returncode == 0 and live and boot_id == table.boot_id:
+                added = sorted(live - table.pids())
+                if added:
+                    command = f"ps -o {PS_COLUMNS} -p {','.join(map(str, added))}"
+                    processes.update(parse_ps(self.__shell(device_id, command).stdout))
+                table.update(live, processes)
+                return table
+        # First lookup, a reboot or a failed poll
+        result = self.__shell(device_id, SNAPSHOT_COMMAND)
+        boot_id, _, listing = result.stdout.partition("\n")
+        processes = parse_ps(listing)
+        if not processes:
+            raise RuntimeError(f"ps failed: {result.stderr.strip() or result.stdout.strip()}")
+        table = ProcessTable(boot_id.strip(), processes)
+        with self.__process_lock:
+            self.__process_tables[device_id] = table
+        return table
+
+    def find_processes(
+        self,
+        device_id: str,
+        package: str | None = None,
+        name: str | None = None,
+        uid: int | None = None,
+        max_age: float | None = None,
+    ) -> list[dict]:
+        """Processes of a device by package, name or UID, from the process table
+        :param device_id: str -- The device ID
+        :param package: str -- The package, matches its main and :child processes
+        :param name: str -- The exact process name
+        :param uid: int -- The UID
+        :param max_age: float -- Seconds the table may be old (default: PROCESS_TABLE_TTL)
+        :return: list[dict] -- {"pid", "ppid", "uid", "name"}, a package's main process first
+        """
+        return self.get_process_table(device_id, max_age).find(package, name, uid)
+
+    def wait_for_process(
+        self,
+        device_id: str,
+        package: str | None = None,
+        name: str | None = None,
+        uid: int | None = None,
+        timeout: float = 10.0,
+        new: bool = False,
+        interval: float = 0.05,
+    ) -> dict | None:
+        """Wait for a matching process to exist, polling /proc
+        :param device_id: str -- The device ID
+        :param package: str -- The package, matches its main and :child processes
+        :param name: str -- The exact process name
+        :param uid: int -- The UID
+        :param timeout: float -- Seconds to wait
+        :param new: bool -- Ignore the processes that already match, wait for a new one (a reused or renamed PID is new)
+        :param interval: float -- Seconds between polls
+        :return: dict | None -- The first match, None on timeout
+        """
+        deadline = time.monotonic() + timeout
+        table = self.get_process_table(device_id, max_age=0)
+        ignored = {(process["pid"], process["name"]) for process in table.find(package, name, uid)} if new else set()
+        while True:
+            matches = [
+                process
+                for process in table.find(package, name, uid)
+                if (process["pid"], process["name"]) not in ignored
+            ]
+            if matches:
+                return matches[0]
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(interval)
+            table = self.get_process_table(device_id, max_age=0)
+
+    def __query_processes(self, device_id: str, cli_args) -> tuple[int, list, str]:
+        criteria = {"package": cli_args.package, "name": cli_args.name, "uid": cli_args.uid}
+        if cli_args.wait is None:
+            matches = self.find_processes(device_id, **criteria)
+            return 0, matches, f"{len(matches)} process(es)"
+        start = time.perf_counter()
+        process = self.wait_for_process(device_id, **criteria, timeout=cli_args.wait, new=cli_args.new)
+        if process is None:
+            return 1, [], f"no matching process after {cli_args.wait:g}s"
+        return 0, [process], f"found after {(time.perf_counter() - start) * 1000:.0f} ms"
+
+    def list_processes(self, *args) -> None:
+        """Look up processes on the selected devices, optionally waiting for one to start
+        :return: None
+        """
+        cli_args = args[0]
+        for result in fan_out(
+            self.select_devices(cli_args),
+            lambda device_id: self.__query_processes(device_id, cli_args),
+            cli_args.jobs,
+        ):
+            ADBView.print_processes(result)
+
+    def select_devices(self, cli_args) -> list[str]:
+        """Resolve the --device/--devices/--all/--match options to device IDs
+        :param cli_args: argparse.Namespace -- The parsed arguments
+        :return: list[str] -- The selected device IDs
+        """
+        if not (cli_args.all or cli_args.devices or cli_args.match):
+            return [cli_args.device]
+        if cli_args.devices:
+            devices = [d.strip() for d in cli_args.devices.split(",") if d.strip()]
+        else:
+            # Only devices that are online, skip unauthorized/offline ones
+            devices = [d for d in self.list_devices()[1] if "\t" not in d]
+        if cli_args.match:
+            pattern = re.compile(cli_args.match)
+            devices = [d for d in devices if pattern.search(d)]
+        return devices
+
+    def run_adb_command(self, *args) -> DeviceResult | CommandStream | Iterator[DeviceResult]:
         """Run an adb command on a device
         :param device_id: str -- The device ID
         :param command: str -- The command to run
-        :return: str -- The output of the command
+        :return: DeviceResult | CommandStream | Iterator[DeviceResult] -- The result, the live output or one result per device
         """
         # Check args.device
         command_args = args[0]
+        if command_args.all or command_args.devices or command_args.match:
+            return fan_out(
+                self.select_devices(command_args),
+                lambda device_id: self.__run_shell_command(
+                    device_id, command_args.command
+                ),
+                command_args.jobs,
+            )
+
+        if command_args.stream:
+            return self.stream_adb_command(
+                command_args.device,
+                command_args.command,
+                raw=command_args.raw,
+                max_bytes=command_args.max_bytes,
+                timeout=command_args.timeout,
+            )
+
+        start = time.perf_counter()
+        result = self.__shell(command_args.device, command_args.command, pooled=False)
+        output = result.stdout.strip() if result.returncode == 0 else result.stderr.strip()
+        return DeviceResult(command_args.device, result.returncode, output, time.perf_counter() - start)
+
+    def stream_adb_command(
+        self,
+        device_id: str,
+        command: str,
+        raw: bool = False,
+        max_bytes: int | None = None,
+        timeout: float | None = None,
+    ) -> CommandStream:
+        """Run a command on a device and stream its output as it is produced
+        :param device_id: str -- The device ID
+        :param command: str -- The command to run
+        :param raw: bool -- Yield raw byte chunks instead of decoded lines
+        :param max_bytes: int -- Stop the command after this much stdout
+        :param timeout: float -- Stop the command after this many seconds
+        :return: CommandStream -- Iterate it to get the output
+        """
+        self.ensure_server()
+        deadline = time.monotonic() + timeout if timeout else None
+
+        def packets():
+            if self.__client is not None:
+                stream = self.__client.shell_stream(device_id, command, deadline)
+                try:
+                    # Only fall back if the command never started, a started
+                    # one is never run twice
+                    first = next(stream)
+                except ADBConnectError:
+                    stream = None
+                except StopIteration:
+                    return
+                if stream is not None:
+                    yield first
+                    yield from stream
+                    return
+            with span("adb.exec", device=device_id, command=f"shell {command}"):
+                yield from popen_packets(
+                    [self.__adb_path, "-s", device_id, "shell", command], deadline
+                )
 
-        result = subprocess.run(
-            [self.__adb_path, "-s", command_args.device, "shell", command_args.command],
-            capture_output=True,
-            text=True,
+        return CommandStream(packets(), raw=raw, max_bytes=max_bytes)
+
+    def track_devices(self, *args) -> None:
+        """Print device connect/disconnect/state changes until interrupted
+        :return: None
+        """
+        tracker = self.start_tracking()
+        if tracker is None:
+            print(f"{Style.RED}[Error] Device tracking needs the adb server protocol client{Style.RESET}")
+            OUTPUT.fail()
+            return
+        ADBView.print_devices(self.list_devices())
+        tracker.on_change(ADBView.print_device_event)
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            tracker.stop()
+
+    def __capture_logcat(
+        self, device_id: str, cli_args, log_filter: LogFilter, path: str | None, stop: threading.Event
+    ) -> tuple[int, str]:
+        stream = self.stream_adb_command(
+            device_id, "logcat -B" + (" -d" if cli_args.dump else ""), raw=True, timeout=cli_args.timeout
+        )
+        parser = LogcatParser(log_filter)
+        formatter = ThreadtimeFormatter()
+        writer = (
+            RotatingLogWriter(path, cli_args.max_size * 1024 * 1024, cli_args.backups, cli_args.compress)
+            if path
+            else None
+        )
+        chunks = iter(stream)
+        try:
+            for chunk in chunks:
+                entries = parser.feed(chunk)
+                if entries and OUTPUT.structured and writer is None:
+                    # Records straight from the decoded fields, nothing is formatted
+                    for entry in entries:
+                        OUTPUT.emit({"type": "log", "device": device_id, **entry.to_dict()})
+                elif entries:
+                    text = formatter.format_all(entries)
+                    if writer is not None:
+                        writer.write(text)
+                        writer.flush()
+                    else:
+                        sys.stdout.write(text)
+                        sys.stdout.flush()
+                if stop.is_set():
+                    break
+        finally:
+            chunks.close()
+            if writer is not None:
+                writer.close()
+        summary = f"{parser.kept}/{parser.read} entries kept" + (f" -> {path}" if path else "")
+        if stream.returncode not in (None, 0) and not stop.is_set():
+            return stream.returncode, f"{stream.stderr.strip()} ({summary})"
+        return 0, summary
+
+    def capture_logcat(self, *args) -> None:
+        """Stream binary logcat from the selected devices, filtered and optionally written to rotated files
+        :return: None
+        """
+        cli_args = args[0]
+        devices = self.select_devices(cli_args)
+        if len(devices) > 1 and not cli_args.output:
+            print(f"{Style.RED}[Error] Capturing from several devices needs --output <directory>{Style.RESET}")
+            OUTPUT.fail()
+            return
+        log_filter = LogFilter(cli_args.tag, PRIORITIES[cli_args.priority], cli_args.pid)
+
+        def path_for(device_id):
+            if not cli_args.output:
+                return None
+            # One file per device when capturing from more than one
+            return os.path.join(cli_args.output, f"{device_id}.log") if len(devices) > 1 else cli_args.output
+
+        stop = threading.Event()
+        worker = threading.Thread(
+            target=lambda: [
+                ADBView.print_device_result(result)
+                for result in fan_out(
+                    devices,
+                    lambda device_id: self.__capture_logcat(
+                        device_id, cli_args, log_filter, path_for(device_id), stop
+                    ),
+                    cli_args.jobs,
+                )
+            ],
+            daemon=True,
         )
-        # Check if the command is valid
+        worker.start()
+        try:
+            while worker.is_alive():
+                worker.join(0.5)
+        except KeyboardInterrupt:
+            stop.set()
+            worker.join(5)
+
+    def __run_shell_command(self, device_id: str, command: str) -> tuple[int, str]:
+        # User commands keep a shell of their own, as with the adb binary: a pooled
+        # session would close their stdin and cut them off after COMMAND_TIMEOUT
+        result = self.__shell(device_id, command, pooled=False)
         if result.returncode != 0:
-            return f"{Style.RED}[Error] {result.stderr.strip()}{Style.RESET}"
-        return result.stdout.strip()
+            return result.returncode, result.stderr.strip() or result.stdout.strip()
+        return 0, result.stdout.strip()
 
     def __push_file(self, device_id: str, local_file: str, remote_file: str) -> str:
         """Push a file to a device
@@ -209,126 +1117,225 @@ class ADB:
         :param remote_file: str -- The path to the remote file
         :return: str -- The output of the command
         """
-        result = subprocess.run(
-            [self.__adb_path, "-s", device_id, "push", local_file, remote_file],
-            capture_output=True,
-            text=True,
-        )
+        self.ensure_server()
+        if self.__client is not None:
+            try:
+                size = self.__client.push(device_id, local_file, remote_file)
+                return f"{local_file}: 1 file pushed. ({size} bytes)"
+            except (ADBClientError, OSError):
+                pass
+        result = self.__run_adb(["-s", device_id, "push", local_file, remote_file])
+        if result.returncode != 0:
+            raise RuntimeError(f"push failed: {result.stderr.strip() or result.stdout.strip()}")
         return result.stdout.strip()
 
+    def __push_data(self, device_id: str, data: bytes, remote_file: str) -> str:
+        """Push in-memory content to a file on a device
+        :param device_id: str -- The device ID
+        :param data: bytes -- The file content
+        :param remote_file: str -- The path to the remote file
+        :return: str -- The output of the command
+        """
+        self.ensure_server()
+        if self.__client is not None:
+            try:
+                size = self.__client.push_stream(device_id, io.BytesIO(data), remote_file)
+                return f"1 file pushed. ({size} bytes)"
+            except ADBClientError:
+                pass
+        # The adb binary can only push files
+        with tempfile.TemporaryDirectory() as tmp:
+            local_file = os.path.join(tmp, os.path.basename(remote_file))
+            with open(local_file, "wb") as f:
+                f.write(data)
+            return self.__push_file(device_id, local_file, remote_file)
+
+    def __sync_tree(self, device_id: str, direction: str, source: str, target: str, checksum: bool) -> tuple[int, str]:
+        """Push or pull a tree to/from one device, only transferring what changed
+        :return: tuple[int, str] -- The exit code and a transfer summary
+        """
+        self.ensure_server()
+        if self.__client is not None:
+            try:
+                file_sync = FileSync(self.__client)
+                if direction == "push":
+                    stats = file_sync.push(device_id, source, target, checksum)
+                else:
+                    stats = file_sync.pull(device_id, source, target, checksum)
+                return 0, str(stats)
+            except ADBClientError as e:
+                if self.__client_reachable():
+                    return 1, f"{Style.RED}[Error] {e}{Style.RESET}"
+        # The adb binary only knows "newer than" for pushes
+        command = ["push", "--sync"] if direction == "push" else ["pull"]
+        start = time.perf_counter()
+        result = self.__run_adb(["-s", device_id, *command, source, target])
+        output = (result.stdout + result.stderr).strip()
+        return result.returncode, f"{output} ({time.perf_counter() - start:.2f}s)"
+
+    def __client_reachable(self) -> bool:
+        try:
+            self.__client.version()
+            return True
+        except ADBClientError:
+            return False
+
+    def sync_push(self, *args) -> None:
+        """Push a file or directory tree to the selected devices
+        :return: None
+        """
+        cli_args = args[0]
+        for result in fan_out(
+            self.select_devices(cli_args),
+            lambda device_id: self.__sync_tree(
+                device_id, "push", cli_args.local, cli_args.remote, cli_args.checksum
+            ),
+            cli_args.jobs,
+        ):
+            ADBView.print_device_result(result)
+
+    def sync_pull(self, *args) -> None:
+        """Pull a file or directory tree from the selected devices
+        :return: None
+        """
+        cli_args = args[0]
+        devices = self.select_devices(cli_args)
+        for result in fan_out(
+            devices,
+            lambda device_id: self.__sync_tree(
+                device_id,
+                "pull",
+                cli_args.remote,
+                # Keep devices apart when pulling from more than one
+                os.path.join(cli_args.local, device_id) if len(devices) > 1 else cli_args.local,
+                cli_args.checksum,
+            ),
+            cli_args.jobs,
+        ):
+            ADBView.print_device_result(result)
+
     def install_ca_cert(self, *args) -> str:
-        """Install the Burp CA certificate on a device
+        """Install the Burp CA certificate on one or more devices
         :param device_id: str -- The device ID
         :return: str -- The output of the command
         """
         cli_args = args[0]
-        # Download the certificate
-        ca_cert_path = BurpHelper.download_certificate(
-            self.__cert_dir, cli_args.host, cli_args.port
+        devices = self.select_devices(cli_args)
+        listeners = cli_args.burp or [(cli_args.host, cli_args.port)]
+        # One (conditional) fetch per listener serves every device, conversion is cached too
+        certs = []
+        for (host, port), cert in self.get_ca_certs(listeners, refresh=cli_args.refresh).items():
+            if isinstance(cert, RequestException):
+                print(f"{Style.RED}[Error] Error downloading certificate from {host}:{port}: {cert}{Style.RESET}")
+                OUTPUT.fail()
+            elif isinstance(cert, CertificateError):
+                print(f"{Style.RED}[Error] {host}:{port}: {cert}{Style.RESET}")
+                OUTPUT.fail()
+            else:
+                print(f"{Style.GREEN}[SUCCESS] Using certificate {cert[1]}.0 from {host}:{port}{Style.RESET}")
+                certs.append(cert)
+        # Listeners of the same Burp serve the same CA
+        certs = list(dict.fromkeys(certs))
+        if not certs:
+            return
+
+        # Install on every selected device, reporting each one as it finishes
+        outcomes = {}
+        for result in fan_out(
+            devices,
+            lambda device_id: self.install_ca_certs_on(device_id, certs),
+            cli_args.jobs,
+        ):
+            ADBView.print_device_result(result)
+            status = result.status or FAILED
+            outcomes[status] = outcomes.get(status, 0) + 1
+        print(
+            f"{Style.BOLD}Summary:{Style.RESET} "
+            + ", ".join(f"{status}: {count}" for status, count in outcomes.items())
         )
-        # Convert the certificate from DER to PEM
-        pem_cert_path = os.path.join(self.__cert_dir, "burp_cacert.pem")
-        self.__crypt.convert_der_to_pem(ca_cert_path, pem_cert_path)
-        old_subject_hash = self.__crypt.extract_old_subject_hash(pem_cert_path)
+
+    def __install_ca_cert_on(
+        self, device_id: str, pem_cert: bytes, old_subject_hash: str
+    ) -> tuple[int, str, str]:
+        """Push and install a PEM certificate on a single device
+        :param device_id: str -- The device ID
+        :param pem_cert: bytes -- The PEM certificate
+        :param old_subject_hash: str -- The OpenSSL old subject hash of the certificate
+        :return: tuple[int, str, str] -- The exit code, the log and the outcome
+        """
+        log = []
+        # Go straight to what worked on this build before, else cheapest first
+        fingerprint = self.get_device_prop(device_id, "ro.build.fingerprint")
+        sdk = self.get_device_prop(device_id, "ro.build.version.sdk")
+        preferred = self.__remount_cache.get(fingerprint)
+        strategies = candidate_strategies(int(sdk) if sdk.isdigit() else 0, preferred)
+
+        # One cheap round trip: is this exact certificate already trusted where
+        # the strategy that would be used first puts it?
+        installed_cert_path = (
+            installed_path(strategies[0], old_subject_hash, CACERTS_DIR)
+            if strategies
+            else f"{CACERTS_DIR}/{old_subject_hash}.0"
+        )
+        result = self.__shell(device_id, f"md5sum {installed_cert_path} 2>/dev/null")
+        if result.returncode == 0 and result.stdout.split(" ", 1)[0] == hashlib.md5(pem_cert).hexdigest():
+            log.append(
+                f"{Style.GREEN}[INFO] {installed_cert_path} already installed, skipping{Style.RESET}"
+            )
+            return 0, "\n".join(log), ALREADY_INSTALLED
 
         # Push the certificate to the device
         remote_cert_path = f"/data/local/tmp/{old_subject_hash}.0"
-        self.__push_file(cli_args.device, pem_cert_path, remote_cert_path)
-        print(
-            f"{Style.GREEN}[SUCCESS] Pushed certificate to {remote_cert_path}{Style.RESET}\n"
-        )
-
-        # Install the certificate
-        result = subprocess.run(
-            [
-                self.__adb_path,
-                "-s",
-                cli_args.device,
-                "shell",
-                "su",
-                "-c",
-                f'"mount -o rw,remount /system && mv {remote_cert_path} /system/etc/security/cacerts/"',
-            ],
-            capture_output=True,
-            text=True,
+        self.__push_data(device_id, pem_cert, remote_cert_path)
+        log.append(
+            f"{Style.GREEN}[SUCCESS] Pushed certificate to {remote_cert_path}{Style.RESET}"
         )
-        if result.returncode != 0:
-            print(f"{Style.RED}[Error] {result.stderr.strip()}{Style.RESET}")
-            print(f"{Style.CYAN}[INFO] Trying to remount the file system{Style.RESET}")
-            # Find the mount point
-            root_mount_point = subprocess.run(
-                [
-                    self.__adb_path,
-                    "-s",
-                    cli_args.device,
-                    "shell",
-                    "su -c",
-                    "\"cat /proc/mounts | grep -i ' / '\"",
-                ],
-                capture_output=True,
-                text=True,
+
+        for strategy in strategies:
+            result = self.__shell(
+                device_id, strategy_script(strategy, remote_cert_path, CACERTS_DIR), root=True
             )
-            output = root_mount_point.stdout.strip()
-            if output == "":
-                print(f"{Style.RED}[Error] Could not find the mount point{Style.RESET}")
-            else:
-                mount_point = output.split(" ")[0]
-                print(
-                    f"{Style.GREEN}[SUCCESS] Found the mount point: {mount_point}{Style.RESET}"
-                )
-                # Remount the file system
-                print(f"{Style.CYAN}[INFO] Remounting the file system{Style.RESET}")
-                result = subprocess.run(
-                    [
-                        self.__adb_path,
-                        "-s",
-                        cli_args.device,
-                        "shell",
-                        "su -c",
-                        f'"mount -o rw,remount {mount_point}"',
-                    ],
-                    capture_output=True,
-                    text=True,
+            if result.returncode == 0:
+                if strategy != preferred:
+                    self.__remount_cache.put(fingerprint, strategy)
+                log.append(
+                    f"{Style.GREEN}[SUCCESS] Installed certificate on the device ({strategy}){Style.RESET}"
                 )
-                if result.returncode != 0:
-                    print(f"{Style.RED}[Error] {result.stderr.strip()}{Style.RESET}")
-                else:
-                    print(
-                        f"{Style.GREEN}[SUCCESS] Remounted the file system{Style.RESET}\n"
-                    )
-                    # Try to install the certificate again
-                    result = subprocess.run(
-                        [
-                            self.__adb_path,
-                            "-s",
-                            cli_args.device,
-                            "shell",
-                            "su",
-                            "-c",
-                            f'"mv {remote_cert_path} /system/etc/security/cacerts/"',
-                        ],
-                        capture_output=True,
-                        text=True,
-                    )
-                    if result.returncode != 0:
-                        print(
-                            f"{Style.RED}[Error] {result.stderr.strip()}{Style.RESET}"
-                        )
-                    else:
-                        print(
-                            f"{Style.GREEN}[SUCCESS] Installed certificate on the device{Style.RESET}"
-                        )
-        else:
-            print(
-                f"{Style.GREEN}[INFO] Installed certificate on the device{Style.RESET}"
+                return 0, "\n".join(log), INSTALLED
+            log.append(
+                f"{Style.RED}[Error] {strategy}: {result.stderr.strip() or result.stdout.strip()}{Style.RESET}"
             )
-
-        # Clean up the downloaded files
-        print(f"{Style.MAGENTA}[INFO] Cleaning up the downloaded files{Style.RESET}")
-        os.remove(ca_cert_path)
-        os.remove(pem_cert_path)
+            if strategy == preferred:
+                self.__remount_cache.forget(fingerprint)
+        log.append(f"{Style.RED}[Error] No way to install the certificate worked{Style.RESET}")
+        return 1, "\n".join(log), FAILED
 
     # Arg parser
+    @staticmethod
+    def add_device_arguments(parser: argparse.ArgumentParser):
+        parser.add_argument(
+            "-d", "--device", type=str, help="The device ID", required=False, default=""
+        )
+        parser.add_argument(
+            "--devices", type=str, help="Comma separated device IDs", default=""
+        )
+        parser.add_argument(
+            "--all", action="store_true", help="Target every connected device"
+        )
+        parser.add_argument(
+            "--match",
+            type=str,
+            help="Target connected devices whose ID matches this regex",
+            default="",
+        )
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            type=int,
+            help=f"How many devices to work on at once (default: {DEFAULT_JOBS})",
+            default=DEFAULT_JOBS,
+        )
+
     @staticmethod
     def add_parser(adb, subparsers):
         parser = subparsers.add_parser("adb", help="ADB commands")
@@ -338,30 +1345,180 @@ class ADB:
         devices_list_parser: argparse.ArgumentParser = subparsers.add_parser(
             "devices", help="List all connected devices"
         )
+        # Enumerate devices only when the subcommand actually runs
         devices_list_parser.set_defaults(
-            func=ADBView.print_devices, args=adb.list_devices()
+            func=ADBView.print_devices, child_func=adb.list_devices
+        )
+
+        # Follow device changes
+        track_parser = subparsers.add_parser(
+            "track", help="Print device connect/disconnect events as they happen"
         )
+        track_parser.set_defaults(func=adb.track_devices)
 
         # Run a command on a device
         run_parser = subparsers.add_parser("run", help="Run an adb command")
         # Run an adb command
+        ADB.add_device_arguments(run_parser)
         run_parser.add_argument(
-            "-d", "--device", type=str, help="The device ID", required=False, default=""
+            "-c", "--command", type=str, help="The command to run", required=True
         )
         run_parser.add_argument(
-            "-c", "--command", type=str, help="The command to run", required=True
+            "--stream",
+            action="store_true",
+            help="Print output as it arrives (single device only)",
+        )
+        run_parser.add_argument(
+            "--raw", action="store_true", help="Stream raw bytes instead of lines"
+        )
+        run_parser.add_argument(
+            "--max-bytes",
+            type=int,
+            help="Stop a streamed command after this many bytes of output",
+            default=None,
+        )
+        run_parser.add_argument(
+            "--timeout",
+            type=float,
+            help="Stop a streamed command after this many seconds",
+            default=None,
         )
         run_parser.set_defaults(
             func=ADBView.print_command_output, child_func=adb.run_adb_command
         )
 
+        # Sync files with devices
+        push_parser = subparsers.add_parser(
+            "push", help="Push a file or directory, only transferring what changed"
+        )
+        ADB.add_device_arguments(push_parser)
+        push_parser.add_argument("local", type=str, help="The local file or directory")
+        push_parser.add_argument("remote", type=str, help="The remote path")
+        push_parser.add_argument(
+            "--checksum",
+            action="store_true",
+            help="Compare md5 of same-size files instead of modification times",
+        )
+        push_parser.set_defaults(func=adb.sync_push)
+
+        pull_parser = subparsers.add_parser(
+            "pull", help="Pull a file or directory, only transferring what changed"
+        )
+        ADB.add_device_arguments(pull_parser)
+        pull_parser.add_argument("remote", type=str, help="The remote file or directory")
+        pull_parser.add_argument("local", type=str, help="The local path")
+        pull_parser.add_argument(
+            "--checksum",
+            action="store_true",
+            help="Compare md5 of same-size files instead of modification times",
+        )
+        pull_parser.set_defaults(func=adb.sync_pull)
+
+        # Capture logcat
+        logcat_parser = subparsers.add_parser(
+            "logcat", help="Capture logcat in binary form, filtered before formatting"
+        )
+        ADB.add_device_arguments(logcat_parser)
+        logcat_parser.add_argument(
+            "-t", "--tag", type=str, action="append", help="Only keep this tag (repeatable)"
+        )
+        logcat_parser.add_argument(
+            "-P",
+            "--priority",
+            choices=list(PRIORITIES),
+            default="V",
+            help="Minimum priority to keep (default: V)",
+        )
+        logcat_parser.add_argument(
+            "--pid", type=int, action="append", help="Only keep this PID (repeatable)"
+        )
+        logcat_parser.add_argument(
+            "-o",
+            "--output",
+            type=str,
+            help="Write to this file (a directory of <device>.log files for several devices)",
+        )
+        logcat_parser.add_argument(
+            "--max-size", type=int, default=16, help="Rotate files past this many MB (default: 16)"
+        )
+        logcat_parser.add_argument(
+            "--backups", type=int, default=5, help="Rotated files to keep (default: 5)"
+        )
+        logcat_parser.add_argument(
+            "--compress", action="store_true", help="gzip rotated files"
+        )
+        logcat_parser.add_argument(
+            "--dump", action="store_true", help="Dump the current log and exit"
+        )
+        logcat_parser.add_argument(
+            "--timeout", type=float, default=None, help="Stop after this many seconds"
+        )
+        logcat_parser.set_defaults(func=adb.capture_logcat)
+
+        # Query installed packages
+        packages_parser = subparsers.add_parser(
+            "packages", help="Query the installed packages, refreshed incrementally"
+        )
+        ADB.add_device_arguments(packages_parser)
+        packages_parser.add_argument(
+            "-n", "--name", type=str, help="Regex searched in the package name"
+        )
+        packages_parser.add_argument(
+            "--version", type=str, help="Exact versionName or versionCode"
+        )
+        packages_parser.add_argument("--uid", type=int, help="The app UID")
+        packages_parser.add_argument(
+            "--debuggable", action="store_true", help="Only debuggable packages"
+        )
+        packages_parser.add_argument(
+            "--cached",
+            action="store_true",
+            help="Answer from the stored index without asking the device",
+        )
+        packages_parser.add_argument(
+            "--full", action="store_true", help="Rebuild the index from a full dump"
+        )
+        packages_parser.set_defaults(func=adb.list_packages)
+
+        # Look up processes
+        ps_parser = subparsers.add_parser(
+            "ps", help="Look up processes by package, name or UID"
+        )
+        ADB.add_device_arguments(ps_parser)
+        ps_parser.add_argument(
+            "-p", "--package", type=str, help="The package (its main and :child processes)"
+        )
+        ps_parser.add_argument("-n", "--name", type=str, help="The exact process name")
+        ps_parser.add_argument("--uid", type=int, help="The UID")
+        ps_parser.add_argument(
+            "--wait",
+            type=float,
+            help="Wait up to this many seconds for a matching process to start",
+            default=None,
+        )
+        ps_parser.add_argument(
+            "--new",
+            action="store_true",
+            help="With --wait, ignore processes that are already running",
+        )
+        ps_parser.set_defaults(func=adb.list_processes)
+
+        # Pull APKs for static analysis
+        pull_apks_parser = subparsers.add_parser(
+            "pull-apks", help="Pull the APKs of packages, each distinct APK only once"
+        )
+        ADB.add_device_arguments(pull_apks_parser)
+        pull_apks_parser.add_argument("packages", nargs="*", help="Package names")
+        pull_apks_parser.add_argument(
+            "-n", "--name", type=str, help="Also pull packages whose name matches this regex"
+        )
+        pull_apks_parser.set_defaults(func=adb.pull_apks)
+
         # Install the Burp CA certificate on a device
         install_cert_parser = subparsers.add_parser(
             "install-cert", help="Install the Burp CA certificate on a device"
         )
-        install_cert_parser.add_argument(
-            "-d", "--device", type=str, help="The device ID", default=""
-        )
+        ADB.add_device_arguments(install_cert_parser)
         install_cert_parser.add_argument(
             "-u",
             "--host",
@@ -376,28 +1533,227 @@ class ADB:
             help="The port where Burp Suite is running (default: 8080)",
             default=8080,
         )
+        install_cert_parser.add_argument(
+            "--burp",
+            metavar="HOST:PORT",
+            action="append",
+            type=BurpHelper.parse_listener,
+            help="A Burp listener to take the CA from, repeatable; the listeners are fetched concurrently (overrides -u/-p)",
+        )
+        install_cert_parser.add_argument(
+            "--refresh",
+            action="store_true",
+            help="Revalidate the cached certificate with Burp even if it is fresh",
+        )
         install_cert_parser.set_defaults(func=adb.install_ca_cert)
         return parser
 
 
 class ADBView:
 
+    @staticmethod
+    def result_record(result: DeviceResult) -> dict:
+        return {
+            "type": "result",
+            "device": result.device,
+            "ok": result.ok,
+            "returncode": result.returncode,
+            "status": result.status,
+            "elapsed_ms": round(result.elapsed * 1000, 3),
+            "output": result.output,
+        }
+
     @staticmethod
     def print_devices(data: tuple[int, list]):
         count, devices = data
+        if OUTPUT.structured:
+            OUTPUT.emit({"type": "devices", "count": count, "devices": devices})
+            return
         print(f"{Style.BOLD}Connected devices: {count}{Style.RESET}")
         for device in devices:
             print(f" - {Style.GREEN}{device}{Style.RESET}")
 
     @staticmethod
     def print_device_info(device_info):
+        if OUTPUT.structured:
+            OUTPUT.emit({"type": "device-info", **device_info})
+            return
         print(f"{Style.BOLD}Device Info{Style.RESET}")
         print(device_info)
 
     @staticmethod
     def print_command_output(output):
-        print(f"{Style.BOLD}Output{Style.RESET}")
-        print(output)
+        if isinstance(output, CommandStream):
+            ADBView.print_command_stream(output)
+            return
+        if isinstance(output, DeviceResult):
+            if not output.ok:
+                OUTPUT.fail(output.returncode)
+            if OUTPUT.structured:
+                OUTPUT.emit(ADBView.result_record(output))
+            elif output.ok:
+                print(f"{Style.BOLD}Output{Style.RESET}")
+                print(output.output)
+            else:
+                print(f"{Style.RED}[Error] {output.output}{Style.RESET}")
+            return
+        # Per-device results from a fan-out, printed as each one finishes
+        for result in output:
+            ADBView.print_device_result(result)
+
+    @staticmethod
+    def print_command_stream(stream: CommandStream):
+        if OUTPUT.structured:
+            ADBView.emit_command_stream(stream)
+        else:
+            ADBView.write_command_stream(stream)
+        if stream.returncode:
+            OUTPUT.fail(stream.returncode)
+
+    @staticmethod
+    def write_command_stream(stream: CommandStream):
+        print(f"{Style.BOLD}Output{Style.RESET}", flush=True)
+        try:
+            for chunk in stream:
+                if isinstance(chunk, bytes):
+                    sys.stdout.buffer.write(chunk)
+                    sys.stdout.buffer.flush()
+                else:
+                    print(chunk, flush=True)
+        except KeyboardInterrupt:
+            return
+        if stream.stderr.strip():
+            print(f"{Style.RED}[Error] {stream.stderr.strip()}{Style.RESET}")
+        if stream.timed_out:
+            print(f"{Style.YELLOW}[INFO] Stopped after the timeout{Style.RESET}")
+        elif stream.truncated:
+            print(f"{Style.YELLOW}[INFO] Stopped after {stream.received} bytes{Style.RESET}")
+        elif stream.returncode:
+            print(f"{Style.RED}[Error] Exit code {stream.returncode}{Style.RESET}")
+
+    @staticmethod
+    def emit_command_stream(stream: CommandStream):
+        try:
+            for chunk in stream:
+                if isinstance(chunk, bytes):
+                    OUTPUT.emit({"type": "chunk", "data": base64.b64encode(chunk).decode()})
+                else:
+                    OUTPUT.emit({"type": "line", "line": chunk})
+        except KeyboardInterrupt:
+            pass
+        OUTPUT.emit(
+            {
+                "type": "exit",
+                "returncode": stream.returncode,
+                "stderr": stream.stderr.strip(),
+                "timed_out": stream.timed_out,
+                "truncated": stream.truncated,
+                "received": stream.received,
+            }
+        )
+
+    @staticmethod
+    def print_device_event(event: DeviceEvent):
+        if OUTPUT.structured:
+            OUTPUT.emit(
+                {
+                    "type": "device-event",
+                    "serial": event.serial,
+                    "old_state": event.old_state,
+                    "new_state": event.new_state,
+                }
+            )
+            return
+        if event.new_state is None:
+            print(f" - {Style.RED}{event.serial} disconnected{Style.RESET}")
+        elif event.old_state is None:
+            print(f" + {Style.GREEN}{event.serial} {event.new_state}{Style.RESET}")
+        else:
+            print(
+                f" * {Style.YELLOW}{event.serial} {event.old_state} -> {event.new_state}{Style.RESET}"
+            )
+
+    @staticmethod
+    def print_packages(result: DeviceResult):
+        if not result.ok:
+            ADBView.print_device_result(result)
+            return
+        if OUTPUT.structured:
+            for record in result.output:
+                OUTPUT.emit({"type": "package", "device": result.device, **record})
+            return
+        print(
+            f"{Style.BOLD}[{result.device}]{Style.RESET} {Style.GREEN}{result.status}{Style.RESET} "
+            f"({result.elapsed * 1000:.0f} ms), {len(result.output)} match(es)"
+        )
+        for record in result.output:
+            flag = f" {Style.YELLOW}debuggable{Style.RESET}" if record["debuggable"] else ""
+            print(
+                f" - {Style.GREEN}{record['package']}{Style.RESET} {record['version_name'] or '?'} "
+                f"({record['version_code']}) uid={record['uid']}{flag}"
+            )
+        print()
+
+    @staticmethod
+    def print_processes(result: DeviceResult):
+        if result.error is not None:
+            ADBView.print_device_result(result)
+            return
+        if not result.ok:
+            OUTPUT.fail(result.returncode)
+        if OUTPUT.structured:
+            for process in result.output:
+                OUTPUT.emit({"type": "process", "device": result.device, **process})
+            if not result.ok:
+                OUTPUT.emit(ADBView.result_record(result))
+            return
+        color = Style.GREEN if result.ok else Style.RED
+        print(
+            f"{Style.BOLD}[{result.device}]{Style.RESET} {color}{result.status}{Style.RESET} "
+            f"({result.elapsed * 1000:.0f} ms)"
+        )
+        for process in result.output:
+            print(
+                f" - {Style.GREEN}{process['pid']}{Style.RESET} {process['name']} "
+                f"ppid={process['ppid']} uid={process['uid']}"
+            )
+        print()
+
+    @staticmethod
+    def print_apks(result: DeviceResult):
+        if not result.ok:
+            OUTPUT.fail(result.returncode)
+        if OUTPUT.structured:
+            for package, apks in result.output.items():
+                for apk in apks:
+                    OUTPUT.emit({"type": "apk", "device": result.device, "package": package, **apk})
+            if not result.ok:
+                OUTPUT.emit({**ADBView.result_record(result), "output": result.status})
+            return
+        color = Style.GREEN if result.ok else Style.RED
+        print(f"{Style.BOLD}[{result.device}]{Style.RESET} {color}{result.status}{Style.RESET}")
+        for package, apks in result.output.items():
+            print(f" - {Style.GREEN}{package}{Style.RESET}")
+            for apk in apks:
+                print(f"     {os.path.basename(apk['path'])} -> {apk['object']}")
+        print()
+
+    @staticmethod
+    def print_device_result(result: DeviceResult):
+        if not result.ok:
+            OUTPUT.fail(result.returncode)
+        if OUTPUT.structured:
+            OUTPUT.emit(ADBView.result_record(result))
+            return
+        color = Style.GREEN if result.ok else Style.RED
+        outcome = result.status or f"exit={result.returncode}"
+        print(
+            f"{Style.BOLD}[{result.device}]{Style.RESET} {color}{outcome}{Style.RESET} "
+            f"({result.elapsed * 1000:.0f} ms)"
+        )
+        if result.output:
+            print(result.output)
+        print()
 
 
 # Test the ADB class
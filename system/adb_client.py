@@ -0,0 +1,591 @@
+import os
+import socket
+import time
+import struct
+import threading
+from typing import Callable
+from .trace import span
+
+ADB_HOST = os.getenv("ADB_SERVER_HOST", "127.0.0.1")
+ADB_PORT = int(os.getenv("ANDROID_ADB_SERVER_PORT", "5037"))
+
+# Shell protocol v2 packet ids
+SHELL_STDIN = 0
+SHELL_STDOUT = 1
+SHELL_STDERR = 2
+SHELL_EXIT = 3
+
+SYNC_DATA_MAX = 64 * 1024
+# Seconds an idle sync connection is kept before it is assumed stale
+SYNC_IDLE_TIMEOUT = 30.0
+
+
+class ADBClientError(Exception):
+    pass
+
+
+class ADBConnectError(ADBClientError):
+    """The request never reached the device: the adb server could not be
+    reached, or it refused the transport or the service. Retrying another
+    way can't run anything twice."""
+
+
+class ADBConnectionClosed(ADBClientError):
+    """The adb server closed the connection"""
+
+
+class ADBConnection:
+    """A single TCP connection to the adb server speaking the host protocol"""
+
+    def __init__(self, host: str, port: int, timeout: float | None):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # Bytes read so far, tells whether a reused connection answered yet
+        self.received = 0
+
+    def send_request(self, request: str) -> None:
+        """Send a length-prefixed request and wait for the OKAY/FAIL status
+        :param request: str -- The request, e.g. host:devices
+        :return: None
+        """
+        data = request.encode()
+        self.sock.sendall(b"%04x" % len(data) + data)
+        self.read_status()
+
+    def read_status(self) -> None:
+        status = self.read_exactly(4)
+        if status == b"OKAY":
+            return
+        if status == b"FAIL":
+            raise ADBClientError(self.read_string().decode(errors="replace"))
+        raise ADBClientError(f"Unexpected adb server status: {status!r}")
+
+    def read_string(self) -> bytes:
+        length = int(self.read_exactly(4), 16)
+        return self.read_exactly(length)
+
+    def read_exactly(self, size: int) -> bytes:
+        buf = bytearray()
+        while len(buf) < size:
+            chunk = self.sock.recv(size - len(buf))
+            if not chunk:
+                raise ADBConnectionClosed("Connection closed by adb server")
+            buf += chunk
+        self.received += size
+        return bytes(buf)
+
+    def alive(self) -> bool:
+        """Whether an idle connection is still open, without blocking
+
+        An idle connection has nothing to read: EOF means the server closed
+        it, and unexpected data means it is out of step with the protocol.
+        """
+        timeout = self.sock.gettimeout()
+        try:
+            self.sock.setblocking(False)
+            self.sock.recv(1, socket.MSG_PEEK)
+            return False
+        except BlockingIOError:
+            return True
+        except OSError:
+            return False
+        finally:
+            self.sock.settimeout(timeout)
+
+    def close(self) -> None:
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class ADBConnectionPool:
+    """Keep idle sync connections around so repeated pushes/stats to the same
+    device reuse one transport instead of reconnecting every time
+
+    A connection idle for longer than idle_timeout, or one the server has
+    closed meanwhile, is dropped instead of handed out.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        timeout: float | None,
+        max_idle: int = 4,
+        idle_timeout: float = SYNC_IDLE_TIMEOUT,
+    ):
+        self.__host = host
+        self.__port = port
+        self.__timeout = timeout
+        self.__max_idle = max_idle
+        self.__idle_timeout = idle_timeout
+        # key -> (connection, time.monotonic() it was released)
+        self.__idle: dict[str, list[tuple[ADBConnection, float]]] = {}
+        self.__lock = threading.Lock()
+
+    def connect(self) -> ADBConnection:
+        try:
+            return ADBConnection(self.__host, self.__port, self.__timeout)
+        except OSError as e:
+            raise ADBConnectError(f"Could not connect to adb server: {e}") from e
+
+    def acquire(self, key: str) -> ADBConnection | None:
+        while True:
+            with self.__lock:
+                idle = self.__idle.get(key)
+                if not idle:
+                    return None
+                conn, released_at = idle.pop()
+            if time.monotonic() - released_at < self.__idle_timeout and conn.alive():
+                return conn
+            conn.close()
+
+    def release(self, key: str, conn: ADBConnection) -> None:
+        with self.__lock:
+            idle = self.__idle.setdefault(key, [])
+            if len(idle) < self.__max_idle:
+                idle.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    def close(self) -> None:
+        with self.__lock:
+            for idle in self.__idle.values():
+                for conn, _ in idle:
+                    conn.close()
+            self.__idle.clear()
+
+
+class ADBClient:
+    """Pure Python client for the adb server host protocol (port 5037)
+
+    Talks to the already running adb server directly instead of spawning the
+    adb binary for every request.
+    """
+
+    def __init__(self, host: str = ADB_HOST, port: int = ADB_PORT, timeout: float | None = 10):
+        self.__pool = ADBConnectionPool(host, port, timeout)
+
+    def close(self) -> None:
+        self.__pool.close()
+
+    def __host_query(self, request: str) -> bytes:
+        conn = self.__pool.connect()
+        try:
+            with span("adb.host", command=request):
+                conn.send_request(request)
+                return conn.read_string()
+        except OSError as e:
+            raise ADBClientError(str(e)) from e
+        finally:
+            conn.close()
+
+    def __transport(self, serial: str) -> ADBConnection:
+        conn = self.__pool.connect()
+        try:
+            conn.send_request(f"host:transport:{serial}" if serial else "host:transport-any")
+        except (ADBClientError, OSError) as e:
+            conn.close()
+            raise ADBConnectError(str(e)) from e
+        return conn
+
+    def version(self) -> int:
+        """Get the adb server protocol version
+        :return: int -- The server version
+        """
+        return int(self.__host_query("host:version"), 16)
+
+    def devices(self) -> list[tuple[str, str]]:
+        """List all devices known to the adb server
+        :return: list[tuple[str, str]] -- (serial, state) pairs
+        """
+        return self.parse_devices(self.__host_query("host:devices").decode())
+
+    def track_devices(self):
+        """Follow device changes pushed by the adb server (host:track-devices)
+
+        Yields the complete device list every time it changes, starting with
+        the current one. Blocks until the server sends an update.
+        :return: Iterator[list[tuple[str, str]]] -- (serial, state) pairs
+        """
+        conn = self.__pool.connect()
+        try:
+            conn.send_request("host:track-devices")
+            # Updates can be hours apart, don't time out between them
+            conn.sock.settimeout(None)
+            while True:
+                yield self.parse_devices(conn.read_string().decode())
+        except OSError as e:
+            raise ADBClientError(str(e)) from e
+        finally:
+            conn.close()
+
+    @staticmethod
+    def parse_devices(output: str) -> list[tuple[str, str]]:
+        devices = []
+        for line in output.splitlines():
+            if "\t" in line:
+                serial, state = line.split("\t", 1)
+                devices.append((serial, state))
+        return devices
+
+    def get_serialno(self, serial: str) -> str:
+        return self.__host_query(f"host-serial:{serial}:get-serialno").decode()
+
+    def get_state(self, serial: str) -> str:
+        return self.__host_query(f"host-serial:{serial}:get-state").decode()
+
+    def shell(self, serial: str, command: str) -> tuple[int, bytes, bytes]:
+        """Run a shell command on a device using the shell v2 protocol
+        :param serial: str -- The device serial
+        :param command: str -- The command to run
+        :return: tuple[int, bytes, bytes] -- The exit code, stdout and stderr
+        """
+        with span("adb.shell", device=serial, command=command) as timing:
+            result = self.__shell(serial, command)
+            timing.tag(returncode=result[0])
+        return result
+
+    def __shell(self, serial: str, command: str) -> tuple[int, bytes, bytes]:
+        conn = self.__transport(serial)
+        stdout = bytearray()
+        stderr = bytearray()
+        exit_code = None
+        try:
+            conn.send_request(f"shell,v2,raw:{command}")
+        except (ADBClientError, OSError) as e:
+            conn.close()
+            raise ADBConnectError(str(e)) from e
+        try:
+            # The command is running now, however long it stays silent
+            conn.sock.settimeout(None)
+            while exit_code is None:
+                try:
+                    header = conn.read_exactly(5)
+                except ADBClientError:
+                    break
+                packet_id, length = struct.unpack("<BI", header)
+                payload = conn.read_exactly(length)
+                if packet_id == SHELL_STDOUT:
+                    stdout += payload
+                elif packet_id == SHELL_STDERR:
+                    stderr += payload
+                elif packet_id == SHELL_EXIT:
+                    exit_code = payload[0] if payload else 0
+        except OSError as e:
+            raise ADBClientError(str(e)) from e
+        finally:
+            conn.close()
+        if exit_code is None:
+            raise ADBClientError("Shell closed without an exit status")
+        return exit_code, bytes(stdout), bytes(stderr)
+
+    def open_shell(self, serial: str, command: str = "") -> ADBConnection:
+        """Start a shell v2 session and hand over its connection
+
+        With an empty command the device runs an interactive `sh` reading
+        SHELL_STDIN packets; the caller owns (and closes) the connection.
+        :param serial: str -- The device serial
+        :param command: str -- The program to run, e.g. "su"
+        :return: ADBConnection -- The connection carrying shell v2 packets
+        """
+        with span("adb.open_shell", device=serial, command=command):
+            return self.__open_shell(serial, command)
+
+    def __open_shell(self, serial: str, command: str) -> ADBConnection:
+        conn = self.__transport(serial)
+        try:
+            conn.send_request(f"shell,v2,raw:{command}")
+        except (ADBClientError, OSError) as e:
+            conn.close()
+            raise ADBConnectError(str(e)) from e
+        return conn
+
+    def shell_stream(self, serial: str, command: str, deadline: float | None = None):
+        """Run a shell command and yield its output packets as they arrive
+
+        Nothing is read ahead of the consumer, so a slow reader applies TCP
+        backpressure all the way to the device.
+        :param serial: str -- The device serial
+        :param command: str -- The command to run
+        :param deadline: float -- time.monotonic() after which reading raises TimeoutError
+        :return: Iterator[tuple[int, bytes]] -- (SHELL_STDOUT/SHELL_STDERR/SHELL_EXIT, payload)
+        :raises ADBConnectError: The command never started, raised by the first next()
+        """
+        conn = self.__transport(serial)
+        try:
+            conn.send_request(f"shell,v2,raw:{command}")
+        except (ADBClientError, OSError) as e:
+            conn.close()
+            raise ADBConnectError(str(e)) from e
+        try:
+            with span("adb.shell_stream", device=serial, command=command):
+                while True:
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise TimeoutError("Shell command timed out")
+                        conn.sock.settimeout(remaining)
+                    else:
+                        conn.sock.settimeout(None)
+                    packet_id, length = struct.unpack("<BI", conn.read_exactly(5))
+                    yield packet_id, conn.read_exactly(length)
+                    if packet_id == SHELL_EXIT:
+                        return
+        except TimeoutError:
+            raise
+        except OSError as e:
+            raise ADBClientError(str(e)) from e
+        finally:
+            conn.close()
+
+    def sync(self, serial: str) -> "SyncSession":
+        """Open (or reuse a pooled) sync session with a device
+
+        with client.sync(serial) as session:
+            session.stat("/data/local/tmp/frida-server")
+        :param serial: str -- The device serial
+        :return: SyncSession -- The session, returned to the pool on exit
+        """
+        conn = self.__pool.acquire(serial)
+        if conn is None:
+            return SyncSession(self.__pool, serial, self.__open_sync(serial))
+        # The server may still have closed it since the check, retry on a new one then
+        return SyncSession(self.__pool, serial, conn, lambda: self.__open_sync(serial))
+
+    def __open_sync(self, serial: str) -> ADBConnection:
+        conn = self.__transport(serial)
+        try:
+            conn.send_request("sync:")
+        except ADBClientError:
+            conn.close()
+            raise
+        except OSError as e:
+            conn.close()
+            raise ADBClientError(str(e)) from e
+        return conn
+
+    def stat(self, serial: str, remote_path: str) -> tuple[int, int, int]:
+        """Stat a remote file over the sync protocol
+        :param serial: str -- The device serial
+        :param remote_path: str -- The path on the device
+        :return: tuple[int, int, int] -- mode, size and mtime (all 0 if missing)
+        """
+        with self.sync(serial) as session:
+            return session.stat(remote_path)
+
+    def push(self, serial: str, local_file: str, remote_file: str, mode: int | None = None) -> int:
+        """Push a local file to a device over the sync protocol
+        :param serial: str -- The device serial
+        :param local_file: str -- The path to the local file
+        :param remote_file: str -- The path to the remote file
+        :param mode: int -- The remote file mode (default: local file mode)
+        :return: int -- The number of bytes transferred
+        """
+        st = os.stat(local_file)
+        if mode is None:
+            mode = st.st_mode & 0o777
+        with open(local_file, "rb") as f:
+            return self.push_stream(serial, f, remote_file, mode, int(st.st_mtime))
+
+    def push_stream(self, serial: str, stream, remote_file: str, mode: int = 0o644, mtime: int | None = None) -> int:
+        """Push the content of a binary file object to a device
+        :param serial: str -- The device serial
+        :param stream: BinaryIO -- Where to read the content from
+        :param remote_file: str -- The path to the remote file
+        :param mode: int -- The remote file mode
+        :param mtime: int -- The remote modification time (default: now)
+        :return: int -- The number of bytes transferred
+        """
+        with self.sync(serial) as session:
+            total = session.send(stream, remote_file, mode, mtime)
+            session.wait()
+            return total
+
+
+class SyncSession:
+    """A sync: service connection to one device
+
+    send() doesn't wait for the device to acknowledge each file, so many
+    small files can be written back to back; wait() collects the
+    acknowledgements. Any error closes the connection instead of returning
+    it to the pool. On a pooled connection, the first request is retried
+    once on a new connection if the server closed the old one before
+    answering anything.
+    """
+
+    # Files sent before we stop and collect acknowledgements
+    MAX_PENDING = 32
+
+    def __init__(
+        self,
+        pool: ADBConnectionPool,
+        serial: str,
+        conn: ADBConnection,
+        reconnect: Callable[[], ADBConnection] | None = None,
+    ):
+        self.__pool = pool
+        self.__serial = serial
+        self.__conn = conn
+        self.__pending: list[str] = []
+        self.__broken = False
+        self.__reconnect = reconnect
+        self.__received_at_reuse = conn.received
+
+    def __enter__(self) -> "SyncSession":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None and not self.__pending and not self.__broken:
+            self.__pool.release(self.__serial, self.__conn)
+        else:
+            self.__conn.close()
+
+    def __request(self, command: bytes, data: bytes) -> None:
+        self.__conn.sock.sendall(command + struct.pack("<I", len(data)) + data)
+
+    def __guard(self, func, op: str = "ack", path: str | None = None):
+        try:
+            with span(f"adb.sync.{op}", device=self.__serial, path=path):
+                return func()
+        except (ADBClientError, OSError) as e:
+            if self.__stale(e):
+                self.__conn.close()
+                self.__conn = self.__reconnect()
+                self.__reconnect = None
+                return self.__guard(func, op, path)
+            self.__broken = True
+            if isinstance(e, OSError):
+                raise ADBClientError(str(e)) from e
+            raise
+        finally:
+            if self.__conn.received != self.__received_at_reuse:
+                # The connection answered, it wasn't stale
+                self.__reconnect = None
+
+    def __stale(self, error: Exception) -> bool:
+        """A pooled connection the server closed before this session got any answer"""
+        return (
+            self.__reconnect is not None
+            and not self.__pending
+            and self.__conn.received == self.__received_at_reuse
+            and isinstance(error, (ADBConnectionClosed, ConnectionResetError, BrokenPipeError))
+        )
+
+    def __read_status(self) -> None:
+        status = self.__conn.read_exactly(8)
+        if status[:4] == b"FAIL":
+            message = self.__conn.read_exactly(struct.unpack("<I", status[4:])[0])
+            raise ADBClientError(message.decode(errors="replace"))
+        if status[:4] != b"OKAY":
+            raise ADBClientError(f"Unexpected sync reply: {status[:4]!r}")
+
+    def stat(self, remote_path: str) -> tuple[int, int, int]:
+        """Stat a remote path
+        :param remote_path: str -- The path on the device
+        :return: tuple[int, int, int] -- mode, size and mtime (all 0 if missing)
+        """
+        self.wait()
+
+        def run():
+            self.__request(b"STAT", remote_path.encode())
+            reply = self.__conn.read_exactly(16)
+            if reply[:4] != b"STAT":
+                raise ADBClientError(f"Unexpected sync reply: {reply[:4]!r}")
+            return struct.unpack("<III", reply[4:])
+
+        return self.__guard(run, "stat", remote_path)
+
+    def list(self, remote_dir: str) -> list[tuple[str, int, int, int]]:
+        """List a remote directory
+        :param remote_dir: str -- The directory on the device
+        :return: list[tuple[str, int, int, int]] -- name, mode, size and mtime per entry
+        """
+        self.wait()
+
+        def run():
+            self.__request(b"LIST", remote_dir.encode())
+            entries = []
+            while True:
+                header = self.__conn.read_exactly(20)
+                command = header[:4]
+                mode, size, mtime, name_length = struct.unpack("<IIII", header[4:])
+                if command == b"DONE":
+                    return entries
+                if command != b"DENT":
+                    raise ADBClientError(f"Unexpected sync reply: {command!r}")
+                name = self.__conn.read_exactly(name_length).decode(errors="surrogateescape")
+                if name not in (".", ".."):
+                    entries.append((name, mode, size, mtime))
+
+        return self.__guard(run, "list", remote_dir)
+
+    def send(self, stream, remote_file: str, mode: int = 0o644, mtime: int | None = None) -> int:
+        """Send a file without waiting for the device to acknowledge it
+        :param stream: BinaryIO -- Where to read the content from
+        :param remote_file: str -- The path to the remote file
+        :param mode: int -- The remote file mode
+        :param mtime: int -- The remote modification time (default: now)
+        :return: int -- The number of bytes sent
+        """
+        if mtime is None:
+            mtime = int(time.time())
+        if len(self.__pending) >= self.MAX_PENDING:
+            self.wait()
+        if self.__reconnect is not None:
+            # Nothing is answered before the file is sent, and a half read
+            # stream can't be sent again: make sure a pooled connection is up first
+            self.stat("/")
+
+        def run():
+            total = 0
+            self.__request(b"SEND", f"{remote_file},{mode | 0o100000}".encode())
+            while True:
+                chunk = stream.read(SYNC_DATA_MAX)
+                if not chunk:
+                    break
+                self.__request(b"DATA", chunk)
+                total += len(chunk)
+            self.__conn.sock.sendall(b"DONE" + struct.pack("<I", mtime))
+            self.__pending.append(remote_file)
+            return total
+
+        return self.__guard(run, "send", remote_file)
+
+    def wait(self) -> None:
+        """Collect the acknowledgements of every file sent so far"""
+        while self.__pending:
+            remote_file = self.__pending[0]
+            try:
+                self.__guard(self.__read_status, "ack", remote_file)
+            except ADBClientError as e:
+                raise ADBClientError(f"{remote_file}: {e}") from e
+            self.__pending.pop(0)
+
+    def recv(self, remote_file: str, stream) -> int:
+        """Receive a remote file into a binary file object
+        :param remote_file: str -- The path on the device
+        :param stream: BinaryIO -- Where to write the content
+        :return: int -- The number of bytes received
+        """
+        self.wait()
+
+        def run():
+            total = 0
+            self.__request(b"RECV", remote_file.encode())
+            while True:
+                header = self.__conn.read_exactly(8)
+                command = header[:4]
+                length = struct.unpack("<I", header[4:])[0]
+                if command == b"DONE":
+                    return total
+                data = self.__conn.read_exactly(length)
+                if command == b"FAIL":
+                    raise ADBClientError(data.decode(errors="replace"))
+                if command != b"DATA":
+                    raise ADBClientError(f"Unexpected sync reply: {command!r}")
+                stream.write(data)
+                total += length
+
+        return self.__guard(run, "recv", remote_file)
@@ -0,0 +1,152 @@
+import os
+import re
+import json
+import time
+import shlex
+import hashlib
+import threading
+
+# Printed before each package's `pm path` output
+PATH_MARKER = "__FSP_PKG__"
+SHA256_LINE = re.compile(r"^(?P<sha256>[0-9a-f]{64})\s+(?P<path>\S.*)$", re.M)
+SIZE_LINE = re.compile(r"^(?P<size>\d+) (?P<path>\S.*)$", re.M)
+
+
+def resolve_command(packages: list[str]) -> str:
+    """One shell call listing the APKs of every package, base and splits"""
+    return "; ".join(
+        f"echo {PATH_MARKER} {shlex.quote(name)}; pm path {shlex.quote(name)}" for name in packages
+    )
+
+
+def parse_pm_path(output: str) -> dict[str, list[str]]:
+    """Parse the output of resolve_command()
+
+    Arguments:
+        output {str} -- The command output
+
+    Returns:
+        dict -- package -> APK paths, packages that aren't installed are left out
+    """
+    paths = {}
+    current = None
+    for line in output.splitlines():
+        line = line.strip()
+        if line.startswith(PATH_MARKER + " "):
+            current = line[len(PATH_MARKER) + 1 :]
+        elif current is not None and line.startswith("package:"):
+            paths.setdefault(current, []).append(line[len("package:") :])
+    return paths
+
+
+def hash_command(paths: list[str]) -> str:
+    """One shell call with the sha256 and size of every path"""
+    quoted = " ".join(shlex.quote(path) for path in paths)
+    return f"sha256sum {quoted} 2>/dev/null; stat -c '%s %n' {quoted} 2>/dev/null"
+
+
+def parse_hashes(output: str) -> dict[str, tuple[str | None, int | None]]:
+    """Parse the output of hash_command()
+
+    Returns:
+        dict -- path -> (sha256, size), either may be None if the device couldn't tell
+    """
+    digests = {match["path"]: match["sha256"] for match in SHA256_LINE.finditer(output)}
+    sizes = {match["path"]: int(match["size"]) for match in SIZE_LINE.finditer(output)}
+    return {path: (digests.get(path), sizes.get(path)) for path in digests.keys() | sizes.keys()}
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ApkStore:
+    """Content-addressed APKs pulled from devices, under <base_dir>/apks
+
+    Every APK is stored once as objects/<sha256>.apk however many devices
+    (or packages) have it. A transfer in progress is written to
+    objects/<sha256>.apk.part and only renamed once its hash checks out, so
+    an interrupted pull is resumed from where it stopped. manifests/<serial>.json
+    maps each device's packages to the objects of their base and split APKs.
+    """
+
+    def __init__(self, store_dir: str):
+        self.__dir = store_dir
+        self.__objects = os.path.join(store_dir, "objects")
+        self.__manifests = os.path.join(store_dir, "manifests")
+        self.__lock = threading.Lock()
+
+    def object_path(self, sha256: str) -> str:
+        return os.path.join(self.__objects, f"{sha256}.apk")
+
+    def part_path(self, sha256: str) -> str:
+        return self.object_path(sha256) + ".part"
+
+    def has(self, sha256: str) -> bool:
+        return os.path.exists(self.object_path(sha256))
+
+    def part_size(self, sha256: str) -> int:
+        """How much of an interrupted transfer is already on disk"""
+        try:
+            return os.path.getsize(self.part_path(sha256))
+        except OSError:
+            return 0
+
+    def open_part(self, sha256: str, resume: bool = True):
+        """The partial file of an object, opened for appending (or truncated)"""
+        os.makedirs(self.__objects, exist_ok=True)
+        return open(self.part_path(sha256), "ab" if resume else "wb")
+
+    def commit(self, sha256: str | None, part_path: str | None = None) -> str:
+        """Move a finished transfer into the store after checking its hash
+
+        Arguments:
+            sha256 {str} -- The hash the device reported, None if it couldn't tell
+            part_path {str} -- The transferred file (default: the object's .part)
+
+        Raises:
+            ValueError -- The content doesn't hash to sha256, the part is removed
+
+        Returns:
+            str -- The hash the object is stored under
+        """
+        part_path = part_path or self.part_path(sha256)
+        actual = file_sha256(part_path)
+        if sha256 is not None and actual != sha256:
+            os.remove(part_path)
+            raise ValueError(f"sha256 mismatch: expected {sha256}, got {actual}")
+        os.replace(part_path, self.object_path(actual))
+        return actual
+
+    def scratch_path(self, serial: str, remote_path: str) -> str:
+        """Where to pull a file whose hash is only known once it's here"""
+        os.makedirs(self.__objects, exist_ok=True)
+        key = hashlib.sha256(f"{serial}:{remote_path}".encode()).hexdigest()
+        return os.path.join(self.__objects, f"unhashed-{key}.part")
+
+    def record(self, serial: str, packages: dict[str, list[dict]]) -> None:
+        """Add (or replace) packages in a device's manifest
+
+        Arguments:
+            serial {str} -- The device serial
+            packages {dict} -- package -> [{"path", "sha256", "size"}]
+        """
+        safe = re.sub(r"[^\w.-]", "_", serial)
+        path = os.path.join(self.__manifests, f"{safe}.json")
+        with self.__lock:
+            try:
+                with open(path) as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                manifest = {"serial": serial, "packages": {}}
+            for name, files in packages.items():
+                manifest["packages"][name] = {"pulled_at": time.time(), "files": files}
+            os.makedirs(self.__manifests, exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(manifest, f, indent=2)
+            os.replace(tmp_path, path)
@@ -1,9 +1,171 @@
 from style import Style
-from requests import get, RequestException
+from requests import Session, RequestException, Response
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+import os
 from os import path, makedirs
+import random
+import threading
+import time
+from .trace import span
 
 
 class BurpHelper:
+    # Attempts per request and the base of the jittered exponential backoff
+    RETRIES = 3
+    BACKOFF = 0.25
+    TIMEOUT = 10
+    # Burp answering these is usually still starting up
+    RETRY_STATUS = (502, 503, 504)
+
+    __session = None
+    __session_lock = threading.Lock()
+
+    @staticmethod
+    def get_session() -> Session:
+        """The shared keep-alive session, created on first use
+
+        Returns:
+            Session -- Pooled connections reused by every request to Burp
+        """
+        with BurpHelper.__session_lock:
+            if BurpHelper.__session is None:
+                session = Session()
+                adapter = HTTPAdapter(pool_connections=8, pool_maxsize=16)
+                session.mount("http://", adapter)
+                BurpHelper.__session = session
+            return BurpHelper.__session
+
+    @staticmethod
+    def after_fork() -> None:
+        """Drop the parent's session in a forked child
+
+        Another thread may have held the lock at the fork, and the pooled
+        connections belong to the parent.
+        """
+        BurpHelper.__session_lock = threading.Lock()
+        BurpHelper.__session = None
+
+    @staticmethod
+    def fetch_certificate(
+        host: str, port: int, headers: dict | None = None, retries: int = RETRIES
+    ) -> Response:
+        """Request the Burp Suite CA certificate without saving it
+
+        Connection errors, timeouts and 502/503/504 are retried up to
+        `retries` attempts in total, sleeping a random 0..BACKOFF * 2^n
+        seconds in between so many workers don't retry in lockstep.
+
+        Arguments:
+            host {str} -- The host where Burp Suite is running
+            port {int} -- The port where Burp Suite is running
+            headers {dict} -- Extra request headers, e.g. for conditional requests
+            retries {int} -- Attempts before giving up
+
+        Raises:
+            RequestException: If Burp can't be reached or answers anything but 200/304
+
+        Returns:
+            Response -- The response, its content is the DER certificate on 200
+        """
+        url = f"http://{host}:{port}/cert"
+        session = BurpHelper.get_session()
+        for attempt in range(retries):
+            last_attempt = attempt == retries - 1
+            try:
+                with span("burp.fetch", host=host, port=port, attempt=attempt) as timing:
+                    response = session.get(url, headers=headers, timeout=BurpHelper.TIMEOUT)
+                    timing.tag(status=response.status_code)
+            except RequestException:
+                if last_attempt:
+                    raise
+            else:
+                if response.status_code in (200, 304):
+                    return response
+                if last_attempt or response.status_code not in BurpHelper.RETRY_STATUS:
+                    raise RequestException(
+                        f"Failed to download certificate. Status code: {response.status_code}"
+                    )
+            time.sleep(random.uniform(0, BurpHelper.BACKOFF * 2**attempt))
+
+    @staticmethod
+    def get_certificate(host: str, port: int) -> bytes:
+        """Download the Burp Suite CA certificate into memory
+
+        Arguments:
+            host {str} -- The host where Burp Suite is running
+            port {int} -- The port where Burp Suite is running
+
+        Raises:
+            RequestException: If the certificate can't be downloaded
+
+        Returns:
+            bytes -- The DER certificate
+        """
+        return BurpHelper.fetch_certificate(host, port).content
+
+    @staticmethod
+    def parse_listener(value: str) -> tuple[str, int]:
+        """Parse a HOST:PORT listener, the host defaults to localhost
+
+        Raises:
+            ValueError: If the port isn't a number from 1 to 65535 or the host has whitespace
+
+        Returns:
+            tuple[str, int] -- (host, port)
+        """
+        host, _, port = value.rpartition(":")
+        if not port.isdigit() or not 0 < int(port) < 65536:
+            raise ValueError(f"Invalid port in {value!r}")
+        if any(c.isspace() for c in host):
+            raise ValueError(f"Invalid host in {value!r}")
+        return host or "localhost", int(port)
+
+    @staticmethod
+    def fetch_certificates(
+        listeners: list[tuple[str, int]], headers: dict | None = None, jobs: int = 8
+    ) -> dict[tuple[str, int], Response | RequestException]:
+        """Request the CA certificates of several Burp listeners at once
+
+        Arguments:
+            listeners {list[tuple[str, int]]} -- (host, port) of every listener
+            headers {dict} -- (host, port) -> extra request headers for that listener
+            jobs {int} -- How many requests run at once
+
+        Returns:
+            dict -- (host, port) -> the response, or the error for that listener
+        """
+        headers = headers or {}
+
+        def fetch(listener):
+            try:
+                return BurpHelper.fetch_certificate(*listener, headers.get(listener))
+            except RequestException as e:
+                return e
+
+        listeners = list(dict.fromkeys(listeners))
+        if len(listeners) <= 1 or jobs <= 1:
+            return {listener: fetch(listener) for listener in listeners}
+        with ThreadPoolExecutor(max_workers=min(jobs, len(listeners))) as pool:
+            return dict(zip(listeners, pool.map(fetch, listeners)))
+
+    @staticmethod
+    def get_certificates(
+        listeners: list[tuple[str, int]], jobs: int = 8
+    ) -> dict[tuple[str, int], bytes | RequestException]:
+        """Download the CA certificates of several Burp listeners at once
+
+        Arguments:
+            listeners {list[tuple[str, int]]} -- (host, port) of every listener
+            jobs {int} -- How many requests run at once
+
+        Returns:
+            dict -- (host, port) -> the DER certificate, or the error for that listener
+        """
+        return {
+            listener: response if isinstance(response, RequestException) else response.content
+            for listener, response in BurpHelper.fetch_certificates(listeners, jobs=jobs).items()
+        }
 
     @staticmethod
     def download_certificate(cert_dir: str, host: str, port: int) -> str:
@@ -14,30 +176,26 @@ class BurpHelper:
             host {str} -- The host where Burp Suite is running
             port {int} -- The port where Burp Suite is running
 
+        Raises:
+            RequestException: If the certificate can't be downloaded
+
         Returns:
             str -- The path to the downloaded certificate
         """
+        der = BurpHelper.get_certificate(host, port)
         # Check if the directory exists then create it
         if not path.exists(cert_dir):
             print(f"{Style.YELLOW}[INFO] Creating directory: {cert_dir}{Style.RESET}")
             makedirs(cert_dir)
+        file_path = path.join(cert_dir, "burp_cacert.der")
+        with open(file_path, "wb") as cert_file:
+            cert_file.write(der)
+        print(
+            f"{Style.GREEN}[SUCCESS] Certificate downloaded successfully as {file_path}{Style.RESET}"
+        )
+        return file_path
 
-        try:
-            url = f"http://{host}:{port}/cert"
-            response = get(url, timeout=10)
-            if response.status_code == 200:
-                file_path = path.join(cert_dir, "burp_cacert.der")
-                with open(file_path, "wb") as cert_file:
-                    cert_file.write(response.content)
-                print(
-                    f"{Style.GREEN}[SUCCESS] Certificate downloaded successfully as {file_path}{Style.RESET}"
-                )
-                return file_path
-            else:
-                print(
-                    f"{Style.RED}[ERROR] Failed to download certificate. Status code: {response.status_code}{Style.RESET}"
-                )
-                raise RequestException("Failed to download certificate")
-        except RequestException as e:
-            print(f"{Style.RED}Error downloading certificate: {e}{Style.RESET}")
-            exit(1)
+
+# fork() is POSIX only, so is this hook
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=BurpHelper.after_fork)
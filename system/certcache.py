@@ -0,0 +1,209 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from style import Style
+from requests import RequestException
+from .burp import BurpHelper
+from .crypt import CryptHelper
+
+
+class CertCache:
+    """Content addressed cache of Burp CA certificates under certs/cache
+
+    Every certificate is stored once by SHA-256 fingerprint together with its
+    PEM encoding and old subject hash. Each Burp endpoint (host:port) remembers
+    which fingerprint it served last, so a whole fleet run needs at most one
+    (conditional) request to Burp and no conversion work at all.
+    """
+
+    # Seconds an endpoint is trusted without asking Burp again
+    FRESH_FOR = 60
+    MAX_ENTRIES = 32
+    MAX_BYTES = 4 * 1024 * 1024
+
+    def __init__(self, cert_dir: str, max_entries: int = MAX_ENTRIES, max_bytes: int = MAX_BYTES):
+        self.__dir = os.path.join(cert_dir, "cache")
+        self.__index_path = os.path.join(self.__dir, "index.json")
+        self.__max_entries = max_entries
+        self.__max_bytes = max_bytes
+        self.__lock = threading.Lock()
+        self.__index = None
+
+    def __load(self) -> dict:
+        if self.__index is None:
+            try:
+                with open(self.__index_path) as f:
+                    self.__index = json.load(f)
+            except (OSError, ValueError):
+                self.__index = {}
+            self.__index.setdefault("entries", {})
+            self.__index.setdefault("endpoints", {})
+        return self.__index
+
+    def __save(self) -> None:
+        os.makedirs(self.__dir, exist_ok=True)
+        tmp_path = self.__index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.__index, f, indent=2)
+        os.replace(tmp_path, self.__index_path)
+
+    def __path(self, fingerprint: str, ext: str) -> str:
+        return os.path.join(self.__dir, f"{fingerprint}.{ext}")
+
+    def __read_entry(self, fingerprint: str) -> tuple[bytes, str] | None:
+        entry = self.__load()["entries"].get(fingerprint)
+        if entry is None:
+            return None
+        try:
+            with open(self.__path(fingerprint, "pem"), "rb") as f:
+                pem = f.read()
+        except OSError:
+            del self.__index["entries"][fingerprint]
+            return None
+        entry["last_used"] = time.time()
+        return pem, entry["subject_hash"]
+
+    def __store(self, der: bytes, crypt: CryptHelper) -> tuple[str, bytes, str]:
+        fingerprint = hashlib.sha256(der).hexdigest()
+        cached = self.__read_entry(fingerprint)
+        if cached is not None:
+            return fingerprint, *cached
+        pem, subject_hash = crypt.load_certificate(der)
+        os.makedirs(self.__dir, exist_ok=True)
+        for ext, data in (("der", der), ("pem", pem)):
+            with open(self.__path(fingerprint, ext), "wb") as f:
+                f.write(data)
+        now = time.time()
+        self.__index["entries"][fingerprint] = {
+            "subject_hash": subject_hash,
+            "size": len(der) + len(pem),
+            "created": now,
+            "last_used": now,
+        }
+        self.__evict(keep=fingerprint)
+        return fingerprint, pem, subject_hash
+
+    def __evict(self, keep: str) -> None:
+        """Drop least recently used certificates over the count/size budget"""
+        entries = self.__index["entries"]
+        total = sum(entry["size"] for entry in entries.values())
+        for fingerprint in sorted(entries, key=lambda fp: entries[fp]["last_used"]):
+            if len(entries) <= self.__max_entries and total <= self.__max_bytes:
+                break
+            if fingerprint == keep:
+                continue
+            total -= entries.pop(fingerprint)["size"]
+            for ext in ("der", "pem"):
+                try:
+                    os.remove(self.__path(fingerprint, ext))
+                except OSError:
+                    pass
+        endpoints = self.__index["endpoints"]
+        for endpoint in [e for e, v in endpoints.items() if v["fingerprint"] not in entries]:
+            del endpoints[endpoint]
+
+    def after_fork(self) -> None:
+        """Start over in a forked child: another thread of the parent may have
+        held the lock, or been halfway through changing the index, at the fork"""
+        self.__lock = threading.Lock()
+        self.__index = None
+
+    def get(self, host: str, port: int, crypt: CryptHelper, refresh: bool = False) -> tuple[bytes, str]:
+        """Get the PEM certificate and old subject hash served by a Burp listener
+
+        Arguments:
+            host {str} -- The host where Burp Suite is running
+            port {int} -- The port where Burp Suite is running
+            crypt {CryptHelper} -- Used to convert certificates not cached yet
+            refresh {bool} -- Revalidate with Burp even if the entry is fresh
+
+        Raises:
+            RequestException: If Burp can't be reached and nothing is cached for it
+            CertificateError: If the certificate Burp served can't be converted
+
+        Returns:
+            tuple[bytes, str] -- The PEM certificate and its old subject hash
+        """
+        result = self.get_many([(host, port)], crypt, refresh)[(host, port)]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def get_many(
+        self, listeners: list[tuple[str, int]], crypt: CryptHelper, refresh: bool = False, jobs: int = 8
+    ) -> dict[tuple[str, int], tuple[bytes, str] | Exception]:
+        """Get the certificates of several Burp listeners, asking the stale ones at once
+
+        Arguments:
+            listeners {list[tuple[str, int]]} -- (host, port) of every listener
+            crypt {CryptHelper} -- Used to convert certificates not cached yet
+            refresh {bool} -- Revalidate with Burp even if the entries are fresh
+            jobs {int} -- How many requests to Burp run at once
+
+        Returns:
+            dict -- (host, port) -> (PEM certificate, old subject hash), or the error for that listener
+        """
+        results = {}
+        # (host, port) -> conditional request headers, for the listeners Burp has to answer
+        pending = {}
+        with self.__lock:
+            endpoints = self.__load()["endpoints"]
+            for host, port in dict.fromkeys(listeners):
+                known = endpoints.get(f"{host}:{port}")
+                if known is not None and not refresh and time.time() - known["checked_at"] < self.FRESH_FOR:
+                    cached = self.__read_entry(known["fingerprint"])
+                    if cached is not None:
+                        results[(host, port)] = cached
+                        continue
+                headers = {}
+                if known is not None:
+                    if known.get("etag"):
+                        headers["If-None-Match"] = known["etag"]
+                    if known.get("last_modified"):
+                        headers["If-Modified-Since"] = known["last_modified"]
+                pending[(host, port)] = headers
+            if not pending:
+                self.__save()
+                return results
+
+        # Burp is asked without holding the lock
+        responses = BurpHelper.fetch_certificates(list(pending), pending, jobs)
+        with self.__lock:
+            for listener, response in responses.items():
+                try:
+                    results[listener] = self.__update(listener, response, crypt)
+                except (RequestException, ValueError) as e:
+                    results[listener] = e
+            self.__save()
+        return results
+
+    def __update(self, listener: tuple[str, int], response, crypt: CryptHelper) -> tuple[bytes, str]:
+        """Record what a listener answered, called with the lock held"""
+        host, port = listener
+        key = f"{host}:{port}"
+        endpoints = self.__load()["endpoints"]
+        known = endpoints.get(key)
+        if isinstance(response, RequestException):
+            cached = self.__read_entry(known["fingerprint"]) if known is not None else None
+            if cached is None:
+                raise response
+            print(f"{Style.YELLOW}[INFO] Burp {key} unreachable, using the cached certificate{Style.RESET}")
+            return cached
+
+        cached = None
+        if response.status_code == 304 and known is not None:
+            cached = self.__read_entry(known["fingerprint"])
+        if cached is not None:
+            pem, subject_hash = cached
+            fingerprint = known["fingerprint"]
+        else:
+            fingerprint, pem, subject_hash = self.__store(response.content, crypt)
+        endpoints[key] = {
+            "fingerprint": fingerprint,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "checked_at": time.time(),
+        }
+        return pem, subject_hash
@@ -1,7 +1,17 @@
 from .burp import BurpHelper
 from style import Style
 import os
+import base64
+import hashlib
 import subprocess
+from .trace import span
+
+PEM_HEADER = b"-----BEGIN CERTIFICATE-----"
+PEM_FOOTER = b"-----END CERTIFICATE-----"
+
+
+class CertificateError(ValueError):
+    """A certificate that neither the DER reader nor openssl could handle"""
 
 
 class CryptHelper:
@@ -9,11 +19,21 @@ class CryptHelper:
 
     def __init__(self, base_dir):
         self.__base_dir = base_dir
-        self.__openssl_path = self.__find_openssl()
+        # openssl is only a fallback for certificates the DER reader rejects
+        try:
+            self.__openssl_path = self.__find_openssl()
+        except FileNotFoundError:
+            self.__openssl_path = None
 
     def get_openssl_path(self):
         return self.__openssl_path
 
+    @staticmethod
+    def __run_openssl(args: list, **kwargs) -> subprocess.CompletedProcess:
+        """subprocess.run for openssl, traced as an openssl span"""
+        with span("openssl", command=" ".join(args[1:4])):
+            return subprocess.run(args, **kwargs)
+
     def __find_openssl(self):
         """Find the openssl executable in the PATH environment variable
 
@@ -41,26 +61,207 @@ class CryptHelper:
                 return openssl_path_win
         raise FileNotFoundError("openssl not found in PATH")
 
+    @staticmethod
+    def der_to_pem(der: bytes) -> bytes:
+        """Encode a DER certificate as PEM, byte for byte like `openssl x509 -outform PEM`
+
+        Arguments:
+            der {bytes} -- The DER certificate
+
+        Returns:
+            bytes -- The PEM certificate
+        """
+        encoded = base64.b64encode(der)
+        lines = [encoded[i : i + 64] for i in range(0, len(encoded), 64)]
+        return b"\n".join([PEM_HEADER, *lines, PEM_FOOTER]) + b"\n"
+
+    @staticmethod
+    def pem_to_der(pem: bytes) -> bytes:
+        """Decode the first certificate of a PEM file
+
+        Arguments:
+            pem {bytes} -- The PEM certificate
+
+        Returns:
+            bytes -- The DER certificate
+        """
+        start = pem.index(PEM_HEADER) + len(PEM_HEADER)
+        end = pem.index(PEM_FOOTER, start)
+        return base64.b64decode(b"".join(pem[start:end].split()))
+
+    @staticmethod
+    def __der_element(data: bytes, offset: int) -> tuple[int, int, int]:
+        """Read the DER element at offset
+
+        Returns:
+            tuple[int, int, int] -- The tag, the offset of its content and the offset after it
+        """
+        tag = data[offset]
+        length = data[offset + 1]
+        offset += 2
+        if length & 0x80:
+            size = length & 0x7F
+            if size == 0 or size > 4:
+                raise ValueError("Unsupported DER length")
+            length = int.from_bytes(data[offset : offset + size], "big")
+            offset += size
+        end = offset + length
+        if end > len(data):
+            raise ValueError("Truncated DER element")
+        return tag, offset, end
+
+    @staticmethod
+    def subject_der(der: bytes) -> bytes:
+        """Extract the DER encoded subject Name of a certificate
+
+        Arguments:
+            der {bytes} -- The DER certificate
+
+        Returns:
+            bytes -- The subject Name, including its SEQUENCE header
+        """
+        read = CryptHelper.__der_element
+        # Certificate ::= SEQUENCE { tbsCertificate, signatureAlgorithm, signature }
+        tag, content, _ = read(der, 0)
+        if tag != 0x30:
+            raise ValueError("Not a DER certificate")
+        tag, offset, _ = read(der, content)
+        if tag != 0x30:
+            raise ValueError("Not a DER certificate")
+        # tbsCertificate ::= SEQUENCE { [0] version OPTIONAL, serialNumber,
+        #                               signature, issuer, validity, subject, ... }
+        tag, _, end = read(der, offset)
+        if tag == 0xA0:
+            offset = end
+        for _ in range(4):
+            _, _, offset = read(der, offset)
+        tag, _, end = read(der, offset)
+        if tag != 0x30:
+            raise ValueError("Malformed certificate subject")
+        return der[offset:end]
+
+    @staticmethod
+    def subject_hash_old(der: bytes) -> str:
+        """Compute `openssl x509 -subject_hash_old`: the first 4 bytes of the
+        MD5 of the DER subject, read as a little endian integer
+
+        Arguments:
+            der {bytes} -- The DER certificate
+
+        Returns:
+            str -- The old subject hash as 8 hex digits
+        """
+        digest = hashlib.md5(CryptHelper.subject_der(der)).digest()
+        return f"{int.from_bytes(digest[:4], 'little'):08x}"
+
+    def load_certificate(self, der: bytes) -> tuple[bytes, str]:
+        """Convert a DER certificate to PEM and compute its old subject hash in memory
+
+        Falls back to piping the certificate through openssl when the DER
+        reader can't handle it; nothing is written to disk either way.
+
+        Arguments:
+            der {bytes} -- The DER certificate
+
+        Raises:
+            CertificateError: If the certificate can't be converted
+
+        Returns:
+            tuple[bytes, str] -- The PEM certificate and its old subject hash
+        """
+        try:
+            with span("crypt.load_certificate", size=len(der)):
+                return self.der_to_pem(der), self.subject_hash_old(der)
+        except (ValueError, IndexError):
+            openssl = self.__require_openssl()
+        try:
+            pem = self.__run_openssl(
+                [openssl, "x509", "-inform", "DER", "-outform", "PEM"],
+                input=der,
+                capture_output=True,
+                check=True,
+            ).stdout
+            subject_hash = self.__run_openssl(
+                [openssl, "x509", "-noout", "-subject_hash_old"],
+                input=pem,
+                capture_output=True,
+                check=True,
+            ).stdout
+        except (OSError, subprocess.CalledProcessError) as e:
+            stderr = getattr(e, "stderr", None)
+            detail = stderr.decode(errors="replace").strip() if stderr else str(e)
+            raise CertificateError(f"openssl could not read the certificate: {detail}") from e
+        return pem, subject_hash.decode().strip()
+
     def convert_der_to_pem(self, der_file: str, pem_file: str):
+        """Convert a DER certificate to a PEM certificate
+
+        Arguments:
+            der_file {str} -- The path to the DER certificate file
+            pem_file {str} -- The path to save the PEM certificate file
+
+        Raises:
+            CertificateError: If the certificate can't be converted
+        """
+        with open(der_file, "rb") as f:
+            der = f.read()
+        try:
+            # Make sure it really is a certificate before blindly encoding it
+            self.subject_der(der)
+            with open(pem_file, "wb") as f:
+                f.write(self.der_to_pem(der))
+        except (ValueError, IndexError):
+            self.__openssl_convert_der_to_pem(der_file, pem_file)
+            return
+        print(
+            f"{Style.GREEN}[SUCCESS] Certificate converted successfully as {pem_file}{Style.RESET}"
+        )
+
+    def extract_old_subject_hash(self, pem_file: str) -> str:
+        """Extract the old subject hash from a PEM certificate
+
+        Arguments:
+            pem_file {str} -- The path to the PEM certificate file
+
+        Raises:
+            CertificateError: If the certificate can't be read
+
+        Returns:
+            str -- The old subject hash
+        """
+        with open(pem_file, "rb") as f:
+            pem = f.read()
+        try:
+            return self.subject_hash_old(self.pem_to_der(pem))
+        except (ValueError, IndexError):
+            return self.__openssl_extract_old_subject_hash(pem_file)
+
+    def __require_openssl(self) -> str:
+        if self.__openssl_path is None:
+            raise CertificateError("Unsupported certificate and openssl not found in PATH")
+        return self.__openssl_path
+
+    def __openssl_convert_der_to_pem(self, der_file: str, pem_file: str):
         """Convert a DER certificate to a PEM certificate using the openssl executable
 
         Arguments:
             der_file {str} -- The path to the DER certificate file
             pem_file {str} -- The path to save the PEM certificate file
         """
-        cmd = f"{self.__openssl_path} x509 -inform DER -outform PEM -in {der_file} -out {pem_file}"
-        result = subprocess.run(cmd, shell=True, check=True)
+        result = self.__run_openssl(
+            [self.__require_openssl(), "x509", "-inform", "DER", "-outform", "PEM", "-in", der_file, "-out", pem_file],
+            capture_output=True,
+            text=True,
+        )
         if result.returncode == 0:
             print(
                 f"{Style.GREEN}[SUCCESS] Certificate converted successfully as {pem_file}{Style.RESET}"
             )
         else:
-            print(f"{Style.RED}Failed to convert certificate{Style.RESET}")
-            print(result.stderr)
-            exit(1)
+            raise CertificateError(f"Failed to convert certificate: {result.stderr.strip()}")
 
-    def extract_old_subject_hash(self, pem_file: str) -> str:
-        """Extract the old subject hash from a PEM certificate
+    def __openssl_extract_old_subject_hash(self, pem_file: str) -> str:
+        """Extract the old subject hash from a PEM certificate using the openssl executable
 
         Arguments:
             pem_file {str} -- The path to the PEM certificate file
@@ -68,12 +269,13 @@ class CryptHelper:
         Returns:
             str -- The old subject hash
         """
-        cmd = f"{self.__openssl_path} x509 -noout -subject_hash_old -in {pem_file}"
-        result = subprocess.run(cmd, shell=True, check=True, stdout=subprocess.PIPE)
+        result = self.__run_openssl(
+            [self.__require_openssl(), "x509", "-noout", "-subject_hash_old", "-in", pem_file],
+            capture_output=True,
+            text=True,
+        )
         if result.returncode == 0:
             # Get the old subject hash from the output like head -n -1
-            return result.stdout.decode().strip()
+            return result.stdout.strip()
         else:
-            print(f"{Style.RED}Failed to extract old subject hash{Style.RESET}")
-            print(result.stderr)
-            exit(1)
\ No newline at end of file
+            raise CertificateError(f"Failed to extract old subject hash: {result.stderr.strip()}")
@@ -0,0 +1,160 @@
+import os
+import sys
+import json
+import socket
+import signal
+import struct
+import threading
+import traceback
+from typing import Callable
+from style import Style
+
+# Request: 4-byte little-endian length, then JSON {"argv", "cwd", "env"}, sent
+# together with the client's stdin/stdout/stderr file descriptors
+REQUEST_LENGTH = struct.Struct("<I")
+MAX_REQUEST = 4 * 1024 * 1024
+# fork, SO_PEERCRED and passing file descriptors: Linux and the like only
+SUPPORTED = (
+    hasattr(os, "fork")
+    and hasattr(socket, "AF_UNIX")
+    and hasattr(socket, "SO_PEERCRED")
+    and hasattr(socket, "send_fds")
+)
+
+
+class Daemon:
+    """Run forwarded command lines in forks of one warm process
+
+    The daemon pays for imports, PATH lookups, the adb server check and the
+    device registry once. Each request is handled by a fork that inherits all
+    of that, takes over the client's stdin/stdout/stderr (so colors, pipes and
+    streaming behave as if it ran in the client's shell) and reports its exit
+    code back. Forks keep commands isolated from each other and let them run
+    at the same time.
+    """
+
+    def __init__(
+        self,
+        socket_path: str,
+        handler: Callable[[list[str], object], int],
+        snapshot: Callable[[], object] | None = None,
+    ):
+        """
+        Arguments:
+            socket_path {str} -- The Unix socket to listen on
+            handler {Callable} -- handler(argv, state) -> exit code, run in the fork
+            snapshot {Callable} -- snapshot() -> state, taken in the daemon right before each fork
+        """
+        self.__path = socket_path
+        self.__handler = handler
+        self.__snapshot = snapshot or (lambda: None)
+        self.__listener: socket.socket | None = None
+
+    def __bind(self) -> socket.socket:
+        if os.path.exists(self.__path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.__path)
+            except OSError:
+                # Left behind by a daemon that didn't exit cleanly
+                os.unlink(self.__path)
+            else:
+                raise RuntimeError(f"A daemon is already listening on {self.__path}")
+            finally:
+                probe.close()
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Only our own user may connect
+        umask = os.umask(0o177)
+        try:
+            listener.bind(self.__path)
+        finally:
+            os.umask(umask)
+        listener.listen(64)
+        return listener
+
+    def serve_forever(self) -> None:
+        self.__listener = self.__bind()
+        try:
+            while True:
+                conn, _ = self.__listener.accept()
+                try:
+                    self.__accept(conn)
+                except (OSError, ValueError) as e:
+                    print(f"{Style.RED}[Error] Dropped a request: {e}{Style.RESET}", file=sys.stderr)
+                    conn.close()
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        if self.__listener is not None:
+            self.__listener.close()
+            self.__listener = None
+            try:
+                os.unlink(self.__path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def __peer_uid(conn: socket.socket) -> int:
+        creds = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+        return struct.unpack("3i", creds)[1]
+
+    def __accept(self, conn: socket.socket) -> None:
+        if self.__peer_uid(conn) != os.getuid():
+            raise ValueError("peer is another user")
+        conn.settimeout(5)
+        data, fds, _, _ = socket.recv_fds(conn, 65536, 3)
+        try:
+            if len(fds) != 3 or len(data) < REQUEST_LENGTH.size:
+                raise ValueError("malformed request")
+            (length,) = REQUEST_LENGTH.unpack_from(data)
+            if length > MAX_REQUEST:
+                raise ValueError("request too large")
+            data = data[REQUEST_LENGTH.size :]
+            while len(data) < length:
+                chunk = conn.recv(length - len(data))
+                if not chunk:
+                    raise ValueError("truncated request")
+                data += chunk
+            request = json.loads(data)
+            conn.settimeout(None)
+            state = self.__snapshot()
+            pid = os.fork()
+            if pid == 0:
+                self.__run_child(conn, fds, request, state)
+        finally:
+            for fd in fds:
+                os.close(fd)
+        conn.close()
+        threading.Thread(target=os.waitpid, args=(pid, 0), daemon=True).start()
+
+    def __run_child(self, conn: socket.socket, fds: list[int], request: dict, state) -> None:
+        code = 1
+        try:
+            self.__listener.close()
+            for fd, target in zip(fds, (0, 1, 2)):
+                os.dup2(fd, target)
+            sys.stdin, sys.stdout, sys.stderr = sys.__stdin__, sys.__stdout__, sys.__stderr__
+            if sys.stdout.isatty():
+                sys.stdout.reconfigure(line_buffering=True)
+            os.chdir(request["cwd"])
+            os.environ.clear()
+            os.environ.update(request["env"])
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            # The client forwards Ctrl+C to this pid
+            conn.sendall(json.dumps({"pid": os.getpid()}).encode() + b"\n")
+            try:
+                code = self.__handler(request["argv"], state)
+            except SystemExit as e:
+                code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+            except KeyboardInterrupt:
+                code = 130
+            except Exception:
+                traceback.print_exc()
+                code = 1
+            sys.stdout.flush()
+            sys.stderr.flush()
+            conn.sendall(json.dumps({"exit": code}).encode() + b"\n")
+        finally:
+            os._exit(code)
@@ -0,0 +1,235 @@
+import sys
+import json
+import time
+import base64
+import threading
+from collections import deque
+from style import Style
+from .output import OUTPUT
+
+# What a full queue does with a new message
+DROP_NEWEST = "drop-newest"
+DROP_OLDEST = "drop-oldest"
+BLOCK = "block"
+POLICIES = (DROP_NEWEST, DROP_OLDEST, BLOCK)
+
+
+class Event:
+    """One script message, data is a memoryview over frida's buffer (no copy)"""
+
+    __slots__ = ("source", "message", "data", "received_at")
+
+    def __init__(self, source: str, message: dict, data: memoryview | None, received_at: float):
+        self.source = source
+        self.message = message
+        self.data = data
+        self.received_at = received_at
+
+    def to_dict(self) -> dict:
+        record = {"source": self.source, "time": self.received_at, **self.message}
+        if self.data is not None:
+            record["data"] = base64.b64encode(self.data).decode()
+        return record
+
+
+class EventRing:
+    """Bounded FIFO shared by the frida callback threads and one consumer"""
+
+    def __init__(self, capacity: int, policy: str = DROP_OLDEST):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown queue policy: {policy}")
+        self.__items = deque()
+        self.__capacity = capacity
+        self.__policy = policy
+        self.__cond = threading.Condition()
+        self.__closed = False
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.__items)
+
+    def put(self, item) -> bool:
+        """Queue an item, returns False if it (or an older one) was dropped"""
+        with self.__cond:
+            if len(self.__items) >= self.__capacity:
+                if self.__policy == BLOCK:
+                    while len(self.__items) >= self.__capacity and not self.__closed:
+                        self.__cond.wait()
+                elif self.__policy == DROP_OLDEST:
+                    self.__items.popleft()
+                    self.dropped += 1
+                else:
+                    self.dropped += 1
+                    return False
+            if self.__closed:
+                self.dropped += 1
+                return False
+            self.__items.append(item)
+            if len(self.__items) == 1:
+                self.__cond.notify_all()
+            return True
+
+    def get_batch(self, max_items: int, timeout: float) -> list:
+        """Take up to max_items, waiting at most timeout for the first one"""
+        with self.__cond:
+            if not self.__items and not self.__closed:
+                self.__cond.wait(timeout)
+            count = min(max_items, len(self.__items))
+            batch = [self.__items.popleft() for _ in range(count)]
+            if batch and self.__policy == BLOCK:
+                self.__cond.notify_all()
+            return batch
+
+    @property
+    def closed(self) -> bool:
+        return self.__closed
+
+    def close(self) -> None:
+        with self.__cond:
+            self.__closed = True
+            self.__cond.notify_all()
+
+
+class Sink:
+    """Receives batches of events on the consumer thread"""
+
+    def write_batch(self, events: list[Event]) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class JsonLinesSink(Sink):
+    """One JSON object per event, appended to a file"""
+
+    def __init__(self, path: str):
+        self.__file = open(path, "a", encoding="utf-8")
+
+    def write_batch(self, events: list[Event]) -> None:
+        dumps = json.dumps
+        self.__file.write("".join(dumps(event.to_dict(), default=str) + "\n" for event in events))
+        self.__file.flush()
+
+    def close(self) -> None:
+        self.__file.close()
+
+
+class StdoutSink(Sink):
+    """Human readable output, one write per batch"""
+
+    def __init__(self, stream=None):
+        self.__stream = stream or sys.stdout
+
+    @staticmethod
+    def format(event: Event) -> str:
+        message = event.message
+        if message.get("type") == "send":
+            line = f"[{event.source}] {message.get('payload')}"
+            if event.data is not None:
+                line += f" ({len(event.data)} bytes)"
+            return line
+        return f"{Style.RED}[{event.source}] {message.get('description', message)}{Style.RESET}"
+
+    def write_batch(self, events: list[Event]) -> None:
+        self.__stream.write("".join(self.format(event) + "\n" for event in events))
+        self.__stream.flush()
+
+
+class OutputSink(Sink):
+    """Each event as a record of the --output json/ndjson stream"""
+
+    def write_batch(self, events: list[Event]) -> None:
+        for event in events:
+            OUTPUT.emit({"type": "message", **event.to_dict()})
+
+
+class MemorySink(Sink):
+    """Keeps the last `limit` events, for callers that inspect them in-process"""
+
+    def __init__(self, limit: int | None = None):
+        self.events = deque(maxlen=limit)
+
+    def write_batch(self, events: list[Event]) -> None:
+        self.events.extend(events)
+
+
+class EventPipeline:
+    """Decouples frida message callbacks from output
+
+    Callbacks only wrap the message and queue it; a single consumer thread
+    drains the queue in batches of up to batch_size and hands each batch to
+    every sink, so a slow sink costs one write per batch instead of one per
+    message and never runs on frida's thread.
+    """
+
+    CAPACITY = 65536
+    BATCH_SIZE = 1024
+    FLUSH_INTERVAL = 0.05
+
+    def __init__(
+        self,
+        sinks: list[Sink],
+        capacity: int = CAPACITY,
+        policy: str = DROP_OLDEST,
+        batch_size: int = BATCH_SIZE,
+        flush_interval: float = FLUSH_INTERVAL,
+    ):
+        self.__sinks = sinks
+        self.__ring = EventRing(capacity, policy)
+        self.__batch_size = batch_size
+        self.__flush_interval = flush_interval
+        self.__thread = None
+        self.received = 0
+        self.written = 0
+
+    @property
+    def dropped(self) -> int:
+        return self.__ring.dropped
+
+    def start(self) -> "EventPipeline":
+        if self.__thread is None:
+            self.__thread = threading.Thread(target=self.__consume, name="event-pipeline", daemon=True)
+            self.__thread.start()
+        return self
+
+    def submit(self, source: str, message: dict, data: bytes | None = None) -> bool:
+        """Queue one message, safe to call from any thread"""
+        self.received += 1
+        return self.__ring.put(
+            Event(source, message, memoryview(data) if data is not None else None, time.time())
+        )
+
+    def on_message(self, source: str):
+        """A script.on("message", ...) callback tagging events with source"""
+        submit = self.submit
+        return lambda message, data: submit(source, message, data)
+
+    def __consume(self) -> None:
+        ring = self.__ring
+        while True:
+            batch = ring.get_batch(self.__batch_size, self.__flush_interval)
+            if batch:
+                for sink in self.__sinks:
+                    try:
+                        sink.write_batch(batch)
+                    except Exception as e:
+                        print(f"{Style.RED}[Error] {type(sink).__name__}: {e}{Style.RESET}", file=sys.stderr)
+                self.written += len(batch)
+            elif ring.closed:
+                return
+
+    def stop(self) -> None:
+        """Stop accepting messages, write what is queued and close the sinks"""
+        self.__ring.close()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+        for sink in self.__sinks:
+            sink.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
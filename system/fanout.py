@@ -0,0 +1,76 @@
+import time
+from typing import Callable, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+DEFAULT_JOBS = 8
+
+
+class DeviceResult:
+    """The outcome of running one operation on one device"""
+
+    __slots__ = ("device", "returncode", "output", "elapsed", "error", "status")
+
+    def __init__(
+        self,
+        device: str,
+        returncode: int,
+        output,
+        elapsed: float,
+        error: Exception | None = None,
+        status: str | None = None,
+    ):
+        self.device = device
+        self.returncode = returncode
+        self.output = output
+        self.elapsed = elapsed
+        self.error = error
+        # Optional short outcome, e.g. "installed" or "already-installed"
+        self.status = status
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.returncode == 0
+
+
+def _timed(func: Callable, device: str) -> DeviceResult:
+    start = time.perf_counter()
+    try:
+        returncode, output, *status = func(device)
+        return DeviceResult(
+            device,
+            returncode,
+            output,
+            time.perf_counter() - start,
+            status=status[0] if status else None,
+        )
+    except Exception as e:
+        return DeviceResult(device, 1, str(e), time.perf_counter() - start, e)
+
+
+def fan_out(devices: Iterable[str], func: Callable, jobs: int = DEFAULT_JOBS) -> Iterator[DeviceResult]:
+    """Run func on every device with at most `jobs` running at once
+
+    Results are yielded as soon as each device finishes, not in input order.
+
+    Arguments:
+        devices {Iterable[str]} -- The device IDs
+        func {Callable} -- func(device_id) -> (returncode, output[, status])
+        jobs {int} -- The concurrency limit
+
+    Returns:
+        Iterator[DeviceResult] -- One result per device, in completion order
+    """
+    devices = list(devices)
+    if not devices:
+        return
+    if len(devices) == 1 or jobs <= 1:
+        for device in devices:
+            yield _timed(func, device)
+        return
+    pool = ThreadPoolExecutor(max_workers=min(jobs, len(devices)))
+    try:
+        futures = [pool.submit(_timed, func, device) for device in devices]
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
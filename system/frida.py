@@ -1,4 +1,633 @@
+import os
+import re
+import gzip
+import lzma
+import time
+import shlex
+import hashlib
+import argparse
+import threading
 from style import Style
+from .adb import ADB, ADBView
+from .fanout import fan_out
+from .events import EventPipeline, JsonLinesSink, StdoutSink, OutputSink, POLICIES, DROP_OLDEST
+from .output import OUTPUT
+
+FRIDA_SERVER_PATH = "/data/local/tmp/frida-server"
+FRIDA_PORT = 27042
+
+# ro.product.cpu.abi -> frida-server release architecture
+ABI_TO_ARCH = {
+    "arm64-v8a": "arm64",
+    "armeabi-v7a": "arm",
+    "armeabi": "arm",
+    "x86_64": "x86_64",
+    "x86": "x86",
+}
+
+# frida-server-16.5.9-android-arm64[.xz|.gz]
+ARCHIVE_NAME = re.compile(r"^frida-server-(\d+(?:\.\d+)*)-android-(\w+?)(\.xz|\.gz)?$")
+
+
+def import_frida():
+    """Import the frida Python bindings, only needed to attach/inject"""
+    try:
+        import frida
+    except ImportError as e:
+        raise ImportError("The frida package is required: pip install -r requirements-frida.txt") from e
+    return frida
+
+
+class ScriptCache:
+    """Script sources and their compiled bytecode, keyed by content hash
+
+    Compiled scripts are only valid for the frida-server (agent) version
+    and runtime that produced them, so both are part of the key. Entries live in memory
+    for the session and under <frida>/scripts/ across runs.
+    """
+
+    RUNTIME = "qjs"
+
+    def __init__(self, cache_dir: str):
+        self.__dir = cache_dir
+        # path -> (mtime, source, sha256)
+        self.__sources: dict[str, tuple[float, str, str]] = {}
+        self.__compiled: dict[str, bytes] = {}
+        self.__lock = threading.Lock()
+
+    def load_source(self, path: str) -> tuple[str, str]:
+        """Read a script once per modification
+        :param path: str -- The script file
+        :return: tuple[str, str] -- The source and its sha256
+        """
+        mtime = os.stat(path).st_mtime
+        with self.__lock:
+            cached = self.__sources.get(path)
+            if cached is not None and cached[0] == mtime:
+                return cached[1], cached[2]
+        with open(path, encoding="utf-8") as f:
+            source = f.read()
+        digest = hashlib.sha256(source.encode()).hexdigest()
+        with self.__lock:
+            self.__sources[path] = (mtime, source, digest)
+        return source, digest
+
+    def key(self, digest: str, frida_version: str) -> str:
+        return f"{digest}-{frida_version}-{self.RUNTIME}"
+
+    def get(self, key: str) -> bytes | None:
+        with self.__lock:
+            data = self.__compiled.get(key)
+        if data is None:
+            try:
+                with open(os.path.join(self.__dir, key + ".bin"), "rb") as f:
+                    data = f.read()
+            except OSError:
+                return None
+            with self.__lock:
+                self.__compiled[key] = data
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        with self.__lock:
+            self.__compiled[key] = data
+        os.makedirs(self.__dir, exist_ok=True)
+        tmp_path = os.path.join(self.__dir, f"{key}.{threading.get_ident()}.part")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, os.path.join(self.__dir, key + ".bin"))
+
+
+# frida lifecycle outcomes per device
+STARTED = "started"
+RUNNING = "running"
+STOPPED = "stopped"
+NOT_RUNNING = "not-running"
+FAILED = "failed"
+
 
 class FridaHelper:
-    pass
\ No newline at end of file
+    """Deploy and manage frida-server on devices
+
+    Pre-downloaded frida-server release archives live in <base_dir>/frida/.
+    Each one is unpacked once into <base_dir>/frida/cache/ together with its
+    md5, so deploying to an already provisioned device is one shell call to
+    compare checksums and one to check the server is listening.
+    """
+
+    # Seconds to wait for frida-server to start listening
+    START_TIMEOUT = 5.0
+
+    def __init__(self, adb, base_dir: str):
+        self.__adb = adb
+        self.__frida_dir = os.path.join(base_dir, "frida")
+        self.__cache_dir = os.path.join(self.__frida_dir, "cache")
+        self.__unpack_lock = threading.Lock()
+        self.__scripts = ScriptCache(os.path.join(self.__frida_dir, "scripts"))
+        # (device_id, port, target) -> frida Session, reused until it detaches
+        self.__sessions: dict = {}
+        # device_id -> frida-server version, the compiled script cache is keyed on it
+        self.__server_versions: dict[str, str] = {}
+        # (device_id, remote port) -> local port forwarded to it
+        self.__forwards: dict[tuple[str, int], int] = {}
+        self.__sessions_lock = threading.Lock()
+
+    def list_archives(self) -> list[tuple[str, str, str]]:
+        """List the frida-server archives available locally
+        :return: list[tuple[str, str, str]] -- (version, arch, path), newest version first
+        """
+        archives = []
+        if os.path.isdir(self.__frida_dir):
+            for name in os.listdir(self.__frida_dir):
+                match = ARCHIVE_NAME.match(name)
+                if match:
+                    archives.append((match.group(1), match.group(2), os.path.join(self.__frida_dir, name)))
+        archives.sort(key=lambda a: tuple(int(p) for p in a[0].split(".")), reverse=True)
+        return archives
+
+    def get_device_arch(self, device_id: str) -> str:
+        """Map the device ABI (from the cached getprop snapshot) to a frida arch
+        :param device_id: str -- The device ID
+        :return: str -- The frida-server architecture
+        """
+        abi = self.__adb.get_device_prop(device_id, "ro.product.cpu.abi")
+        if abi not in ABI_TO_ARCH:
+            raise ValueError(f"Unsupported device ABI: {abi or 'unknown'}")
+        return ABI_TO_ARCH[abi]
+
+    def get_server_binary(self, arch: str, version: str | None = None) -> tuple[str, str, str]:
+        """Find (and unpack on first use) the frida-server binary for an arch
+        :param arch: str -- The frida-server architecture
+        :param version: str -- The frida version, None for the newest available
+        :return: tuple[str, str, str] -- The version, the binary path and its md5
+        """
+        for archive_version, archive_arch, archive_path in self.list_archives():
+            if archive_arch == arch and version in (None, archive_version):
+                break
+        else:
+            raise FileNotFoundError(
+                f"No frida-server {version or ''} for android-{arch} in {self.__frida_dir}"
+            )
+        binary_path = os.path.join(
+            self.__cache_dir, f"frida-server-{archive_version}-android-{arch}"
+        )
+        md5_path = binary_path + ".md5"
+        # Devices deployed in parallel share one unpacked copy
+        with self.__unpack_lock:
+            if os.path.exists(binary_path) and os.path.exists(md5_path):
+                with open(md5_path) as f:
+                    return archive_version, binary_path, f.read().strip()
+            return archive_version, binary_path, self.__unpack(archive_path, binary_path, md5_path)
+
+    @staticmethod
+    def __unpack(archive_path: str, binary_path: str, md5_path: str) -> str:
+        os.makedirs(os.path.dirname(binary_path), exist_ok=True)
+        opener = {".xz": lzma.open, ".gz": gzip.open}.get(
+            os.path.splitext(archive_path)[1], open
+        )
+        digest = hashlib.md5()
+        tmp_path = binary_path + ".part"
+        with opener(archive_path, "rb") as src, open(tmp_path, "wb") as dst:
+            for chunk in iter(lambda: src.read(1024 * 1024), b""):
+                digest.update(chunk)
+                dst.write(chunk)
+        os.chmod(tmp_path, 0o755)
+        os.replace(tmp_path, binary_path)
+        with open(md5_path, "w") as f:
+            f.write(digest.hexdigest())
+        return digest.hexdigest()
+
+    def __remote_state(self, device_id: str, port: int) -> tuple[str, bool]:
+        """md5 of the deployed binary and whether something listens on the port, in one round trip"""
+        result = self.__adb.shell(
+            device_id,
+            f"md5sum {FRIDA_SERVER_PATH} 2>/dev/null; echo ---; cat /proc/net/tcp /proc/net/tcp6 2>/dev/null",
+        )
+        checksum_part, _, tcp_part = result.stdout.partition("---")
+        checksum = checksum_part.split(" ", 1)[0].strip()
+        return checksum, self.__is_listening(tcp_part, port)
+
+    @staticmethod
+    def __is_listening(proc_net_tcp: str, port: int) -> bool:
+        # local_address is ADDR:PORT in hex, state 0A is LISTEN
+        suffix = f":{port:04X}"
+        for line in proc_net_tcp.splitlines():
+            fields = line.split()
+            if len(fields) > 3 and fields[1].endswith(suffix) and fields[3] == "0A":
+                return True
+        return False
+
+    def is_running(self, device_id: str, port: int = FRIDA_PORT) -> bool:
+        result = self.__adb.shell(device_id, "cat /proc/net/tcp /proc/net/tcp6 2>/dev/null")
+        return self.__is_listening(result.stdout, port)
+
+    def wait_until_listening(self, device_id: str, port: int = FRIDA_PORT, timeout: float = START_TIMEOUT) -> bool:
+        deadline = time.monotonic() + timeout
+        while True:
+            if self.is_running(device_id, port):
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.2)
+
+    def deploy(self, device_id: str, version: str | None = None, port: int = FRIDA_PORT) -> tuple[int, str, str]:
+        """Make sure the right frida-server is on the device and running
+        :param device_id: str -- The device ID
+        :param version: str -- The frida version, None for the newest available
+        :param port: int -- The port frida-server listens on
+        :return: tuple[int, str, str] -- The exit code, the log and the outcome
+        """
+        log = []
+        arch = self.get_device_arch(device_id)
+        version, binary_path, checksum = self.get_server_binary(arch, version)
+        remote_checksum, listening = self.__remote_state(device_id, port)
+
+        if remote_checksum == checksum:
+            log.append(f"{Style.GREEN}[INFO] frida-server {version} ({arch}) already deployed{Style.RESET}")
+            if listening:
+                log.append(f"{Style.GREEN}[INFO] frida-server is listening on {port}{Style.RESET}")
+                return 0, "\n".join(log), RUNNING
+        else:
+            if listening:
+                # An other version is running, it has to go before we replace it
+                self.stop(device_id, port)
+            try:
+                self.__adb.push_file(device_id, binary_path, FRIDA_SERVER_PATH)
+            except RuntimeError as e:
+                log.append(f"{Style.RED}[Error] {e}{Style.RESET}")
+                return 1, "\n".join(log), FAILED
+            with self.__sessions_lock:
+                self.__server_versions.pop(device_id, None)
+            log.append(
+                f"{Style.GREEN}[SUCCESS] Pushed frida-server {version} ({arch}) to {FRIDA_SERVER_PATH}{Style.RESET}"
+            )
+        return self.__start(device_id, port, log)
+
+    def start(self, device_id: str, port: int = FRIDA_PORT) -> tuple[int, str, str]:
+        """Start the deployed frida-server if it isn't listening yet
+        :return: tuple[int, str, str] -- The exit code, the log and the outcome
+        """
+        if self.is_running(device_id, port):
+            return 0, f"{Style.GREEN}[INFO] frida-server is listening on {port}{Style.RESET}", RUNNING
+        return self.__start(device_id, port, [])
+
+    def __start(self, device_id: str, port: int, log: list) -> tuple[int, str, str]:
+        server = shlex.quote(FRIDA_SERVER_PATH)
+        result = self.__adb.shell(
+            device_id, f"chmod 755 {server} && {server} -D -l 127.0.0.1:{port}", root=True
+        )
+        if result.returncode != 0:
+            log.append(f"{Style.RED}[Error] {result.stderr.strip() or result.stdout.strip()}{Style.RESET}")
+            return result.returncode, "\n".join(log), FAILED
+        if not self.wait_until_listening(device_id, port):
+            log.append(f"{Style.RED}[Error] frida-server is not listening on {port}{Style.RESET}")
+            return 1, "\n".join(log), FAILED
+        log.append(f"{Style.GREEN}[SUCCESS] frida-server is listening on {port}{Style.RESET}")
+        return 0, "\n".join(log), STARTED
+
+    def stop(self, device_id: str, port: int = FRIDA_PORT) -> tuple[int, str, str]:
+        """Stop frida-server and wait for its port to close
+        :return: tuple[int, str, str] -- The exit code, the log and the outcome
+        """
+        # -x matches the process name, -f would also match the shell running pkill
+        self.__adb.shell(device_id, "pkill -x frida-server || killall frida-server", root=True)
+        deadline = time.monotonic() + self.START_TIMEOUT
+        while self.is_running(device_id, port):
+            if time.monotonic() >= deadline:
+                return 1, f"{Style.RED}[Error] frida-server is still running{Style.RESET}", FAILED
+            time.sleep(0.2)
+        return 0, f"{Style.GREEN}[SUCCESS] frida-server stopped{Style.RESET}", STOPPED
+
+    def status(self, device_id: str, port: int = FRIDA_PORT) -> tuple[int, str, str]:
+        if self.is_running(device_id, port):
+            return 0, f"frida-server is listening on {port}", RUNNING
+        return 0, "frida-server is not running", NOT_RUNNING
+
+    def __frida_device(self, device_id: str, port: int):
+        """The frida Device for a device's frida-server
+        :param device_id: str -- The device ID
+        :param port: int -- The port frida-server listens on
+        :return: frida.core.Device -- The device
+        """
+        frida = import_frida()
+        if port == FRIDA_PORT:
+            return frida.get_device(device_id, timeout=5) if device_id else frida.get_usb_device(timeout=5)
+        # frida's USB transport only knows the default port, reach others through adb forward
+        with self.__sessions_lock:
+            local_port = self.__forwards.get((device_id, port))
+        if local_port is None:
+            local_port = self.__adb.forward(device_id, port)
+            with self.__sessions_lock:
+                self.__forwards[(device_id, port)] = local_port
+        return frida.get_device_manager().add_remote_device(f"127.0.0.1:{local_port}")
+
+    def server_version(self, device_id: str) -> str:
+        """The version of the deployed frida-server, which is also the version of its agent
+        :param device_id: str -- The device ID
+        :return: str -- e.g. "16.5.9", or "host-<version>" if the server can't tell
+        """
+        with self.__sessions_lock:
+            version = self.__server_versions.get(device_id)
+        if version is None:
+            result = self.__adb.shell(device_id, f"{shlex.quote(FRIDA_SERVER_PATH)} --version")
+            match = re.search(r"\d+(?:\.\d+)+", result.stdout) if result.returncode == 0 else None
+            # A server started some other way: the bindings' version is the best guess
+            version = match.group(0) if match else f"host-{import_frida().__version__}"
+            with self.__sessions_lock:
+                self.__server_versions[device_id] = version
+        return version
+
+    def attach(self, device_id: str, target: int | str, port: int = FRIDA_PORT):
+        """Attach to a process, reusing the session of an earlier attach
+        :param device_id: str -- The device ID
+        :param target: int | str -- The PID or process name
+        :param port: int -- The port frida-server listens on
+        :return: frida.core.Session -- The session
+        """
+        key = (device_id, port, target)
+        with self.__sessions_lock:
+            session = self.__sessions.get(key)
+        if session is not None and not session.is_detached:
+            return session
+        device = self.__frida_device(device_id, port)
+        session = device.attach(target)
+        session.on("detached", lambda *args: self.__forget_session(key, session))
+        with self.__sessions_lock:
+            self.__sessions[key] = session
+        return session
+
+    def __forget_session(self, key, session) -> None:
+        with self.__sessions_lock:
+            if self.__sessions.get(key) is session:
+                del self.__sessions[key]
+
+    def resolve_target(self, device_id: str, target: int | str, wait: float | None = None) -> int | str:
+        """The PID to attach to for a package or process name, from the device's process table
+        :param device_id: str -- The device ID
+        :param target: int | str -- A PID, a package (its main process) or a process name
+        :param wait: float -- Seconds to wait for the process to start, None to not wait
+        :return: int | str -- The PID, or the target unchanged for frida to resolve
+        """
+        if isinstance(target, int):
+            return target
+        if wait is not None:
+            process = self.__adb.wait_for_process(device_id, package=target, timeout=wait)
+            if process is None:
+                raise RuntimeError(f"{target} did not start within {wait:g}s")
+            return process["pid"]
+        matches = self.__adb.find_processes(device_id, package=target)
+        return matches[0]["pid"] if matches else target
+
+    def inject(
+        self, device_id: str, target: int | str, script_path: str, on_message=None, port: int = FRIDA_PORT
+    ):
+        """Load a script into a process, compiling it only once per content and frida-server version
+        :param device_id: str -- The device ID
+        :param target: int | str -- The PID or process name
+        :param script_path: str -- The script file
+        :param on_message: Callable -- on_message(message, data) for send() messages
+        :param port: int -- The port frida-server listens on
+        :return: tuple[frida.core.Script, dict] -- The loaded script and per-phase timings in seconds
+        """
+        frida = import_frida()
+        timings = {}
+        start = time.perf_counter()
+        session = self.attach(device_id, target, port)
+        timings["attach"] = time.perf_counter() - start
+
+        source, digest = self.__scripts.load_source(script_path)
+        # The agent in the target compiles and runs the bytecode, not the host bindings
+        key = self.__scripts.key(digest, self.server_version(device_id))
+        name = os.path.basename(script_path)
+        start = time.perf_counter()
+        compiled = self.__scripts.get(key)
+        timings["cached"] = compiled is not None
+        if compiled is None:
+            compiled = self.__compile(frida, session, source, name, key)
+        timings["compile"] = time.perf_counter() - start
+
+        try:
+            script = self.__load_script(session, compiled, source, name, on_message, timings)
+        except (frida.InvalidArgumentError, frida.InvalidOperationError, frida.NotSupportedError, frida.ProtocolError):
+            if not timings["cached"]:
+                raise
+            # A stale entry, e.g. written for another frida-server build: compile again and replace it
+            start = time.perf_counter()
+            compiled = self.__compile(frida, session, source, name, key)
+            timings["cached"] = False
+            timings["compile"] += time.perf_counter() - start
+            script = self.__load_script(session, compiled, source, name, on_message, timings)
+        return script, timings
+
+    def __compile(self, frida, session, source: str, name: str, key: str) -> bytes | None:
+        """Compile a script in the target and cache the bytecode, None if the agent can't"""
+        try:
+            compiled = session.compile_script(source, name=name, runtime=ScriptCache.RUNTIME)
+        except (AttributeError, frida.NotSupportedError):
+            return None
+        self.__scripts.put(key, compiled)
+        return compiled
+
+    @staticmethod
+    def __load_script(session, compiled: bytes | None, source: str, name: str, on_message, timings: dict):
+        start = time.perf_counter()
+        if compiled is not None:
+            script = session.create_script_from_bytes(compiled, name=name, runtime=ScriptCache.RUNTIME)
+        else:
+            script = session.create_script(source, name=name)
+        timings["create_script"] = time.perf_counter() - start
+        if on_message is not None:
+            script.on("message", on_message)
+
+        start = time.perf_counter()
+        script.load()
+        timings["load"] = time.perf_counter() - start
+        return script
+
+    def inject_many(
+        self,
+        targets: list[tuple[str, int | str]],
+        script_path: str,
+        jobs: int,
+        on_message=None,
+        wait: float | None = None,
+        port: int = FRIDA_PORT,
+    ):
+        """Inject one script into many processes/devices concurrently
+        :param targets: list[tuple[str, int | str]] -- (device_id, pid or process name) pairs
+        :param script_path: str -- The script file
+        :param jobs: int -- How many injections run at once
+        :param on_message: Callable -- on_message(name) -> message callback for the "serial/target" name
+        :param wait: float -- Seconds to wait for named targets to start, None to not wait
+        :param port: int -- The port frida-server listens on
+        :return: Iterator[DeviceResult] -- One result per target as it finishes, output is (script, timings)
+        """
+        by_name = {f"{device_id}/{target}": (device_id, target) for device_id, target in targets}
+
+        def run(name):
+            device_id, target = by_name[name]
+            start = time.perf_counter()
+            pid = self.resolve_target(device_id, target, wait)
+            resolved = time.perf_counter() - start
+            script, timings = self.inject(
+                device_id, pid, script_path, on_message(name) if on_message else None, port
+            )
+            return 0, (script, {"resolve": resolved, **timings})
+
+        # Read the source once up front instead of racing on the first load
+        self.__scripts.load_source(script_path)
+        return fan_out(by_name, run, jobs)
+
+    def run_inject(self, *args) -> None:
+        """Inject a script into the given processes on the selected devices and keep it loaded
+        :return: None
+        """
+        cli_args = args[0]
+        targets = [
+            (device_id, int(target) if target.isdigit() else target)
+            for device_id in self.__adb.select_devices(cli_args)
+            for target in cli_args.target
+        ]
+        loaded = []
+        if cli_args.output:
+            sinks = [JsonLinesSink(cli_args.output)]
+        else:
+            sinks = [OutputSink() if OUTPUT.structured else StdoutSink()]
+        pipeline = EventPipeline(sinks, capacity=cli_args.queue_size, policy=cli_args.policy)
+        with pipeline:
+            for result in self.inject_many(
+                targets, cli_args.script, cli_args.jobs, pipeline.on_message, cli_args.wait, cli_args.port
+            ):
+                if result.ok:
+                    script, timings = result.output
+                    loaded.append(script)
+                    result.output = timings if OUTPUT.structured else FridaView.format_timings(timings)
+                ADBView.print_device_result(result)
+            if not loaded:
+                return
+            print(f"{Style.CYAN}[INFO] {len(loaded)} script(s) loaded, Ctrl+C to detach{Style.RESET}")
+            try:
+                threading.Event().wait()
+            except KeyboardInterrupt:
+                pass
+        print(
+            f"{Style.CYAN}[INFO] {pipeline.received} message(s), "
+            f"{pipeline.written} written, {pipeline.dropped} dropped{Style.RESET}"
+        )
+
+    def run(self, *args) -> None:
+        """Run a frida lifecycle action on the selected devices
+        :return: None
+        """
+        cli_args = args[0]
+        actions = {
+            "deploy": lambda device_id: self.deploy(device_id, cli_args.version, cli_args.port),
+            "start": lambda device_id: self.start(device_id, cli_args.port),
+            "stop": lambda device_id: self.stop(device_id, cli_args.port),
+            "status": lambda device_id: self.status(device_id, cli_args.port),
+        }
+        for result in fan_out(
+            self.__adb.select_devices(cli_args), actions[cli_args.action], cli_args.jobs
+        ):
+            ADBView.print_device_result(result)
+
+    def print_archives(self, *args) -> None:
+        archives = self.list_archives()
+        if OUTPUT.structured:
+            for version, arch, path in archives:
+                OUTPUT.emit({"type": "archive", "version": version, "arch": arch, "path": path})
+            return
+        print(f"{Style.BOLD}frida-server archives in {self.__frida_dir}: {len(archives)}{Style.RESET}")
+        for version, arch, path in archives:
+            print(f" - {Style.GREEN}{version}{Style.RESET} android-{arch} {os.path.basename(path)}")
+
+    # Arg parser
+    @staticmethod
+    def add_parser(frida, subparsers):
+        parser = subparsers.add_parser("frida", help="frida-server commands")
+        subparsers = parser.add_subparsers(dest="subcommand", help="Subcommands")
+
+        for action, help_text in (
+            ("deploy", "Push frida-server if it changed and start it"),
+            ("start", "Start the deployed frida-server"),
+            ("stop", "Stop frida-server"),
+            ("status", "Check whether frida-server is listening"),
+        ):
+            action_parser: argparse.ArgumentParser = subparsers.add_parser(action, help=help_text)
+            ADB.add_device_arguments(action_parser)
+            action_parser.add_argument(
+                "--port",
+                type=int,
+                help=f"The port frida-server listens on (default: {FRIDA_PORT})",
+                default=FRIDA_PORT,
+            )
+            if action == "deploy":
+                action_parser.add_argument(
+                    "--version",
+                    type=str,
+                    help="The frida-server version (default: newest archive in frida/)",
+                    default=None,
+                )
+            action_parser.set_defaults(func=frida.run, action=action)
+
+        inject_parser = subparsers.add_parser(
+            "inject", help="Load a script into running processes"
+        )
+        ADB.add_device_arguments(inject_parser)
+        inject_parser.add_argument(
+            "-s", "--script", type=str, help="The script to load", required=True
+        )
+        inject_parser.add_argument(
+            "-t",
+            "--target",
+            type=str,
+            action="append",
+            help="PID, package or process name to attach to (repeatable)",
+            required=True,
+        )
+        inject_parser.add_argument(
+            "--port",
+            type=int,
+            help=f"The port frida-server listens on (default: {FRIDA_PORT})",
+            default=FRIDA_PORT,
+        )
+        inject_parser.add_argument(
+            "--wait",
+            type=float,
+            default=None,
+            help="Wait up to this many seconds for a named target to start",
+        )
+        inject_parser.add_argument(
+            "-o", "--output", type=str, help="Append messages to this JSON Lines file instead of printing them"
+        )
+        inject_parser.add_argument(
+            "--queue-size",
+            type=int,
+            default=EventPipeline.CAPACITY,
+            help="Messages buffered before the queue policy applies",
+        )
+        inject_parser.add_argument(
+            "--policy",
+            choices=POLICIES,
+            default=DROP_OLDEST,
+            help="What to do with messages when the queue is full",
+        )
+        inject_parser.set_defaults(func=frida.run_inject)
+
+        list_parser = subparsers.add_parser("list", help="List local frida-server archives")
+        list_parser.set_defaults(func=frida.print_archives)
+        return parser
+
+
+class FridaView:
+
+    @staticmethod
+    def format_timings(timings: dict) -> str:
+        compile_note = " (cached)" if timings.get("cached") else ""
+        return (
+            f"resolve {timings.get('resolve', 0) * 1000:.1f} ms, "
+            f"attach {timings['attach'] * 1000:.1f} ms, "
+            f"compile {timings['compile'] * 1000:.1f} ms{compile_note}, "
+            f"create_script {timings['create_script'] * 1000:.1f} ms, "
+            f"load {timings['load'] * 1000:.1f} ms"
+        )
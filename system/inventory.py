@@ -0,0 +1,210 @@
+import os
+import re
+import json
+import time
+import threading
+
+# package:/data/app/~~a1==/com.example-b2==/base.apk=com.example versionCode:42 uid:10123
+PM_LIST_LINE = re.compile(
+    r"^package:(?P<path>.*)=(?P<package>[^\s=]+)(?: versionCode:(?P<version_code>\d+))?(?: uid:(?P<uid>\d+)\S*)?\s*$",
+    re.M,
+)
+# "  Package [com.example] (1a2b3c):" opens one entry of the Packages: section
+DUMPSYS_PACKAGE = re.compile(r"^  Package \[(?P<package>[^\]]+)\] \(")
+DUMPSYS_FIELD = re.compile(r"(\w+)=(\[[^\]]*\]|\S+)")
+
+PM_LIST_COMMAND = "pm list packages -f -U --show-versioncode"
+# Sections of a bulk dump are separated by this line
+DUMP_MARKER = "__FSP_DUMPSYS__"
+
+
+def parse_pm_list(output: str) -> dict[str, dict]:
+    """Parse `pm list packages -f -U --show-versioncode`
+
+    Arguments:
+        output {str} -- The command output
+
+    Returns:
+        dict -- package -> {"package", "path", "version_code", "uid"}
+    """
+    packages = {}
+    for match in PM_LIST_LINE.finditer(output):
+        packages[match["package"]] = {
+            "package": match["package"],
+            "path": match["path"],
+            "version_code": int(match["version_code"]) if match["version_code"] else None,
+            "uid": int(match["uid"]) if match["uid"] else None,
+        }
+    return packages
+
+
+def parse_dumpsys_packages(output: str) -> dict[str, dict]:
+    """Parse the Packages: sections of `dumpsys package [packages|<name>]`
+
+    Only the fields the inventory keeps are extracted: version name,
+    debuggable flag, split names and last update time.
+
+    Arguments:
+        output {str} -- One or more concatenated dumps
+
+    Returns:
+        dict -- package -> details
+    """
+    details = {}
+    current = None
+    in_packages = False
+    for line in output.splitlines():
+        if line and not line[0].isspace():
+            # Top level header; per-package entries only count inside "Packages:"
+            in_packages = line.rstrip() == "Packages:"
+            current = None
+            continue
+        if not in_packages:
+            continue
+        match = DUMPSYS_PACKAGE.match(line)
+        if match:
+            current = details.setdefault(
+                match["package"],
+                {"version_name": None, "debuggable": False, "splits": [], "last_update": None},
+            )
+            continue
+        if current is None:
+            continue
+        stripped = line.strip()
+        if stripped.startswith("lastUpdateTime="):
+            current["last_update"] = stripped.split("=", 1)[1]
+            continue
+        for key, value in DUMPSYS_FIELD.findall(stripped):
+            if key == "versionName":
+                current["version_name"] = value
+            elif key in ("flags", "pkgFlags") and value.startswith("["):
+                current["debuggable"] = current["debuggable"] or "DEBUGGABLE" in value.split()
+            elif key == "splits" and value.startswith("["):
+                current["splits"] = [name.strip() for name in value[1:-1].split(",") if name.strip()]
+    return details
+
+
+def merge_package(listed: dict, detail: dict | None) -> dict:
+    """One inventory record from a pm list entry and its dumpsys details"""
+    detail = detail or {}
+    base_dir = os.path.dirname(listed["path"])
+    apk_paths = [listed["path"]] + [
+        f"{base_dir}/split_{name}.apk" for name in detail.get("splits", []) if name != "base"
+    ]
+    return {
+        **listed,
+        "version_name": detail.get("version_name"),
+        "debuggable": detail.get("debuggable", False),
+        "apk_paths": apk_paths,
+        "last_update": detail.get("last_update"),
+    }
+
+
+class PackageInventory:
+    """Installed packages per device, persisted under <base_dir>/inventory
+
+    Each device's index is stored with the ro.build.fingerprint it was built
+    on; a different fingerprint (an OTA, a reflashed emulator) means a full
+    rebuild instead of an incremental refresh. Queries by name, version,
+    UID or debuggable flag are answered from the stored index without
+    touching the device.
+    """
+
+    def __init__(self, inventory_dir: str):
+        self.__dir = inventory_dir
+        self.__lock = threading.Lock()
+        # serial -> {"fingerprint", "updated_at", "packages"}
+        self.__devices: dict[str, dict] = {}
+
+    def __path(self, serial: str) -> str:
+        safe = re.sub(r"[^\w.-]", "_", serial)
+        return os.path.join(self.__dir, f"{safe}.json")
+
+    def load(self, serial: str, fingerprint: str | None = None) -> dict | None:
+        """The stored index of a device, None if missing or built on another build
+
+        Arguments:
+            serial {str} -- The device serial
+            fingerprint {str} -- The device's current ro.build.fingerprint, None to accept any
+
+        Returns:
+            dict | None -- {"fingerprint", "updated_at", "packages"}
+        """
+        with self.__lock:
+            index = self.__devices.get(serial)
+            if index is None:
+                try:
+                    with open(self.__path(serial)) as f:
+                        index = json.load(f)
+                except (OSError, ValueError):
+                    return None
+                self.__devices[serial] = index
+        if fingerprint is not None and index.get("fingerprint") != fingerprint:
+            return None
+        return index
+
+    def save(self, serial: str, fingerprint: str, packages: dict[str, dict]) -> dict:
+        index = {"fingerprint": fingerprint, "updated_at": time.time(), "packages": packages}
+        with self.__lock:
+            self.__devices[serial] = index
+            os.makedirs(self.__dir, exist_ok=True)
+            tmp_path = self.__path(serial) + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(index, f)
+            os.replace(tmp_path, self.__path(serial))
+        return index
+
+    @staticmethod
+    def diff(known: dict[str, dict], listed: dict[str, dict]) -> tuple[list[str], list[str]]:
+        """What changed between the stored index and a fresh pm list
+
+        An update always moves the APK to a new directory, so a changed path
+        or version code is enough to tell without asking dumpsys.
+
+        Returns:
+            tuple[list[str], list[str]] -- (added or changed, removed) package names
+        """
+        changed = [
+            name
+            for name, entry in listed.items()
+            if name not in known
+            or known[name]["path"] != entry["path"]
+            or known[name]["version_code"] != entry["version_code"]
+            or known[name]["uid"] != entry["uid"]
+        ]
+        removed = [name for name in known if name not in listed]
+        return changed, removed
+
+    @staticmethod
+    def query(
+        packages: dict[str, dict],
+        name: str | None = None,
+        version: str | None = None,
+        uid: int | None = None,
+        debuggable: bool | None = None,
+    ) -> list[dict]:
+        """Filter an index locally
+
+        Arguments:
+            packages {dict} -- The index from load()/save()
+            name {str} -- Regex searched in the package name
+            version {str} -- Exact versionName or versionCode
+            uid {int} -- The app UID
+            debuggable {bool} -- Only (non-)debuggable packages
+
+        Returns:
+            list[dict] -- Matching records sorted by package name
+        """
+        pattern = re.compile(name) if name else None
+        matches = []
+        for record in packages.values():
+            if uid is not None and record["uid"] != uid:
+                continue
+            if version is not None and version not in (record["version_name"], str(record["version_code"])):
+                continue
+            if debuggable is not None and record["debuggable"] != debuggable:
+                continue
+            if pattern is not None and not pattern.search(record["package"]):
+                continue
+            matches.append(record)
+        return sorted(matches, key=lambda record: record["package"])
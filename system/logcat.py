@@ -0,0 +1,207 @@
+import os
+import gzip
+import time
+import shutil
+import struct
+from typing import Iterable
+
+# android_LogPriority
+VERBOSE, DEBUG, INFO, WARN, ERROR, FATAL = range(2, 8)
+PRIORITY_LETTERS = {VERBOSE: "V", DEBUG: "D", INFO: "I", WARN: "W", ERROR: "E", FATAL: "F"}
+PRIORITIES = {letter: priority for priority, letter in PRIORITY_LETTERS.items()}
+
+# Common prefix of every logger_entry version: len, hdr_size, pid, tid, sec, nsec.
+# v1 has no hdr_size (it is padding, 0) and a 20 byte header; v2/v3 add one
+# uint32 (euid/lid, 24 bytes) and v4 adds lid and uid (28 bytes).
+ENTRY_HEADER = struct.Struct("<HHiIiI")
+V1_HEADER_SIZE = ENTRY_HEADER.size
+V4_HEADER = struct.Struct("<HHiIiIII")
+UINT32 = struct.Struct("<I")
+
+
+class LogEntry:
+    """One decoded logcat entry"""
+
+    __slots__ = ("pid", "tid", "sec", "nsec", "lid", "uid", "priority", "tag", "message")
+
+    def __init__(self, pid, tid, sec, nsec, lid, uid, priority, tag, message):
+        self.pid = pid
+        self.tid = tid
+        self.sec = sec
+        self.nsec = nsec
+        self.lid = lid
+        self.uid = uid
+        self.priority = priority
+        self.tag = tag
+        self.message = message
+
+    def to_dict(self) -> dict:
+        return {
+            "time": self.sec + self.nsec / 1e9,
+            "pid": self.pid,
+            "tid": self.tid,
+            "uid": self.uid,
+            "priority": PRIORITY_LETTERS.get(self.priority, "?"),
+            "tag": self.tag,
+            "message": self.message,
+        }
+
+
+class LogFilter:
+    """Which entries to keep, checked against the raw header and tag bytes
+    so rejected entries are never decoded"""
+
+    def __init__(self, tags: Iterable[str] | None = None, min_priority: int = VERBOSE, pids: Iterable[int] | None = None):
+        self.tags = frozenset(tag.encode() for tag in tags) if tags else None
+        self.min_priority = min_priority
+        self.pids = frozenset(pids) if pids else None
+
+
+class LogcatParser:
+    """Incremental decoder for `logcat -B` output
+
+    feed() accepts arbitrary chunks and returns the complete entries that
+    pass the filter; a partial entry at the end of a chunk is kept until
+    the next one.
+    """
+
+    def __init__(self, log_filter: LogFilter | None = None):
+        self.__filter = log_filter or LogFilter()
+        self.__buffer = bytearray()
+        self.read = 0
+        self.kept = 0
+
+    def feed(self, chunk: bytes) -> list[LogEntry]:
+        buf = self.__buffer
+        buf += chunk
+        end = len(buf)
+        offset = 0
+        entries = []
+        append = entries.append
+        unpack_header = ENTRY_HEADER.unpack_from
+        unpack_v4 = V4_HEADER.unpack_from
+        unpack_uint32 = UINT32.unpack_from
+        tags = self.__filter.tags
+        pids = self.__filter.pids
+        min_priority = self.__filter.min_priority
+        read = 0
+        while end - offset >= V1_HEADER_SIZE:
+            length, hdr_size = buf[offset] | buf[offset + 1] << 8, buf[offset + 2] | buf[offset + 3] << 8
+            if hdr_size < V1_HEADER_SIZE:
+                hdr_size = V1_HEADER_SIZE
+            start = offset + hdr_size
+            next_offset = start + length
+            if next_offset > end:
+                break
+            entry_offset = offset
+            offset = next_offset
+            read += 1
+            if length < 2:
+                continue
+            priority = buf[start]
+            if priority < min_priority:
+                continue
+            tag_end = buf.find(b"\0", start + 1, next_offset)
+            if tag_end < 0:
+                tag_end = next_offset
+            if tags is not None and bytes(buf[start + 1 : tag_end]) not in tags:
+                continue
+            # Everything modern devices send is v4, the rest is rare enough to unpack twice
+            if hdr_size >= 28:
+                _, _, pid, tid, sec, nsec, lid, uid = unpack_v4(buf, entry_offset)
+            else:
+                _, _, pid, tid, sec, nsec = unpack_header(buf, entry_offset)
+                lid = unpack_uint32(buf, entry_offset + 20)[0] if hdr_size >= 24 else 0
+                uid = 0
+            if pids is not None and pid not in pids:
+                continue
+            append(
+                LogEntry(
+                    pid,
+                    tid,
+                    sec,
+                    nsec,
+                    lid,
+                    uid,
+                    priority,
+                    buf[start + 1 : tag_end].decode(errors="replace"),
+                    buf[tag_end + 1 : next_offset].rstrip(b"\0\n").decode(errors="replace"),
+                )
+            )
+        del buf[:offset]
+        self.read += read
+        self.kept += len(entries)
+        return entries
+
+
+class ThreadtimeFormatter:
+    """Formats entries like `logcat -v threadtime`"""
+
+    def __init__(self):
+        self.__last_sec = None
+        self.__stamp = ""
+
+    def format(self, entry: LogEntry) -> str:
+        if entry.sec != self.__last_sec:
+            # One strftime per second of log rather than per entry
+            self.__last_sec = entry.sec
+            self.__stamp = time.strftime("%m-%d %H:%M:%S", time.localtime(entry.sec))
+        prefix = (
+            f"{self.__stamp}.{entry.nsec // 1000000:03d} {entry.pid:5d} {entry.tid:5d} "
+            f"{PRIORITY_LETTERS.get(entry.priority, '?')} {entry.tag}: "
+        )
+        if "\n" not in entry.message:
+            return prefix + entry.message + "\n"
+        return "".join(prefix + line + "\n" for line in entry.message.split("\n"))
+
+    def format_all(self, entries: list[LogEntry]) -> str:
+        return "".join(map(self.format, entries))
+
+
+class RotatingLogWriter:
+    """Appends text to a file, rotating it to path.1 .. path.N past max_bytes
+
+    With compress=True rotated files are gzipped (path.1.gz ...).
+    """
+
+    def __init__(self, path: str, max_bytes: int = 16 * 1024 * 1024, backups: int = 5, compress: bool = False):
+        self.__path = path
+        self.__max_bytes = max_bytes
+        self.__backups = backups
+        self.__compress = compress
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.__file = open(path, "ab")
+        self.__size = self.__file.tell()
+
+    def __rotated(self, index: int) -> str:
+        return f"{self.__path}.{index}" + (".gz" if self.__compress else "")
+
+    def write(self, text: str) -> None:
+        data = text.encode()
+        if self.__size and self.__size + len(data) > self.__max_bytes:
+            self.rotate()
+        self.__file.write(data)
+        self.__size += len(data)
+
+    def rotate(self) -> None:
+        self.__file.close()
+        if self.__backups > 0:
+            for index in range(self.__backups - 1, 0, -1):
+                if os.path.exists(self.__rotated(index)):
+                    os.replace(self.__rotated(index), self.__rotated(index + 1))
+            if self.__compress:
+                with open(self.__path, "rb") as src, gzip.open(self.__rotated(1), "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+                os.remove(self.__path)
+            else:
+                os.replace(self.__path, self.__rotated(1))
+        else:
+            os.remove(self.__path)
+        self.__file = open(self.__path, "ab")
+        self.__size = 0
+
+    def flush(self) -> None:
+        self.__file.flush()
+
+    def close(self) -> None:
+        self.__file.close()
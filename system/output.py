@@ -0,0 +1,83 @@
+import os
+import sys
+import json
+import threading
+from style import Style
+
+# --output formats
+TABLE = "table"
+JSON = "json"
+NDJSON = "ndjson"
+FORMATS = (TABLE, JSON, NDJSON)
+
+
+class Output:
+    """Where the views send results, chosen once at startup
+
+    table is the colored human output the views print themselves. json and
+    ndjson turn every result into a record: ndjson writes each one as a line
+    as soon as it exists, json writes them all as one array when the command
+    is done. In both, stdout carries only records and any other print goes
+    to stderr. Failures reported through fail() become the exit code.
+    """
+
+    def __init__(self):
+        self.format = TABLE
+        self.structured = False
+        self.exit_code = 0
+        self.__stream = sys.stdout
+        self.__records: list[dict] = []
+        self.__lock = threading.Lock()
+
+    def configure(self, output_format: str = TABLE, color: bool | None = None) -> None:
+        """Pick the format and whether to color
+
+        Arguments:
+            output_format {str} -- table, json or ndjson
+            color {bool} -- Force ANSI colors on or off, None colors only a terminal without NO_COLOR
+        """
+        self.format = output_format
+        self.structured = output_format != TABLE
+        self.exit_code = 0
+        self.__stream = sys.stdout
+        if color is None:
+            color = not self.structured and sys.stdout.isatty() and "NO_COLOR" not in os.environ
+        if not color:
+            Style.disable()
+        if self.structured:
+            # Progress and summaries stay readable without breaking the records
+            sys.stdout = sys.stderr
+
+    def fail(self, returncode: int | None = 1) -> None:
+        """Record a failed device or command, the first one's exit code is kept
+
+        Arguments:
+            returncode {int} -- Its exit code, anything outside 1..255 exits with 1
+        """
+        with self.__lock:
+            if not self.exit_code:
+                self.exit_code = returncode if isinstance(returncode, int) and 0 < returncode < 256 else 1
+
+    def emit(self, record: dict) -> None:
+        if self.format == NDJSON:
+            line = json.dumps(record, default=str) + "\n"
+            with self.__lock:
+                self.__stream.write(line)
+                self.__stream.flush()
+        else:
+            with self.__lock:
+                self.__records.append(record)
+
+    def finish(self) -> None:
+        """Write what json collected, called once the command is done"""
+        if self.format != JSON:
+            return
+        with self.__lock:
+            records, self.__records = self.__records, []
+        json.dump(records, self.__stream, default=str, indent=2)
+        self.__stream.write("\n")
+        self.__stream.flush()
+
+
+# The process-wide output used by every view
+OUTPUT = Output()
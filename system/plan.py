@@ -0,0 +1,233 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Callable, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from .fanout import DeviceResult, DEFAULT_JOBS
+
+# Node id of steps that run once for the whole plan instead of per device
+GLOBAL = "*"
+
+# Step outcomes besides the step's own status
+DONE = "done"
+CACHED = "cached"
+BLOCKED = "blocked"
+FAILED = "failed"
+
+
+class Step:
+    """One provisioning step
+
+    func(device_id, inputs) -> (returncode, output[, status]) like the fan_out
+    functions, where inputs maps each required step to its output. output
+    must be JSON serializable so it can be memoized; on failure it is the log.
+    Global steps run once (device_id is None) and every device sees their output.
+    """
+
+    __slots__ = ("name", "func", "requires", "per_device", "params")
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable,
+        requires: Iterable[str] = (),
+        per_device: bool = True,
+        params: dict | None = None,
+    ):
+        self.name = name
+        self.func = func
+        self.requires = tuple(requires)
+        self.per_device = per_device
+        # Anything besides the inputs that changes what the step does
+        self.params = params or {}
+
+
+class Plan:
+    """A DAG of steps, validated and ordered once"""
+
+    def __init__(self, name: str, steps: Iterable[Step]):
+        self.name = name
+        self.steps = {}
+        for step in steps:
+            if step.name in self.steps:
+                raise ValueError(f"Duplicate step: {step.name}")
+            self.steps[step.name] = step
+        for step in self.steps.values():
+            for required in step.requires:
+                if required not in self.steps:
+                    raise ValueError(f"{step.name} requires unknown step {required}")
+                if self.steps[required].per_device and not step.per_device:
+                    raise ValueError(f"Global step {step.name} can't require per-device step {required}")
+        self.order = self.__topological_order()
+
+    def __topological_order(self) -> list[str]:
+        order = []
+        state = {}
+
+        def visit(name, path):
+            if state.get(name) == "done":
+                return
+            if state.get(name) == "visiting":
+                raise ValueError("Dependency cycle: " + " -> ".join(path + [name]))
+            state[name] = "visiting"
+            for required in self.steps[name].requires:
+                visit(required, path + [name])
+            state[name] = "done"
+            order.append(name)
+
+        for name in self.steps:
+            visit(name, [])
+        return order
+
+
+class PlanState:
+    """Completed steps of unfinished runs, persisted so a rerun resumes
+
+    Each entry remembers a key over the step's params and inputs, so a step
+    is only skipped if it would run with exactly the same inputs again.
+    """
+
+    def __init__(self, path: str | None):
+        self.__path = path
+        self.__lock = threading.Lock()
+        self.__nodes: dict[str, dict] = {}
+        if path is not None:
+            try:
+                with open(path) as f:
+                    self.__nodes = json.load(f).get("nodes", {})
+            except (OSError, ValueError):
+                self.__nodes = {}
+
+    @staticmethod
+    def node_id(device: str, step: str) -> str:
+        return f"{device}/{step}"
+
+    def get(self, node: str, key: str):
+        """The memoized output, or None when the step has to run"""
+        with self.__lock:
+            entry = self.__nodes.get(node)
+        if entry is not None and entry["key"] == key:
+            return entry
+        return None
+
+    def put(self, node: str, key: str, output, status: str | None) -> None:
+        with self.__lock:
+            self.__nodes[node] = {"key": key, "output": output, "status": status, "at": time.time()}
+            self.__save()
+
+    def forget(self, nodes: Iterable[str]) -> None:
+        with self.__lock:
+            for node in nodes:
+                self.__nodes.pop(node, None)
+            self.__save()
+
+    def __save(self) -> None:
+        if self.__path is None:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.__path)), exist_ok=True)
+        tmp_path = self.__path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"nodes": self.__nodes}, f, indent=2)
+        os.replace(tmp_path, self.__path)
+
+
+def step_key(step: Step, inputs: dict) -> str:
+    data = json.dumps([step.name, step.params, inputs], sort_keys=True, default=str)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def run_plan(
+    plan: Plan, devices: Iterable[str], state: PlanState, jobs: int = DEFAULT_JOBS
+) -> Iterator[DeviceResult]:
+    """Run every step on every device, as concurrently as the DAG allows
+
+    Steps that completed with the same inputs in an earlier, unfinished run
+    are not run again. A failed step blocks only what depends on it, on its
+    own device. Once a device has finished every step its memoized steps are
+    forgotten, so the next run provisions it again from scratch.
+
+    Arguments:
+        plan {Plan} -- The steps
+        devices {Iterable[str]} -- The device IDs
+        state {PlanState} -- Memoized outputs of unfinished runs
+        jobs {int} -- How many steps run at once, across all devices
+
+    Returns:
+        Iterator[DeviceResult] -- One result per step and device ("serial/step"), in completion order
+    """
+    devices = list(devices)
+    nodes = {}
+    for name in plan.order:
+        step = plan.steps[name]
+        for device in devices if step.per_device else [GLOBAL]:
+            requires = [
+                PlanState.node_id(device if plan.steps[r].per_device else GLOBAL, r)
+                for r in step.requires
+            ]
+            nodes[PlanState.node_id(device, name)] = (device, step, requires)
+    dependents = {node: [] for node in nodes}
+    for node, (_, _, requires) in nodes.items():
+        for required in requires:
+            dependents[required].append(node)
+
+    waiting = {node: len(requires) for node, (_, _, requires) in nodes.items()}
+    outputs = {}
+    failed = set()
+
+    def run_node(node):
+        device, step, requires = nodes[node]
+        inputs = {nodes[r][1].name: outputs[r] for r in requires}
+        key = step_key(step, inputs)
+        start = time.perf_counter()
+        memo = state.get(node, key)
+        if memo is not None:
+            return node, DeviceResult(node, 0, memo["output"], time.perf_counter() - start, status=CACHED)
+        try:
+            returncode, output, *status = step.func(None if device == GLOBAL else device, inputs)
+        except Exception as e:
+            return node, DeviceResult(node, 1, str(e), time.perf_counter() - start, e, FAILED)
+        status = status[0] if status else (DONE if returncode == 0 else FAILED)
+        if returncode == 0:
+            state.put(node, key, output, status)
+        return node, DeviceResult(node, returncode, output, time.perf_counter() - start, status=status)
+
+    def blocked(node):
+        # Everything downstream of a failure is reported once, never run
+        for dependent in dependents[node]:
+            if dependent not in failed:
+                failed.add(dependent)
+                yield DeviceResult(dependent, 1, f"requires {node}", 0.0, status=BLOCKED)
+                yield from blocked(dependent)
+
+    pool = ThreadPoolExecutor(max_workers=max(1, jobs))
+    try:
+        running = {pool.submit(run_node, node) for node, count in waiting.items() if count == 0}
+        while running:
+            finished, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                node, result = future.result()
+                yield result
+                if not result.ok:
+                    failed.add(node)
+                    yield from blocked(node)
+                    continue
+                outputs[node] = result.output
+                for dependent in dependents[node]:
+                    waiting[dependent] -= 1
+                    if waiting[dependent] == 0 and dependent not in failed:
+                        running.add(pool.submit(run_node, dependent))
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+    # Devices that made it through the whole plan start over next time
+    complete = [
+        device
+        for device in devices
+        if not any(nodes[node][0] == device for node in failed)
+    ]
+    finished_nodes = [node for node in nodes if nodes[node][0] in complete]
+    if len(complete) == len(devices):
+        finished_nodes += [node for node in nodes if nodes[node][0] == GLOBAL]
+    state.forget(finished_nodes)
@@ -0,0 +1,185 @@
+import re
+import time
+import threading
+
+# One line per process, NAME is argv[0]: the full process name of an app
+# ("com.example" or "com.example:remote"), not the 15 character comm
+PS_COLUMNS = "PID,PPID,UID,NAME"
+SNAPSHOT_COMMAND = f"cat /proc/sys/kernel/random/boot_id; ps -A -o {PS_COLUMNS}"
+# A shell glob and a builtin: lists the live PIDs without starting any process but cat
+POLL_COMMAND = "cat /proc/sys/kernel/random/boot_id; echo /proc/[0-9]*"
+PROC_ENTRY = re.compile(r"/proc/(\d+)\b")
+# What a process forked from zygote is called until it specializes into an
+# app, which renames it without changing its PID
+PROVISIONAL_NAMES = frozenset({"zygote", "zygote64", "usap32", "usap64", "<pre-initialized>"})
+
+
+def parse_ps(output: str) -> dict[int, dict]:
+    """Parse `ps -o PID,PPID,UID,NAME`
+
+    Arguments:
+        output {str} -- The command output, with or without the header
+
+    Returns:
+        dict -- pid -> {"pid", "ppid", "uid", "name"}
+    """
+    processes = {}
+    for line in output.splitlines():
+        fields = line.split(None, 3)
+        if len(fields) < 4 or not fields[0].isdigit():
+            continue
+        pid, ppid, uid, name = fields
+        processes[int(pid)] = {
+            "pid": int(pid),
+            "ppid": int(ppid) if ppid.isdigit() else None,
+            # toybox prints the numeric UID, some ps builds print u0_a123
+            "uid": int(uid) if uid.isdigit() else uid,
+            "name": name.strip(),
+        }
+    return processes
+
+
+def poll_command(recheck) -> str:
+    """POLL_COMMAND, reading the names of the `recheck` PIDs again in the same shell call"""
+    if not recheck:
+        return POLL_COMMAND
+    # ps fails when every PID is gone, that's not a failed poll
+    return f"{POLL_COMMAND}; ps -o {PS_COLUMNS} -p {','.join(map(str, sorted(recheck)))} || true"
+
+
+def parse_poll(output: str) -> tuple[str, set[int], dict[int, dict]]:
+    """Parse the output of poll_command()
+
+    Returns:
+        tuple[str, set[int], dict] -- The boot id, the live PIDs and the ps entries of the rechecked PIDs
+    """
+    boot_id, _, output = output.partition("\n")
+    listing, _, rechecked = output.partition("\n")
+    return boot_id.strip(), {int(pid) for pid in PROC_ENTRY.findall(listing)}, parse_ps(rechecked)
+
+
+def package_of(name: str) -> str:
+    """com.example:remote -> com.example"""
+    return name.split(":", 1)[0]
+
+
+class ProcessTable:
+    """The processes of one device, indexed by PID, name, UID and package
+
+    Built from one `ps` snapshot and kept current by diffing the PIDs under
+    /proc: processes that are gone are dropped and only the new ones are
+    looked up. A new boot id means a reboot, every PID is stale then.
+    Processes still named after zygote are looked up on every poll as well,
+    an app launch renames the PID zygote forked for it.
+    """
+
+    def __init__(self, boot_id: str, processes: dict[int, dict]):
+        self.__lock = threading.Lock()
+        self.boot_id = boot_id
+        self.updated_at = time.monotonic()
+        self.__processes: dict[int, dict] = {}
+        self.__by_name: dict[str, set[int]] = {}
+        self.__by_uid: dict[int | str, set[int]] = {}
+        self.__by_package: dict[str, set[int]] = {}
+        self.__add(processes)
+
+    def __add(self, processes: dict[int, dict]) -> None:
+        for pid, process in processes.items():
+            self.__remove([pid])
+            self.__processes[pid] = process
+            self.__by_name.setdefault(process["name"], set()).add(pid)
+            self.__by_uid.setdefault(process["uid"], set()).add(pid)
+            self.__by_package.setdefault(package_of(process["name"]), set()).add(pid)
+
+    def __remove(self, pids) -> None:
+        for pid in pids:
+            process = self.__processes.pop(pid, None)
+            if process is None:
+                continue
+            for index, key in (
+                (self.__by_name, process["name"]),
+                (self.__by_uid, process["uid"]),
+                (self.__by_package, package_of(process["name"])),
+            ):
+                index[key].discard(pid)
+                if not index[key]:
+                    del index[key]
+
+    def pids(self) -> set[int]:
+        with self.__lock:
+            return set(self.__processes)
+
+    def provisional(self) -> set[int]:
+        """PIDs forked from zygote that don't carry their app's name yet"""
+        with self.__lock:
+            return {
+                pid
+                for pid, process in self.__processes.items()
+                # zygote itself is started by init and keeps its name
+                if process["name"] in PROVISIONAL_NAMES and process["ppid"] != 1
+            }
+
+    def update(self, live: set[int], added: dict[int, dict]) -> tuple[int, int]:
+        """Apply one poll
+
+        Arguments:
+            live {set[int]} -- Every PID under /proc right now
+            added {dict} -- The ps entries of the PIDs the table didn't know or rechecked, a new name replaces the old entry
+
+        Returns:
+            tuple[int, int] -- How many processes were added and removed
+        """
+        with self.__lock:
+            gone = [pid for pid in self.__processes if pid not in live]
+            self.__remove(gone)
+            # A process that exited between the listing and ps has no entry
+            self.__add({pid: process for pid, process in added.items() if pid in live})
+            self.updated_at = time.monotonic()
+        return len(added), len(gone)
+
+    def __select(self, pids) -> list[dict]:
+        return sorted((self.__processes[pid] for pid in pids), key=lambda process: process["pid"])
+
+    def get(self, pid: int) -> dict | None:
+        with self.__lock:
+            return self.__processes.get(pid)
+
+    def by_name(self, name: str) -> list[dict]:
+        with self.__lock:
+            return self.__select(self.__by_name.get(name, ()))
+
+    def by_uid(self, uid: int) -> list[dict]:
+        with self.__lock:
+            return self.__select(self.__by_uid.get(uid, ()))
+
+    def by_package(self, package: str) -> list[dict]:
+        """The main process of a package first, then its :child processes"""
+        with self.__lock:
+            processes = self.__select(self.__by_package.get(package, ()))
+        return sorted(processes, key=lambda process: process["name"] != package)
+
+    def find(self, package: str | None = None, name: str | None = None, uid: int | None = None) -> list[dict]:
+        """Processes matching every given criterion
+
+        Arguments:
+            package {str} -- The package, matches its main and :child processes
+            name {str} -- The exact process name
+            uid {int} -- The UID
+
+        Returns:
+            list[dict] -- Matching processes, a package's main process first
+        """
+        if package is not None:
+            matches = self.by_package(package)
+        elif name is not None:
+            matches = self.by_name(name)
+        elif uid is not None:
+            matches = self.by_uid(uid)
+        else:
+            with self.__lock:
+                return self.__select(self.__processes)
+        return [
+            process
+            for process in matches
+            if (name is None or process["name"] == name) and (uid is None or process["uid"] == uid)
+        ]
@@ -0,0 +1,204 @@
+import os
+import shlex
+import hashlib
+import argparse
+from style import Style
+from .adb import ADB, ADBView
+from .burp import BurpHelper
+from .fanout import DeviceResult
+from .output import OUTPUT
+from .frida import FridaHelper, FRIDA_PORT
+from .plan import Step, Plan, PlanState, run_plan, FAILED, BLOCKED
+
+
+class Provisioner:
+    """Provision devices for interception as one plan of dependent steps
+
+    fetch-cert (once) -> install-cert -> proxy, with frida-server and every
+    APK independent of those, so they all run at the same time. Completed
+    steps of a run that did not finish are kept in <base_dir>/plans/ and a
+    rerun with the same options resumes after them.
+    """
+
+    def __init__(self, adb: ADB, frida: FridaHelper, base_dir: str):
+        self.__adb = adb
+        self.__frida = frida
+        self.__plan_dir = os.path.join(base_dir, "plans")
+
+    def __fetch_cert(self, listeners: list[tuple[str, int]], refresh: bool):
+        def step(device_id, inputs):
+            certs = self.__adb.get_ca_certs(listeners, refresh)
+            errors = [f"{host}:{port}: {cert}" for (host, port), cert in certs.items() if isinstance(cert, Exception)]
+            if errors:
+                return 1, "; ".join(errors)
+            # Listeners of the same Burp serve the same CA
+            unique = dict.fromkeys(certs.values())
+            return 0, {"certs": [{"pem": pem.decode(), "subject_hash": subject_hash} for pem, subject_hash in unique]}, "fetched"
+
+        return step
+
+    def __install_cert(self, device_id: str, inputs: dict):
+        certs = inputs["fetch-cert"]["certs"]
+        return self.__adb.install_ca_certs_on(
+            device_id, [(cert["pem"].encode(), cert["subject_hash"]) for cert in certs]
+        )
+
+    def __set_proxy(self, proxy: str):
+        def step(device_id, inputs):
+            result = self.__adb.shell(device_id, f"settings put global http_proxy {shlex.quote(proxy)}")
+            if result.returncode != 0:
+                return result.returncode, result.stderr.strip() or result.stdout.strip()
+            return 0, f"{Style.GREEN}[SUCCESS] Proxy set to {proxy}{Style.RESET}", "proxy-set"
+
+        return step
+
+    @staticmethod
+    def __file_digest(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def build_plan(self, cli_args) -> Plan:
+        """Turn the provision options into a plan
+        :param cli_args: argparse.Namespace -- The parsed provision options
+        :return: Plan -- The steps, validated
+        """
+        steps = []
+        if cli_args.burp:
+            steps.append(
+                Step(
+                    "fetch-cert",
+                    self.__fetch_cert(cli_args.burp, cli_args.refresh),
+                    per_device=False,
+                    params={"burp": [f"{host}:{port}" for host, port in cli_args.burp]},
+                )
+            )
+            steps.append(Step("install-cert", self.__install_cert, requires=["fetch-cert"]))
+        if cli_args.frida:
+            steps.append(
+                Step(
+                    "frida-server",
+                    lambda device_id, inputs: self.__frida.deploy(
+                        device_id, cli_args.frida_version, cli_args.frida_port
+                    ),
+                    params={"version": cli_args.frida_version, "port": cli_args.frida_port},
+                )
+            )
+        if cli_args.proxy:
+            host, port = cli_args.proxy
+            proxy = f"{host}:{port}"
+            # Routing traffic to Burp before its CA is trusted only breaks TLS
+            steps.append(
+                Step(
+                    "proxy",
+                    self.__set_proxy(proxy),
+                    requires=["install-cert"] if cli_args.burp else [],
+                    params={"proxy": proxy},
+                )
+            )
+        for apk_path in cli_args.apk or []:
+            steps.append(
+                Step(
+                    f"app:{os.path.basename(apk_path)}",
+                    lambda device_id, inputs, apk_path=apk_path: self.__adb.install_apk(device_id, apk_path),
+                    params={"sha256": self.__file_digest(apk_path)},
+                )
+            )
+        return Plan(cli_args.name, steps)
+
+    def provision(self, *args) -> None:
+        """Run the provisioning plan on the selected devices
+        :return: None
+        """
+        cli_args = args[0]
+        try:
+            plan = self.build_plan(cli_args)
+        except (OSError, ValueError) as e:
+            print(f"{Style.RED}[Error] {e}{Style.RESET}")
+            OUTPUT.fail()
+            return
+        if not plan.steps:
+            print(f"{Style.YELLOW}[INFO] Nothing to do, pass --burp, --frida, --proxy or --apk{Style.RESET}")
+            return
+        state_path = os.path.join(self.__plan_dir, f"{plan.name}.json")
+        if cli_args.fresh and os.path.exists(state_path):
+            os.remove(state_path)
+        devices = self.__adb.select_devices(cli_args)
+        print(f"{Style.CYAN}[INFO] Steps: {', '.join(plan.order)}{Style.RESET}")
+
+        outcomes = {}
+        for result in run_plan(plan, devices, PlanState(state_path), cli_args.jobs):
+            ProvisionView.print_step_result(result)
+            status = result.status or (FAILED if not result.ok else "done")
+            outcomes[status] = outcomes.get(status, 0) + 1
+        print(
+            f"{Style.BOLD}Summary:{Style.RESET} "
+            + ", ".join(f"{status}: {count}" for status, count in outcomes.items())
+        )
+        if outcomes.get(FAILED) or outcomes.get(BLOCKED):
+            print(f"{Style.YELLOW}[INFO] Run the same command again to resume after the completed steps{Style.RESET}")
+
+    # Arg parser
+    @staticmethod
+    def add_parser(provisioner, subparsers):
+        parser: argparse.ArgumentParser = subparsers.add_parser(
+            "provision", help="Install the CA, frida-server, proxy and apps as one resumable plan"
+        )
+        ADB.add_device_arguments(parser)
+        parser.add_argument(
+            "--burp",
+            type=BurpHelper.parse_listener,
+            action="append",
+            metavar="HOST:PORT",
+            help="Install the CA certificate of this Burp listener, repeatable",
+        )
+        parser.add_argument(
+            "--refresh",
+            action="store_true",
+            help="Revalidate the cached certificate with Burp even if it is fresh",
+        )
+        parser.add_argument("--frida", action="store_true", help="Deploy and start frida-server")
+        parser.add_argument(
+            "--frida-version",
+            type=str,
+            help="The frida-server version (default: newest archive in frida/)",
+            default=None,
+        )
+        parser.add_argument(
+            "--frida-port",
+            type=int,
+            help=f"The port frida-server listens on (default: {FRIDA_PORT})",
+            default=FRIDA_PORT,
+        )
+        parser.add_argument(
+            "--proxy",
+            type=BurpHelper.parse_listener,
+            metavar="HOST:PORT",
+            help="Set the global HTTP proxy",
+        )
+        parser.add_argument(
+            "--apk", type=str, action="append", help="Install this APK (repeatable)"
+        )
+        parser.add_argument(
+            "--name",
+            type=str,
+            default="provision",
+            help="Name of the plan, separate names resume separately (default: provision)",
+        )
+        parser.add_argument(
+            "--fresh", action="store_true", help="Forget completed steps of an earlier run"
+        )
+        parser.set_defaults(func=provisioner.provision)
+        return parser
+
+
+class ProvisionView:
+
+    @staticmethod
+    def print_step_result(result: DeviceResult):
+        # The certificate itself is carried as the output of fetch-cert, don't dump it
+        if not isinstance(result.output, str):
+            result = DeviceResult(result.device, result.returncode, None, result.elapsed, result.error, result.status)
+        ADBView.print_device_result(result)
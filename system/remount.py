@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import threading
+
+# Ways to get a certificate into the system store, cheapest first
+SYSTEM_REMOUNT = "system-remount"
+ROOT_REMOUNT = "root-remount"
+TMPFS_OVERLAY = "tmpfs-overlay"
+APEX_CONSCRYPT = "apex-conscrypt"
+
+APEX_CACERTS_DIR = "/apex/com.android.conscrypt/cacerts"
+STAGING_DIR = "/data/local/tmp/fsp-cacerts"
+
+# Copy the current store into a tmpfs mounted over it, unless that already happened.
+# The new store is complete and labelled in staging before anything is mounted,
+# and a tmpfs that couldn't be filled is unmounted again: an empty one over
+# cacerts would break TLS for the whole device until reboot. src stays put
+# until then, so the next strategy can still use it.
+# Scripts are one line, they are written to a pooled shell's stdin as one command.
+_LABEL = "chown root:root {0}/*; chmod 644 {0}/*; chcon u:object_r:system_file:s0 {0}/*"
+_TMPFS_OVERLAY = (
+    "set -e; d={dir}; s={staging}; "
+    'if grep -q " $d tmpfs " /proc/mounts; then mv {src} $d/; ' + _LABEL.format("$d") + "; else "
+    "rm -rf $s; mkdir -p -m 700 $s; cp $d/* {src} $s/; " + _LABEL.format("$s") + "; "
+    "mount -t tmpfs tmpfs $d; "
+    "if ! {{ cp -p $s/* $d/ && chcon u:object_r:system_file:s0 $d/*; }}; then umount $d; exit 1; fi; "
+    "rm -rf $s {src}; fi"
+)
+
+# On 14+ the store is read from the conscrypt APEX, in every app's mount namespace
+_APEX_CONSCRYPT = (
+    _TMPFS_OVERLAY
+    + "; a={apex}; "
+    'grep -q " $a tmpfs " /proc/mounts || mount --bind $d $a; '
+    "for z in $(pidof zygote zygote64); do for p in $z $(ps -o PID= -P $z); do "
+    'grep -q " $a tmpfs " /proc/$p/mounts || nsenter --mount=/proc/$p/ns/mnt -- /bin/mount --bind $d $a || true; '
+    "done; done"
+)
+
+# name -> (min SDK, max SDK or None, root shell script)
+STRATEGIES = {
+    SYSTEM_REMOUNT: (0, 33, "mount -o rw,remount /system && mv {src} {dir}/"),
+    ROOT_REMOUNT: (
+        0,
+        33,
+        'mount -o rw,remount / 2>/dev/null || mount -o rw,remount "$(grep " / " /proc/mounts | cut -d " " -f 1 | head -n 1)"'
+        " && mv {src} {dir}/",
+    ),
+    TMPFS_OVERLAY: (29, 33, _TMPFS_OVERLAY),
+    APEX_CONSCRYPT: (34, None, _APEX_CONSCRYPT),
+}
+
+
+def candidate_strategies(sdk: int, preferred: str | None = None) -> list[str]:
+    """The strategies that can work on an SDK level, the preferred one first
+
+    Arguments:
+        sdk {int} -- ro.build.version.sdk, 0 when unknown
+        preferred {str} -- The strategy that worked on this build before
+
+    Returns:
+        list[str] -- Strategy names in the order to try them
+    """
+    names = [
+        name
+        for name, (min_sdk, max_sdk, _) in STRATEGIES.items()
+        # Unknown SDK: try everything that doesn't depend on a new Android
+        if (sdk >= min_sdk if sdk else min_sdk == 0) and (max_sdk is None or sdk <= max_sdk)
+    ]
+    if preferred in names:
+        names.remove(preferred)
+        names.insert(0, preferred)
+    return names
+
+
+def installed_path(strategy: str, subject_hash: str, cacerts_dir: str) -> str:
+    """Where the system reads the certificate from once a strategy installed it"""
+    trusted_dir = APEX_CACERTS_DIR if strategy == APEX_CONSCRYPT else cacerts_dir
+    return f"{trusted_dir}/{subject_hash}.0"
+
+
+def strategy_script(strategy: str, src: str, cacerts_dir: str) -> str:
+    """The root shell script that moves src into the store with a strategy"""
+    return STRATEGIES[strategy][2].format(
+        src=src, dir=cacerts_dir, staging=STAGING_DIR, apex=APEX_CACERTS_DIR
+    )
+
+
+class RemountCache:
+    """The certificate install strategy that worked, per ro.build.fingerprint
+
+    Devices on the same build behave the same, so after the first install
+    every later one goes straight to the strategy that works instead of
+    failing through the cheaper ones first.
+    """
+
+    def __init__(self, path: str):
+        self.__path = path
+        self.__lock = threading.Lock()
+        self.__builds = None
+
+    def __load(self) -> dict:
+        if self.__builds is None:
+            try:
+                with open(self.__path) as f:
+                    self.__builds = json.load(f).get("builds", {})
+            except (OSError, ValueError):
+                self.__builds = {}
+        return self.__builds
+
+    def __save(self) -> None:
+        os.makedirs(os.path.dirname(self.__path), exist_ok=True)
+        tmp_path = self.__path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"builds": self.__builds}, f, indent=2)
+        os.replace(tmp_path, self.__path)
+
+    def get(self, fingerprint: str) -> str | None:
+        if not fingerprint:
+            return None
+        with self.__lock:
+            entry = self.__load().get(fingerprint)
+        if entry is None or entry["strategy"] not in STRATEGIES:
+            return None
+        return entry["strategy"]
+
+    def put(self, fingerprint: str, strategy: str) -> None:
+        if not fingerprint:
+            return
+        with self.__lock:
+            self.__load()[fingerprint] = {"strategy": strategy, "updated_at": time.time()}
+            self.__save()
+
+    def forget(self, fingerprint: str) -> None:
+        with self.__lock:
+            if self.__load().pop(fingerprint, None) is not None:
+                self.__save()
@@ -0,0 +1,221 @@
+import os
+import time
+import shlex
+import select
+import struct
+import threading
+from .trace import span
+from .adb_client import ADBClient, ADBClientError, ADBConnection, SHELL_STDIN, SHELL_STDOUT, SHELL_STDERR, SHELL_EXIT
+
+PACKET_HEADER = struct.Struct("<BI")
+
+
+class ShellSession:
+    """One long-lived `sh` (or `su` with root=True) on a device
+
+    Commands are written to the shell's stdin, each followed by a unique
+    sentinel on stdout (carrying $?) and on stderr, so the output and exit
+    code of every command can be cut out of the continuous streams.
+    Each command runs in its own `sh -c` with stdin closed, so it can neither
+    swallow the following commands nor `exit` the session.
+    """
+
+    def __init__(self, client: ADBClient, serial: str, root: bool = False):
+        self.serial = serial
+        self.root = root
+        self.__conn: ADBConnection = client.open_shell(serial, "su" if root else "")
+        # Only the handshake is bounded by the client's connect timeout
+        self.__handshake_timeout = self.__conn.sock.gettimeout()
+        self.__prefix = f"__FSP_{os.urandom(6).hex()}"
+        self.__stdout = bytearray()
+        self.__stderr = bytearray()
+        self.created_at = time.monotonic()
+        self.used_at = self.created_at
+        self.commands = 0
+        self.alive = True
+        if root:
+            # su may be missing or refuse, find out now rather than on the first real command
+            try:
+                uid = self.run("id -u", self.__handshake_timeout)[1].strip()
+            except ADBClientError:
+                uid = None
+            if uid != b"0":
+                self.close()
+                raise ADBClientError("su did not start a root shell")
+
+    def __send(self, data: bytes) -> None:
+        self.__conn.sock.sendall(PACKET_HEADER.pack(SHELL_STDIN, len(data)) + data)
+
+    def __read_packet(self) -> None:
+        packet_id, length = PACKET_HEADER.unpack(self.__conn.read_exactly(PACKET_HEADER.size))
+        payload = self.__conn.read_exactly(length)
+        if packet_id == SHELL_STDOUT:
+            self.__stdout += payload
+        elif packet_id == SHELL_STDERR:
+            self.__stderr += payload
+        elif packet_id == SHELL_EXIT:
+            raise ADBClientError("Shell session exited")
+
+    def run(self, command: str, timeout: float | None = None) -> tuple[int, bytes, bytes]:
+        """Run one command in the session
+        :param command: str -- The command line
+        :param timeout: float -- Seconds the command may take in total, None to wait as long as it takes.
+            A command that runs past it fails and the session is closed, so it never goes back to a pool
+        :return: tuple[int, bytes, bytes] -- The exit code, stdout and stderr
+        """
+        with span("adb.session", device=self.serial, command=command, root=self.root) as timing:
+            result = self.__run(command, timeout)
+            timing.tag(returncode=result[0])
+        return result
+
+    def __run(self, command: str, timeout: float | None) -> tuple[int, bytes, bytes]:
+        if not self.alive:
+            raise ADBClientError("Shell session is closed")
+        self.commands += 1
+        token = f"{self.__prefix}_{self.commands}__".encode()
+        stdout_end = b"\n" + token + b" "
+        stderr_end = token + b"\n"
+        self.__send(
+            f"sh -c {shlex.quote(command)} </dev/null; "
+            f"printf '\\n%s %d\\n' {token.decode()} $?; "
+            f"printf '%s\\n' {token.decode()} >&2\n".encode()
+        )
+        # A command may stay silent for as long as it likes, only its total run time is bounded
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        try:
+            while True:
+                out_at = self.__stdout.find(stdout_end)
+                if out_at >= 0:
+                    status_end = self.__stdout.find(b"\n", out_at + len(stdout_end))
+                    err_at = self.__stderr.find(stderr_end)
+                    if status_end >= 0 and err_at >= 0:
+                        break
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(f"command still running after {timeout:g}s")
+                    self.__conn.sock.settimeout(remaining)
+                else:
+                    self.__conn.sock.settimeout(None)
+                self.__read_packet()
+        except (OSError, ADBClientError) as e:
+            # Whatever is left of the command's output would end up in the next one's,
+            # closing the connection also hangs up the command on the device
+            self.close()
+            raise ADBClientError(f"Shell session lost: {e}") from e
+        returncode = int(self.__stdout[out_at + len(stdout_end) : status_end])
+        stdout = bytes(self.__stdout[:out_at])
+        stderr = bytes(self.__stderr[:err_at])
+        del self.__stdout[: status_end + 1]
+        del self.__stderr[: err_at + len(stderr_end)]
+        self.used_at = time.monotonic()
+        return returncode, stdout, stderr
+
+    def dropped(self) -> bool:
+        """Whether the idle session has been closed (or written to) by the device"""
+        try:
+            readable, _, _ = select.select([self.__conn.sock], [], [], 0)
+        except (OSError, ValueError):
+            return True
+        return bool(readable)
+
+    def close(self) -> None:
+        self.alive = False
+        self.__conn.close()
+
+
+class ShellPool:
+    """Idle shell sessions per (device, root), reused across commands
+
+    A session idle for longer than CHECK_AFTER is health-checked before it
+    is handed out again, and sessions are recycled after MAX_COMMANDS
+    commands or MAX_AGE seconds so a leaking shell never lives forever.
+    Commands get COMMAND_TIMEOUT seconds unless the caller says otherwise,
+    a session whose command ran past it is closed instead of reused.
+    Commands run with stdin from /dev/null and without a TTY, anything that
+    reads stdin or needs a terminal belongs on a shell of its own.
+    """
+
+    MAX_IDLE = 4
+    MAX_COMMANDS = 1000
+    MAX_AGE = 600
+    CHECK_AFTER = 30
+    CHECK_TIMEOUT = 5
+    COMMAND_TIMEOUT = 600
+
+    def __init__(self, client: ADBClient, max_idle: int = MAX_IDLE):
+        self.__client = client
+        self.__max_idle = max_idle
+        self.__idle: dict[tuple[str, bool], list[ShellSession]] = {}
+        self.__lock = threading.Lock()
+
+    def __expired(self, session: ShellSession) -> bool:
+        return (
+            not session.alive
+            or session.commands >= self.MAX_COMMANDS
+            or time.monotonic() - session.created_at > self.MAX_AGE
+        )
+
+    def __healthy(self, session: ShellSession) -> bool:
+        if session.dropped():
+            return False
+        if time.monotonic() - session.used_at < self.CHECK_AFTER:
+            return True
+        try:
+            return session.run("echo ok", self.CHECK_TIMEOUT)[1] == b"ok\n"
+        except ADBClientError:
+            return False
+
+    def acquire(self, serial: str, root: bool = False) -> ShellSession:
+        """Take an idle session for the device or open a new one"""
+        while True:
+            with self.__lock:
+                idle = self.__idle.get((serial, root))
+                session = idle.pop() if idle else None
+            if session is None:
+                return ShellSession(self.__client, serial, root)
+            if not self.__expired(session) and self.__healthy(session):
+                return session
+            session.close()
+
+    def release(self, session: ShellSession) -> None:
+        """Give a session back, closing it if it is done or the pool is full"""
+        if self.__expired(session):
+            session.close()
+            return
+        with self.__lock:
+            idle = self.__idle.setdefault((session.serial, session.root), [])
+            if len(idle) < self.__max_idle:
+                idle.append(session)
+                return
+        session.close()
+
+    def run(
+        self, serial: str, command: str, root: bool = False, timeout: float | None = COMMAND_TIMEOUT
+    ) -> tuple[int, bytes, bytes]:
+        """Run a command in a pooled session
+        :param serial: str -- The device serial
+        :param command: str -- The command line
+        :param root: bool -- Run it in a `su` session
+        :param timeout: float -- Seconds the command may take in total, None for no limit
+        :return: tuple[int, bytes, bytes] -- The exit code, stdout and stderr
+        """
+        session = self.acquire(serial, root)
+        try:
+            return session.run(command, timeout)
+        finally:
+            self.release(session)
+
+    def discard(self, serial: str) -> None:
+        """Close the idle sessions of a device, e.g. after it disconnected"""
+        with self.__lock:
+            sessions = [s for key in list(self.__idle) if key[0] == serial for s in self.__idle.pop(key)]
+        for session in sessions:
+            session.close()
+
+    def close(self) -> None:
+        with self.__lock:
+            sessions = [s for idle in self.__idle.values() for s in idle]
+            self.__idle.clear()
+        for session in sessions:
+            session.close()
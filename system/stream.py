@@ -0,0 +1,115 @@
+import time
+import codecs
+import threading
+import subprocess
+from typing import Iterator
+from .adb_client import SHELL_STDOUT, SHELL_STDERR, SHELL_EXIT
+
+# How much stderr to keep while streaming stdout
+STDERR_LIMIT = 64 * 1024
+
+
+def popen_packets(args: list, deadline: float | None = None) -> Iterator[tuple[int, bytes]]:
+    """Run a command and yield its output in the same packets as ADBClient.shell_stream
+
+    Used when the adb binary is the only way to reach the device.
+    :param args: list -- The command line
+    :param deadline: float -- time.monotonic() after which the process is killed
+    :return: Iterator[tuple[int, bytes]] -- (SHELL_STDOUT/SHELL_STDERR/SHELL_EXIT, payload)
+    """
+    # No stdin, so `adb shell` never allocates a pty and output stays binary-clean
+    proc = subprocess.Popen(
+        args, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    stderr = bytearray()
+    # Drain stderr on the side so a chatty stderr can't block stdout
+    drain = threading.Thread(
+        target=lambda: stderr.extend(proc.stderr.read()), daemon=True
+    )
+    drain.start()
+    timer = None
+    timed_out = threading.Event()
+    if deadline is not None:
+
+        def kill():
+            timed_out.set()
+            proc.kill()
+
+        timer = threading.Timer(max(0.0, deadline - time.monotonic()), kill)
+        timer.start()
+    try:
+        while True:
+            chunk = proc.stdout.read1(65536)
+            if not chunk:
+                break
+            yield SHELL_STDOUT, chunk
+        returncode = proc.wait()
+        if timed_out.is_set():
+            raise TimeoutError("Shell command timed out")
+        drain.join()
+        if stderr:
+            yield SHELL_STDERR, bytes(stderr)
+        yield SHELL_EXIT, bytes([returncode & 0xFF])
+    finally:
+        if timer is not None:
+            timer.cancel()
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+
+
+class CommandStream:
+    """Incremental output of a device shell command
+
+    Iterating yields decoded stdout lines (or raw byte chunks with raw=True)
+    as soon as the device produces them. Once iteration ends, returncode,
+    stderr, truncated and timed_out describe how the command finished.
+    """
+
+    def __init__(self, packets: Iterator[tuple[int, bytes]], raw: bool = False, max_bytes: int | None = None):
+        self.__packets = packets
+        self.__raw = raw
+        self.__max_bytes = max_bytes
+        self.returncode: int | None = None
+        self.stderr = ""
+        self.received = 0
+        self.truncated = False
+        self.timed_out = False
+
+    def __iter__(self):
+        stderr = bytearray()
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        pending = ""
+        try:
+            for packet_id, payload in self.__packets:
+                if packet_id == SHELL_EXIT:
+                    self.returncode = payload[0] if payload else 0
+                    break
+                if packet_id == SHELL_STDERR:
+                    stderr += payload[: max(0, STDERR_LIMIT - len(stderr))]
+                    continue
+                if packet_id != SHELL_STDOUT:
+                    continue
+                if self.__max_bytes is not None and self.received + len(payload) > self.__max_bytes:
+                    payload = payload[: self.__max_bytes - self.received]
+                    self.truncated = True
+                self.received += len(payload)
+                if self.__raw:
+                    if payload:
+                        yield payload
+                else:
+                    pending += decoder.decode(payload)
+                    *lines, pending = pending.split("\n")
+                    yield from lines
+                if self.truncated:
+                    break
+        except TimeoutError:
+            self.timed_out = True
+        finally:
+            # Stops the device command by closing its socket/process
+            self.__packets.close()
+            self.stderr = stderr.decode(errors="replace")
+        if not self.__raw:
+            pending += decoder.decode(b"", final=True)
+            if pending:
+                yield pending
@@ -0,0 +1,197 @@
+import os
+import stat
+import time
+import shlex
+import hashlib
+import posixpath
+from .adb_client import ADBClient, ADBClientError, SyncSession
+
+# Paths per md5sum invocation, keeps the command line well under the limit
+CHECKSUM_BATCH = 64
+
+
+class SyncStats:
+    """What one push/pull of a tree did"""
+
+    __slots__ = ("files", "transferred", "skipped", "bytes", "elapsed")
+
+    def __init__(self):
+        self.files = 0
+        self.transferred = 0
+        self.skipped = 0
+        self.bytes = 0
+        self.elapsed = 0.0
+
+    @property
+    def mb_per_second(self) -> float:
+        return self.bytes / (1024 * 1024) / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (
+            f"{self.transferred}/{self.files} files transferred, {self.skipped} up to date, "
+            f"{self.bytes} bytes in {self.elapsed:.2f}s ({self.mb_per_second:.2f} MB/s)"
+        )
+
+
+class FileSync:
+    """Push/pull directory trees over the sync protocol, transferring only
+    files whose size/mtime (or md5 with checksum=True) differ"""
+
+    def __init__(self, client: ADBClient):
+        self.__client = client
+
+    @staticmethod
+    def local_md5(path: str) -> str:
+        digest = hashlib.md5()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def remote_md5(self, serial: str, paths: list[str]) -> dict[str, str]:
+        """md5 of many remote files with one shell call per CHECKSUM_BATCH files
+        :param serial: str -- The device serial
+        :param paths: list[str] -- The remote paths
+        :return: dict[str, str] -- path -> md5 for every readable file
+        """
+        digests = {}
+        for i in range(0, len(paths), CHECKSUM_BATCH):
+            batch = paths[i : i + CHECKSUM_BATCH]
+            _, stdout, _ = self.__client.shell(
+                serial, "md5sum " + " ".join(shlex.quote(p) for p in batch) + " 2>/dev/null"
+            )
+            for line in stdout.decode(errors="surrogateescape").splitlines():
+                digest, _, path = line.partition("  ")
+                if path:
+                    digests[path] = digest
+        return digests
+
+    def __remote_entries(self, session: SyncSession, remote_dir: str, cache: dict) -> dict:
+        if remote_dir not in cache:
+            cache[remote_dir] = {
+                name: (mode, size, mtime) for name, mode, size, mtime in session.list(remote_dir)
+            }
+        return cache[remote_dir]
+
+    def push(self, serial: str, local_path: str, remote_path: str, checksum: bool = False) -> SyncStats:
+        """Push a file or directory tree, skipping files already on the device
+        :param serial: str -- The device serial
+        :param local_path: str -- The local file or directory
+        :param remote_path: str -- The remote file or directory
+        :param checksum: bool -- Compare md5 of same-size files instead of mtime
+        :return: SyncStats -- What was transferred
+        """
+        stats = SyncStats()
+        start = time.perf_counter()
+        with self.__client.sync(serial) as session:
+            if os.path.isdir(local_path):
+                files = []
+                for root, _, names in os.walk(local_path):
+                    rel_root = os.path.relpath(root, local_path)
+                    for name in sorted(names):
+                        rel = name if rel_root == "." else posixpath.join(*rel_root.split(os.sep), name)
+                        files.append((os.path.join(root, name), posixpath.join(remote_path, rel)))
+            else:
+                mode, _, _ = session.stat(remote_path)
+                if stat.S_ISDIR(mode):
+                    remote_path = posixpath.join(remote_path, os.path.basename(local_path))
+                files = [(local_path, remote_path)]
+
+            listing = {}
+            changed = []
+            same_size = []
+            for local_file, remote_file in files:
+                st = os.stat(local_file)
+                remote_dir, name = posixpath.split(remote_file)
+                remote = self.__remote_entries(session, remote_dir, listing).get(name)
+                if remote is None or remote[1] != st.st_size:
+                    changed.append((local_file, remote_file, st))
+                elif checksum:
+                    same_size.append((local_file, remote_file, st))
+                elif remote[2] != int(st.st_mtime):
+                    changed.append((local_file, remote_file, st))
+            if same_size:
+                digests = self.remote_md5(serial, [remote for _, remote, _ in same_size])
+                for local_file, remote_file, st in same_size:
+                    if digests.get(remote_file) != self.local_md5(local_file):
+                        changed.append((local_file, remote_file, st))
+
+            stats.files = len(files)
+            stats.skipped = len(files) - len(changed)
+            for local_file, remote_file, st in changed:
+                with open(local_file, "rb") as f:
+                    stats.bytes += session.send(f, remote_file, st.st_mode & 0o777, int(st.st_mtime))
+                stats.transferred += 1
+            session.wait()
+        stats.elapsed = time.perf_counter() - start
+        return stats
+
+    def __walk_remote(self, session: SyncSession, remote_dir: str, rel: str, out: list) -> None:
+        for name, mode, size, mtime in session.list(remote_dir):
+            remote = posixpath.join(remote_dir, name)
+            child_rel = posixpath.join(rel, name) if rel else name
+            if stat.S_ISDIR(mode):
+                self.__walk_remote(session, remote, child_rel, out)
+            elif stat.S_ISREG(mode):
+                out.append((remote, child_rel, size, mtime))
+
+    def pull(self, serial: str, remote_path: str, local_path: str, checksum: bool = False) -> SyncStats:
+        """Pull a file or directory tree, skipping files already present locally
+        :param serial: str -- The device serial
+        :param remote_path: str -- The remote file or directory
+        :param local_path: str -- The local file or directory
+        :param checksum: bool -- Compare md5 of same-size files instead of mtime
+        :return: SyncStats -- What was transferred
+        """
+        stats = SyncStats()
+        start = time.perf_counter()
+        with self.__client.sync(serial) as session:
+            mode, size, mtime = session.stat(remote_path)
+            if mode == 0:
+                raise ADBClientError(f"{remote_path}: No such file or directory")
+            files = []
+            if stat.S_ISDIR(mode):
+                for remote, rel, size, mtime in self.__walk_remote_list(session, remote_path):
+                    files.append((remote, os.path.join(local_path, *rel.split("/")), size, mtime))
+            else:
+                if os.path.isdir(local_path):
+                    local_path = os.path.join(local_path, posixpath.basename(remote_path))
+                files.append((remote_path, local_path, size, mtime))
+
+            changed = []
+            same_size = []
+            for remote, local_file, size, mtime in files:
+                try:
+                    st = os.stat(local_file)
+                except FileNotFoundError:
+                    changed.append((remote, local_file, mtime))
+                    continue
+                if st.st_size != size:
+                    changed.append((remote, local_file, mtime))
+                elif checksum:
+                    same_size.append((remote, local_file, mtime))
+                elif int(st.st_mtime) != mtime:
+                    changed.append((remote, local_file, mtime))
+            if same_size:
+                digests = self.remote_md5(serial, [remote for remote, _, _ in same_size])
+                for remote, local_file, mtime in same_size:
+                    if digests.get(remote) != self.local_md5(local_file):
+                        changed.append((remote, local_file, mtime))
+
+            stats.files = len(files)
+            stats.skipped = len(files) - len(changed)
+            for remote, local_file, mtime in changed:
+                os.makedirs(os.path.dirname(os.path.abspath(local_file)), exist_ok=True)
+                part = local_file + ".part"
+                with open(part, "wb") as f:
+                    stats.bytes += session.recv(remote, f)
+                os.replace(part, local_file)
+                os.utime(local_file, (mtime, mtime))
+                stats.transferred += 1
+        stats.elapsed = time.perf_counter() - start
+        return stats
+
+    def __walk_remote_list(self, session: SyncSession, remote_dir: str) -> list:
+        out = []
+        self.__walk_remote(session, remote_dir, "", out)
+        return out
@@ -0,0 +1,159 @@
+import json
+import os
+import threading
+import time
+from style import Style
+
+
+class Span:
+    """One timed external call, recorded when the `with` block exits"""
+
+    __slots__ = ("tracer", "name", "tags", "start", "end", "tid")
+
+    def __init__(self, tracer: "Tracer", name: str, tags: dict):
+        self.tracer = tracer
+        self.name = name
+        self.tags = tags
+        self.start = 0.0
+        self.end = 0.0
+        self.tid = 0
+
+    def tag(self, **tags) -> None:
+        """Add tags known only after the call started, e.g. an exit code"""
+        self.tags.update(tags)
+
+    def __enter__(self) -> "Span":
+        self.tid = threading.get_native_id()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.end = time.perf_counter()
+        if exc_type is not None:
+            self.tags["error"] = exc_type.__name__
+        self.tracer.record(self)
+        return False
+
+
+class _NoopSpan:
+    """What span() hands out while tracing is off: no clock reads, no allocation"""
+
+    __slots__ = ()
+
+    def tag(self, **tags) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """Collects spans around subprocess and network calls
+
+    Disabled by default; enable() starts recording, after which the spans
+    can be summarized per name or exported as Chrome trace-event JSON
+    (chrome://tracing, https://ui.perfetto.dev).
+    """
+
+    MAX_SPANS = 1_000_000
+
+    def __init__(self, max_spans: int = MAX_SPANS):
+        self.enabled = False
+        self.__max_spans = max_spans
+        self.__spans: list[Span] = []
+        self.__origin = time.perf_counter()
+        self.dropped = 0
+
+    def enable(self) -> None:
+        self.__origin = time.perf_counter()
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def clear(self) -> None:
+        self.__spans = []
+        self.dropped = 0
+
+    def span(self, name: str, **tags):
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, name, tags)
+
+    def record(self, span: Span) -> None:
+        # list.append is atomic, spans finish on many fan-out threads at once
+        if len(self.__spans) < self.__max_spans:
+            self.__spans.append(span)
+        else:
+            self.dropped += 1
+
+    @property
+    def spans(self) -> list[Span]:
+        return list(self.__spans)
+
+    def summary(self) -> list[tuple[str, int, float, float, float]]:
+        """Per span name: (name, count, total, mean, max) in seconds, slowest total first"""
+        durations: dict[str, list[float]] = {}
+        for span in self.__spans:
+            durations.setdefault(span.name, []).append(span.end - span.start)
+        rows = [
+            (name, len(values), sum(values), sum(values) / len(values), max(values))
+            for name, values in durations.items()
+        ]
+        return sorted(rows, key=lambda row: row[2], reverse=True)
+
+    def chrome_trace(self) -> dict:
+        pid = os.getpid()
+        return {
+            "traceEvents": [
+                {
+                    "name": span.name,
+                    "cat": span.name.split(".", 1)[0],
+                    "ph": "X",
+                    "ts": (span.start - self.__origin) * 1e6,
+                    "dur": (span.end - span.start) * 1e6,
+                    "pid": pid,
+                    "tid": span.tid,
+                    "args": {key: str(value) for key, value in span.tags.items()},
+                }
+                for span in self.__spans
+            ],
+            "displayTimeUnit": "ms",
+        }
+
+    def write_chrome_trace(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+
+# The process-wide tracer used by ADB, CryptHelper and BurpHelper
+TRACER = Tracer()
+
+
+def span(name: str, **tags):
+    """Time a block as a span of the global tracer, a shared no-op while it is disabled
+
+    with span("adb.shell", device=serial, command=command):
+        ...
+    """
+    if not TRACER.enabled:
+        return NOOP_SPAN
+    return Span(TRACER, name, tags)
+
+
+class TraceView:
+
+    @staticmethod
+    def print_summary(tracer: Tracer = TRACER) -> None:
+        rows = tracer.summary()
+        print(f"{Style.BOLD}{'span':<28} {'count':>7} {'total ms':>10} {'mean ms':>9} {'max ms':>9}{Style.RESET}")
+        for name, count, total, mean, longest in rows:
+            print(f"{name:<28} {count:>7} {total * 1000:>10.1f} {mean * 1000:>9.2f} {longest * 1000:>9.2f}")
+        if tracer.dropped:
+            print(f"{Style.YELLOW}[INFO] {tracer.dropped} span(s) over the limit were not recorded{Style.RESET}")
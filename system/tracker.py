@@ -0,0 +1,157 @@
+import time
+import asyncio
+import threading
+from typing import Callable
+from .adb_client import ADBClient, ADBClientError
+
+
+class DeviceRecord:
+    """What the tracker knows about one device"""
+
+    __slots__ = ("serial", "state", "props", "updated_at")
+
+    def __init__(self, serial: str, state: str):
+        self.serial = serial
+        self.state = state
+        # Filled lazily by ADB.get_device_props, dropped on every state change
+        self.props: dict | None = None
+        self.updated_at = time.monotonic()
+
+
+class DeviceEvent:
+    """A device appeared, disappeared (new_state is None) or changed state"""
+
+    __slots__ = ("serial", "old_state", "new_state")
+
+    def __init__(self, serial: str, old_state: str | None, new_state: str | None):
+        self.serial = serial
+        self.old_state = old_state
+        self.new_state = new_state
+
+    def __repr__(self):
+        return f"DeviceEvent({self.serial!r}, {self.old_state!r} -> {self.new_state!r})"
+
+
+class DeviceTracker:
+    """Keep an in-memory device registry up to date from host:track-devices
+
+    The adb server pushes the full device list on every change, so the
+    registry is always current without polling `adb devices`.
+    """
+
+    # Seconds to wait before reconnecting after the server went away
+    RECONNECT_DELAY = 1.0
+
+    def __init__(self, client: ADBClient):
+        self.__client = client
+        self.__devices: dict[str, DeviceRecord] = {}
+        self.__lock = threading.Lock()
+        self.__callbacks: list[Callable[[DeviceEvent], None]] = []
+        self.__ready = threading.Event()
+        self.__stopped = threading.Event()
+        self.__thread = None
+
+    def start(self) -> "DeviceTracker":
+        if self.__thread is None:
+            self.__thread = threading.Thread(
+                target=self.__run, name="adb-track-devices", daemon=True
+            )
+            self.__thread.start()
+        return self
+
+    def stop(self) -> None:
+        # The tracking socket blocks in recv, the daemon thread dies with us
+        self.__stopped.set()
+        self.__ready.clear()
+
+    def is_ready(self) -> bool:
+        """Whether the registry reflects a live connection to the adb server"""
+        return self.__ready.is_set()
+
+    def wait_ready(self, timeout: float | None = None) -> bool:
+        return self.__ready.wait(timeout)
+
+    def devices(self) -> list[DeviceRecord]:
+        with self.__lock:
+            return list(self.__devices.values())
+
+    def get(self, serial: str) -> DeviceRecord | None:
+        with self.__lock:
+            return self.__devices.get(serial)
+
+    def set_props(self, serial: str, props: dict) -> None:
+        with self.__lock:
+            record = self.__devices.get(serial)
+            if record is not None:
+                record.props = props
+
+    def on_change(self, callback: Callable[[DeviceEvent], None]) -> None:
+        """Register a callback run on the tracker thread for every change
+        :param callback: Callable -- callback(DeviceEvent)
+        :return: None
+        """
+        self.__callbacks.append(callback)
+
+    def remove_callback(self, callback: Callable[[DeviceEvent], None]) -> None:
+        try:
+            self.__callbacks.remove(callback)
+        except ValueError:
+            pass
+
+    async def events(self):
+        """Async iterator over device changes
+
+        async for event in tracker.events():
+            print(event.serial, event.new_state)
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+
+        def callback(event: DeviceEvent):
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+
+        self.on_change(callback)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self.remove_callback(callback)
+
+    def __aiter__(self):
+        return self.events()
+
+    def __update(self, listing: list[tuple[str, str]]) -> None:
+        events = []
+        with self.__lock:
+            seen = set()
+            for serial, state in listing:
+                seen.add(serial)
+                record = self.__devices.get(serial)
+                if record is None:
+                    self.__devices[serial] = DeviceRecord(serial, state)
+                    events.append(DeviceEvent(serial, None, state))
+                elif record.state != state:
+                    events.append(DeviceEvent(serial, record.state, state))
+                    record.state = state
+                    record.props = None
+                    record.updated_at = time.monotonic()
+            for serial in [s for s in self.__devices if s not in seen]:
+                events.append(DeviceEvent(serial, self.__devices.pop(serial).state, None))
+        for event in events:
+            for callback in list(self.__callbacks):
+                callback(event)
+
+    def __run(self) -> None:
+        while not self.__stopped.is_set():
+            try:
+                for listing in self.__client.track_devices():
+                    if self.__stopped.is_set():
+                        return
+                    self.__update(listing)
+                    self.__ready.set()
+            except ADBClientError:
+                pass
+            # Lost the server: nothing we know is reliable until we reconnect
+            self.__ready.clear()
+            self.__update([])
+            self.__stopped.wait(self.RECONNECT_DELAY)
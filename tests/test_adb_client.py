@@ -0,0 +1,187 @@
+import io
+import argparse
+import sys
+import time
+import functools
+
+import pytest
+
+from benchmarks.fake_adb import FakeADBServer, FakeDevice
+from system import adb as adb_module
+from system.adb import ADB
+from system.adb_client import ADBClient, ADBClientError, ADBConnectError, ADBConnection
+from system.shellpool import ShellPool, ShellSession
+
+
+def drop_connection(device, match):
+    # The command started on the device, then its connection went away
+    raise ConnectionAbortedError
+
+
+def silent_then_drop(device, match):
+    def chunks():
+        raise ConnectionAbortedError
+        yield b""
+
+    return 0, chunks(), b""
+
+
+@pytest.fixture
+def device():
+    device = FakeDevice(props={"ro.product.model": "Pixel"}, files={"/system/build.prop": (0o100644, 0, b"x")})
+    device.on_shell(r"mixed", lambda device, match: (3, b"to stdout\n", b"to stderr\n"))
+    device.on_shell(r"drop", drop_connection)
+    device.on_shell(r"silent-drop", silent_then_drop)
+    device.on_shell(r"hang", lambda device, match: time.sleep(1) or (0, b"late\n", b""))
+    return device
+
+
+@pytest.fixture
+def server(device):
+    server = FakeADBServer({"emulator-5554": device, "emulator-5556": FakeDevice(state="offline")}).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def client(server):
+    client = ADBClient(port=server.port)
+    yield client
+    client.close()
+
+
+@pytest.fixture
+def adb(server, tmp_path, monkeypatch):
+    """An ADB talking to the fake server, its adb binary only logs how it was called"""
+    if sys.platform == "win32":
+        pytest.skip("needs an executable shell script")
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    binary = bin_dir / "adb"
+    binary.write_text('#!/bin/sh\necho "$@" >> "$0.log"\necho from-binary\n')
+    binary.chmod(0o755)
+    monkeypatch.setattr(adb_module, "ADBClient", functools.partial(ADBClient, port=server.port))
+    return ADB(str(tmp_path))
+
+
+def binary_calls(tmp_path) -> list[str]:
+    log = tmp_path / "bin" / "adb.log"
+    return log.read_text().splitlines() if log.exists() else []
+
+
+def test_parse_devices():
+    output = "emulator-5554\tdevice\nR58M\tunauthorized\n\nnot a device line\n"
+    assert ADBClient.parse_devices(output) == [("emulator-5554", "device"), ("R58M", "unauthorized")]
+
+
+def test_devices(client):
+    assert client.devices() == [("emulator-5554", "device"), ("emulator-5556", "offline")]
+
+
+def test_shell_separates_stdout_stderr_and_exit_code(client):
+    assert client.shell("emulator-5554", "mixed") == (3, b"to stdout\n", b"to stderr\n")
+    assert client.shell("emulator-5554", "nosuch")[0] == 127
+
+
+def test_shell_on_unknown_device_is_a_connect_error(client):
+    with pytest.raises(ADBConnectError):
+        client.shell("missing", "echo hi")
+
+
+def test_shell_dropped_after_start_is_not_a_connect_error(client):
+    with pytest.raises(ADBClientError) as error:
+        client.shell("emulator-5554", "drop")
+    assert not isinstance(error.value, ADBConnectError)
+
+
+def test_sync_round_trip(client, device):
+    content = bytes(range(256)) * 1000
+    assert client.push_stream("emulator-5554", io.BytesIO(content), "/data/local/tmp/blob", 0o600, 1700000000) == len(
+        content
+    )
+    mode, size, mtime = client.stat("emulator-5554", "/data/local/tmp/blob")
+    assert (mode & 0o777, size, mtime) == (0o600, len(content), 1700000000)
+    received = io.BytesIO()
+    with client.sync("emulator-5554") as session:
+        assert session.recv("/data/local/tmp/blob", received) == len(content)
+    assert received.getvalue() == content
+    assert client.stat("emulator-5554", "/data/local/tmp/missing") == (0, 0, 0)
+
+
+def test_sync_reuses_pooled_connection(client, server):
+    client.stat("emulator-5554", "/")
+    count = len(server.requests)
+    client.stat("emulator-5554", "/")
+    assert server.requests[count:] == []
+
+
+def test_sync_reconnects_when_server_closed_pooled_connection(client, server):
+    client.stat("emulator-5554", "/")
+    server.drop_sync_connections()
+    time.sleep(0.1)
+    count = len(server.requests)
+    assert client.stat("emulator-5554", "/system/build.prop")[1] == 1
+    assert server.requests[count:] == ["host:transport:emulator-5554", "sync:"]
+
+
+def test_sync_retries_once_when_stale_connection_looks_alive(client, server, device, monkeypatch):
+    client.stat("emulator-5554", "/")
+    server.drop_sync_connections()
+    time.sleep(0.1)
+    # Closed between the liveness check and the first request
+    monkeypatch.setattr(ADBConnection, "alive", lambda self: True)
+    assert client.push_stream("emulator-5554", io.BytesIO(b"payload"), "/data/local/tmp/file") == 7
+    assert device.files["/data/local/tmp/file"][2] == b"payload"
+
+
+def test_adb_falls_back_to_binary_when_command_never_started(adb, tmp_path):
+    # The server doesn't know the device: nothing ran, the binary may try
+    result = adb.shell("missing", "echo hi")
+    assert result.stdout.strip() == "from-binary"
+    assert binary_calls(tmp_path) == ["-s missing shell echo hi"]
+
+
+def test_adb_shell_uses_client(adb, tmp_path):
+    result = adb.shell("emulator-5554", "mixed")
+    assert (result.returncode, result.stdout, result.stderr) == (3, "to stdout\n", "to stderr\n")
+    assert binary_calls(tmp_path) == []
+
+
+def test_adb_never_reruns_started_command(adb, tmp_path):
+    result = adb.shell("emulator-5554", "drop")
+    assert result.returncode == 255
+    assert binary_calls(tmp_path) == []
+
+
+def test_stream_falls_back_to_binary_when_command_never_started(adb, tmp_path):
+    assert list(adb.stream_adb_command("missing", "echo hi")) == ["from-binary"]
+    assert binary_calls(tmp_path) == ["-s missing shell echo hi"]
+
+
+def test_stream_never_reruns_silent_command_that_dropped(adb, tmp_path):
+    with pytest.raises(ADBClientError):
+        list(adb.stream_adb_command("emulator-5554", "silent-drop"))
+    assert binary_calls(tmp_path) == []
+
+
+def test_session_deadline_closes_session(client):
+    pool = ShellPool(client)
+    session = pool.acquire("emulator-5554")
+    assert session.run("mixed", 5) == (3, b"to stdout\n", b"to stderr\n")
+    with pytest.raises(ADBClientError, match="timed out|still running"):
+        session.run("hang", 0.2)
+    assert not session.alive
+    pool.release(session)
+    # The late output never reaches a later command
+    assert pool.acquire("emulator-5554") is not session
+    pool.close()
+
+
+def test_adb_run_bypasses_session_pool(adb, server):
+    args = argparse.Namespace(
+        all=False, devices=None, match=None, stream=False, device="emulator-5554", command="mixed"
+    )
+    result = adb.run_adb_command(args)
+    assert (result.returncode, result.output) == (3, "to stderr")
+    assert "shell,v2,raw:mixed" in server.requests
+    assert not any(request.startswith("session") for request in server.requests)
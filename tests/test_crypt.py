@@ -0,0 +1,110 @@
+import os
+import sys
+
+import pytest
+
+from system.crypt import CryptHelper, CertificateError
+
+CERTS = os.path.join(os.path.dirname(__file__), "fixtures", "certs")
+
+# openssl x509 -inform DER -noout -subject_hash_old -in <name>.der
+SUBJECT_HASHES = {
+    # Burp's CA subject (with a two letter country, as openssl req insists)
+    "portswigger_rsa": "7c148be5",
+    # UTF8String attributes: Vietnamese and a check mark
+    "utf8_rsa": "c4907253",
+    # 64 character attributes, a multi-valued RDN, a subject over 127 bytes (long form length)
+    "long_multi_rdn": "f79b5c20",
+    # An EC P-256 key
+    "ec_p256": "a9a4c868",
+}
+
+
+def read_fixture(name: str, extension: str) -> bytes:
+    with open(os.path.join(CERTS, f"{name}.{extension}"), "rb") as f:
+        return f.read()
+
+
+@pytest.fixture
+def no_openssl(tmp_path, monkeypatch):
+    """A CryptHelper that finds no openssl, neither in base_dir/bin nor on PATH"""
+    monkeypatch.setenv("PATH", str(tmp_path / "empty"))
+    return CryptHelper(str(tmp_path))
+
+
+@pytest.fixture
+def failing_openssl(tmp_path, monkeypatch):
+    """A CryptHelper whose openssl (base_dir/bin/openssl) rejects everything"""
+    if sys.platform == "win32":
+        pytest.skip("needs an executable shell script")
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    openssl = bin_dir / "openssl"
+    openssl.write_text("#!/bin/sh\necho 'unable to load certificate' >&2\nexit 1\n")
+    openssl.chmod(0o755)
+    monkeypatch.setenv("PATH", str(tmp_path / "empty"))
+    return CryptHelper(str(tmp_path))
+
+
+@pytest.mark.parametrize("name", sorted(SUBJECT_HASHES))
+def test_der_to_pem_matches_openssl(name):
+    # <name>.pem is the output of openssl x509 -inform DER -outform PEM
+    assert CryptHelper.der_to_pem(read_fixture(name, "der")) == read_fixture(name, "pem")
+
+
+@pytest.mark.parametrize("name", sorted(SUBJECT_HASHES))
+def test_pem_to_der_round_trip(name):
+    assert CryptHelper.pem_to_der(read_fixture(name, "pem")) == read_fixture(name, "der")
+
+
+@pytest.mark.parametrize("name", sorted(SUBJECT_HASHES))
+def test_subject_hash_old_matches_openssl(name):
+    assert CryptHelper.subject_hash_old(read_fixture(name, "der")) == SUBJECT_HASHES[name]
+
+
+@pytest.mark.parametrize("name", sorted(SUBJECT_HASHES))
+def test_load_certificate_without_openssl(name, no_openssl):
+    pem, subject_hash = no_openssl.load_certificate(read_fixture(name, "der"))
+    assert pem == read_fixture(name, "pem")
+    assert subject_hash == SUBJECT_HASHES[name]
+
+
+@pytest.mark.parametrize(
+    "der",
+    [
+        read_fixture("long_multi_rdn", "der")[:200],
+        read_fixture("ec_p256", "der")[:3],
+        b"not a certificate",
+        b"",
+    ],
+    ids=["truncated", "truncated-header", "not-der", "empty"],
+)
+def test_subject_der_rejects_invalid_der(der):
+    with pytest.raises((ValueError, IndexError)):
+        CryptHelper.subject_der(der)
+
+
+def test_invalid_der_without_openssl_raises_certificate_error(no_openssl):
+    with pytest.raises(CertificateError, match="openssl not found"):
+        no_openssl.load_certificate(read_fixture("utf8_rsa", "der")[:100])
+
+
+def test_invalid_der_rejected_by_openssl_raises_certificate_error(failing_openssl):
+    with pytest.raises(CertificateError, match="unable to load certificate"):
+        failing_openssl.load_certificate(b"not a certificate")
+
+
+def test_convert_der_to_pem_file(tmp_path, no_openssl):
+    der_file = tmp_path / "cert.der"
+    pem_file = tmp_path / "cert.pem"
+    der_file.write_bytes(read_fixture("long_multi_rdn", "der"))
+    no_openssl.convert_der_to_pem(str(der_file), str(pem_file))
+    assert pem_file.read_bytes() == read_fixture("long_multi_rdn", "pem")
+    assert no_openssl.extract_old_subject_hash(str(pem_file)) == SUBJECT_HASHES["long_multi_rdn"]
+
+
+def test_convert_invalid_der_file_raises_certificate_error(tmp_path, failing_openssl):
+    der_file = tmp_path / "cert.der"
+    der_file.write_bytes(b"\x30\x82\x05\x00truncated")
+    with pytest.raises(CertificateError):
+        failing_openssl.convert_der_to_pem(str(der_file), str(tmp_path / "cert.pem"))